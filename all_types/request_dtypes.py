@@ -170,4 +170,6 @@ class ReqIntelligenceData(BaseModel):
 
 class ReqClustersForSalesManData(BooleanQuery, UserId,ReqCityCountry):
     num_sales_man: int
-    distance_limit: float = 2.5
\ No newline at end of file
+    distance_limit: float = 2.5
+    # Seconds spent improving each territory route
+    route_time_budget: float = Field(2.0, gt=0, le=10.0)
\ No newline at end of file
@@ -1,6 +1,6 @@
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-from typing import Any
+from typing import Any, Dict, Optional, Set, Tuple
 from fastapi import Depends, HTTPException, status, Request
 from backend_common.logging_wrapper import apply_decorator_to_module
 from fastapi.security import OAuth2PasswordBearer
@@ -16,6 +16,13 @@ from backend_common.dtypes.auth_dtypes import (
     UserProfileSettings
 )
 from backend_common.common_config import CONF
+from backend_common.document_cache import (
+    ALL_DOCUMENTS,
+    BoundedDocumentCache,
+    InvalidationChannel,
+    PostgresInvalidationChannel,
+    bounded_cache_from_env,
+)
 from .background import get_background_tasks
 import random
 import requests
@@ -28,8 +35,11 @@ import stripe
 import logging
 from google.oauth2 import service_account
 import asyncio
+import threading
 from fastapi import BackgroundTasks
 import time
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1.field_path import FieldPath
 
 logging.basicConfig(
     level=logging.INFO,
@@ -43,12 +53,27 @@ stripe.api_key = CONF.stripe_api_key
 
 
 class FirestoreDB:
-    def __init__(self, collections_to_listen: list[str]):
+    def __init__(
+        self,
+        collections_to_listen: list[str],
+        bounded_collections: list[str] = (),
+        invalidation_channel: Optional[InvalidationChannel] = None,
+    ):
         self._async_client = None
         self._sync_client = None
         self._cache = {collection: {} for collection in collections_to_listen}
+        # Too large to hold whole: documents are loaded on a miss into a bounded cache, and
+        # dropped on the other workers through the invalidation channel after a write
+        self._bounded_collections = list(bounded_collections)
+        for collection in self._bounded_collections:
+            self._cache[collection] = bounded_cache_from_env()
+        self._invalidation_channel = invalidation_channel
         self._collection_listeners = {}
-        self._collections_to_listen = collections_to_listen
+        self._collections_to_listen = [
+            collection
+            for collection in collections_to_listen
+            if collection not in self._bounded_collections
+        ]
 
     def get_async_client(self):
         if self._async_client is None:
@@ -77,6 +102,8 @@ class FirestoreDB:
                     doc_id = change.document.id
                     if change.type.name in ["ADDED", "MODIFIED"]:
                         data = change.document.to_dict()
+                        # Patches not written yet stay visible
+                        FieldPatchCoalescer.overlay(collection_name, doc_id, data)
                         self._cache[collection_name][doc_id] = data
                         logger.info(
                             f"Cache updated for {collection_name} document {doc_id}"
@@ -97,9 +124,10 @@ class FirestoreDB:
         if collection_name not in self._cache:
             raise ValueError(f"Collection {collection_name} is not being monitored")
 
-        if doc_id in self._cache[collection_name]:
+        cached = self._cache[collection_name].get(doc_id)
+        if cached is not None:
             logger.info(f"Retrieved {collection_name} document {doc_id} from cache")
-            return self._cache[collection_name][doc_id]
+            return cached
 
         doc_ref = self.get_async_client().collection(collection_name).document(doc_id)
         doc = await doc_ref.get()
@@ -111,6 +139,7 @@ class FirestoreDB:
             )
 
         data = doc.to_dict()
+        FieldPatchCoalescer.overlay(collection_name, doc_id, data)
         self._cache[collection_name][doc_id] = data
         return data
 
@@ -137,6 +166,47 @@ class FirestoreDB:
         # Run synchronous listeners setup in a thread
         await asyncio.get_event_loop().run_in_executor(None, setup_listeners)
 
+        if self._bounded_collections and self._invalidation_channel is not None:
+            try:
+                await self._invalidation_channel.start(self._on_invalidation)
+            except Exception as e:
+                # Other workers' writes are then only seen once the entries expire
+                logger.warning(
+                    f"Firestore invalidation channel unavailable, cached documents "
+                    f"may be stale for their TTL: {e}"
+                )
+
+    def _on_invalidation(self, collection_name: str, doc_id: str):
+        if collection_name == ALL_DOCUMENTS:
+            # Sent when the channel drops or comes back: nothing is cached while other
+            # workers' writes may be missed
+            suspended = not self._invalidation_channel.connected
+            for collection in self._bounded_collections:
+                self._cache[collection].clear()
+                self._cache[collection].suspended = suspended
+            return
+        cache = self._cache.get(collection_name)
+        if isinstance(cache, BoundedDocumentCache):
+            cache.discard(doc_id)
+
+    async def publish_invalidation(self, collection_name: str, doc_id: str):
+        """
+        Tells the other workers a document of a bounded collection was written.
+        """
+        if collection_name in self._bounded_collections and self._invalidation_channel:
+            await self._invalidation_channel.publish(collection_name, doc_id)
+
+    async def close_invalidation_channel(self):
+        if self._invalidation_channel is not None:
+            await self._invalidation_channel.stop()
+
+    def get_cache_metrics(self) -> dict:
+        return {
+            collection: self._cache[collection].get_metrics()
+            for collection in self._bounded_collections
+            if collection in self._cache
+        }
+
     def cleanup(self):
         """Synchronous cleanup of listeners with proper thread shutdown"""
         # First unsubscribe all listeners
@@ -157,13 +227,200 @@ class FirestoreDB:
         if self._sync_client:
             self._sync_client.close()
 
+
+class FieldPatchCoalescer:
+    """
+    Field path patches of Firestore documents, coalesced per document.
+
+    A patch maps field paths (tuples of keys, or dotted strings) to values,
+    firestore.DELETE_FIELD removing the field. Patches apply to the cached document at
+    once and are queued: the first one of a document schedules a flush
+    PROFILE_WRITE_WINDOW_MS later, which sends everything queued meanwhile as one
+    update() of the changed paths. A later patch of a queued path replaces its value and
+    a patch of a parent path replaces the queued children, so the last write wins.
+    Flushes of a document run one at a time, in patch order. A failed flush puts its
+    patches back under the ones queued meanwhile and is retried with exponential backoff,
+    up to PROFILE_WRITE_MAX_ATTEMPTS. flush_all, on shutdown, sends whatever is still
+    queued.
+    """
+
+    window_seconds: float = float(os.getenv("PROFILE_WRITE_WINDOW_MS", "250")) / 1000
+    max_attempts: int = int(os.getenv("PROFILE_WRITE_MAX_ATTEMPTS", "5"))
+    max_retry_seconds: float = 30.0
+    pending: Dict[Tuple[str, str], Dict[Tuple[str, ...], Any]] = {}
+    inflight: Dict[Tuple[str, str], Dict[Tuple[str, ...], Any]] = {}
+    timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+    locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+    attempts: Dict[Tuple[str, str], int] = {}
+    tasks: Set[asyncio.Task] = set()
+    # The snapshot listeners read the queues from their own thread
+    queue_lock = threading.Lock()
+    patches: int = 0
+    flushes: int = 0
+    failures: int = 0
+    dropped: int = 0
+
+    @staticmethod
+    def path_parts(path) -> Tuple[str, ...]:
+        return tuple(path.split(".")) if isinstance(path, str) else tuple(path)
+
+    @staticmethod
+    def set_path(document: dict, parts: Tuple[str, ...], value: Any):
+        for part in parts[:-1]:
+            child = document.get(part)
+            if not isinstance(child, dict):
+                if value is firestore.DELETE_FIELD:
+                    return
+                child = document[part] = {}
+            document = child
+        if value is firestore.DELETE_FIELD:
+            document.pop(parts[-1], None)
+        else:
+            document[parts[-1]] = value
+
+    @classmethod
+    def queue(cls, queued: Dict[Tuple[str, ...], Any], parts: Tuple[str, ...], value: Any):
+        # Firestore rejects an update with both a path and one of its children
+        for queued_parts in [p for p in queued if p[: len(parts)] == parts]:
+            del queued[queued_parts]
+        for queued_parts, queued_value in queued.items():
+            if parts[: len(queued_parts)] == queued_parts:
+                if not isinstance(queued_value, dict):
+                    queued_value = queued[queued_parts] = {}
+                cls.set_path(queued_value, parts[len(queued_parts) :], value)
+                return
+        queued[parts] = value
+
+    @classmethod
+    def record(cls, collection_name: str, doc_id: str, patch: Dict) -> Optional[dict]:
+        """
+        Applies a patch to the cached document and queues it. Returns the cached document,
+        None when it isn't cached.
+        """
+        key = (collection_name, doc_id)
+        patch = {cls.path_parts(path): value for path, value in patch.items()}
+        with cls.queue_lock:
+            queued = cls.pending.setdefault(key, {})
+            for parts, value in patch.items():
+                cls.queue(queued, parts, value)
+            cls.patches += len(patch)
+
+        document = firebase_db._cache[collection_name].get(doc_id)
+        if document is not None:
+            for parts, value in patch.items():
+                cls.set_path(document, parts, value)
+            # Stored again for bounded caches to measure its new size
+            firebase_db._cache[collection_name][doc_id] = document
+        if key not in cls.timers:
+            cls.timers[key] = asyncio.get_running_loop().call_later(
+                cls.window_seconds, cls._start_flush, key
+            )
+        return document
+
+    @classmethod
+    def overlay(cls, collection_name: str, doc_id: str, document: dict):
+        """
+        Applies the patches of a document not written yet to a copy read from Firestore.
+        """
+        key = (collection_name, doc_id)
+        with cls.queue_lock:
+            patches = [*cls.inflight.get(key, {}).items(), *cls.pending.get(key, {}).items()]
+        for parts, value in patches:
+            cls.set_path(document, parts, value)
+
+    @classmethod
+    def _start_flush(cls, key: Tuple[str, str]):
+        task = asyncio.ensure_future(cls.flush(key))
+        cls.tasks.add(task)
+        task.add_done_callback(cls.tasks.discard)
+
+    @classmethod
+    async def flush(cls, key: Tuple[str, str]):
+        """
+        Sends the queued patches of a document as one update(). A document not created
+        yet (its creation may still be a pending background task) is set instead, with
+        the patched paths as merge fields.
+        """
+        timer = cls.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        async with cls.locks.setdefault(key, asyncio.Lock()):
+            with cls.queue_lock:
+                queued = cls.pending.pop(key, None)
+                if queued:
+                    cls.inflight[key] = queued
+            if not queued:
+                return
+
+            collection_name, doc_id = key
+            doc_ref = firebase_db.get_async_client().collection(collection_name).document(doc_id)
+            try:
+                try:
+                    await doc_ref.update(
+                        {FieldPath(*parts).to_api_repr(): value for parts, value in queued.items()}
+                    )
+                except NotFound:
+                    document = {}
+                    merge = []
+                    for parts, value in queued.items():
+                        if value is not firestore.DELETE_FIELD:
+                            cls.set_path(document, parts, value)
+                            merge.append(FieldPath(*parts))
+                    if merge:
+                        await doc_ref.set(document, merge=merge)
+                cls.flushes += 1
+                cls.attempts.pop(key, None)
+            except Exception as e:
+                cls.failures += 1
+                logger.exception(f"Could not write {len(queued)} fields of {collection_name}/{doc_id}: {e}")
+                cls._requeue(key, queued)
+                return
+            finally:
+                with cls.queue_lock:
+                    cls.inflight.pop(key, None)
+            await firebase_db.publish_invalidation(collection_name, doc_id)
+
+    @classmethod
+    def _requeue(cls, key: Tuple[str, str], queued: Dict[Tuple[str, ...], Any]):
+        """
+        Puts the patches of a failed flush back under the ones queued since, which win,
+        and schedules the retry. Past max_attempts they are dropped.
+        """
+        attempts = cls.attempts[key] = cls.attempts.get(key, 0) + 1
+        if attempts >= cls.max_attempts:
+            cls.attempts.pop(key, None)
+            cls.dropped += len(queued)
+            logger.error(f"Dropped {len(queued)} fields of {key[0]}/{key[1]} after {attempts} attempts")
+            return
+        with cls.queue_lock:
+            for parts, value in cls.pending.pop(key, {}).items():
+                cls.queue(queued, parts, value)
+            cls.pending[key] = queued
+        timer = cls.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        delay = min(cls.window_seconds * 2**attempts, cls.max_retry_seconds)
+        cls.timers[key] = asyncio.get_running_loop().call_later(delay, cls._start_flush, key)
+
+    @classmethod
+    async def flush_all(cls):
+        if cls.tasks:
+            await asyncio.gather(*cls.tasks, return_exceptions=True)
+        for key in list(cls.pending):
+            await cls.flush(key)
+
+
 firebase_db = None
 # Initialize Firebase admin with firebase credentials
 if os.path.exists(CONF.firebase_sp_path):
     firebase_creds = credentials.Certificate(CONF.firebase_sp_path)
     default_app = firebase_admin.initialize_app(firebase_creds)
     # Create Firestore client with google-auth credentials
-    firebase_db = FirestoreDB(CONF.firestore_collections)
+    firebase_db = FirestoreDB(
+        CONF.firestore_collections,
+        CONF.firestore_bounded_collections,
+        PostgresInvalidationChannel(),
+    )
 
 
 class JWTBearer(HTTPBearer):
@@ -317,6 +574,18 @@ def my_verify_id_token(token: str = Depends(oauth2_scheme)):
         ) from e
 
 
+def verify_admin_token(decoded_token: dict = Depends(my_verify_id_token)):
+    """
+    Only lets through tokens of users holding the `admin` custom claim.
+    """
+    if decoded_token.get("admin") is not True:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return decoded_token
+
+
 async def reset_password(req: ReqResetPassword) -> dict[str, Any]:
     payload = {"requestType": "PASSWORD_RESET", "email": req.email}
     response = await make_firebase_api_request(CONF.firebase_sendOobCode, payload)
@@ -469,85 +738,61 @@ async def create_user_profile(req: ReqCreateUserProfile):
             firebase_db.get_async_client().collection(collection_name).document(req.user_id)
         )
         await doc_ref.set(user_data)
+        await firebase_db.publish_invalidation(collection_name, req.user_id)
 
     get_background_tasks().add_task(_background_create)
     return user_data
 
 
-async def update_user_profile(user_id: str, user_data: dict):
-    collection_name = "all_user_profiles"
+async def patch_user_profile(user_id: str, patch: dict) -> Optional[dict]:
+    """
+    Applies field path patches to the cached profile of a user and queues them for a
+    coalesced update() with only these paths. Paths are tuples of keys (dotted strings
+    when no key contains a dot), firestore.DELETE_FIELD removes a field.
+    """
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid user_id: user_id cannot be empty"
+        )
+    return FieldPatchCoalescer.record("all_user_profiles", user_id, patch)
+
 
+async def update_user_profile(user_id: str, user_data: dict):
     if not user_id or user_data.get("user_id", "").strip() == "":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid user_id: user_id cannot be empty"
         )
-    
-    existing_data = firebase_db._cache[collection_name].get(user_id, {})
+
     prdcer_data = user_data.get("prdcer", {})
-    existing_prdcer = existing_data.get("prdcer", {})
-    
-    # Update prdcer_dataset
-    prdcer_dataset = existing_prdcer.get("prdcer_dataset", {}).copy()
+
+    # Only the parts of the profile given are written
+    patch = {("user_id",): user_data["user_id"]}
     for key, value in prdcer_data.get("prdcer_dataset", {}).items():
         if key:  # Simplified null/empty check
-            prdcer_dataset[key] = value
-
-    # Profile-specific update data
-    update_data = {
-        "user_id": user_data["user_id"],
-        "prdcer": {
-            "prdcer_dataset": prdcer_dataset,
-            "prdcer_lyrs": prdcer_data.get("prdcer_lyrs", existing_prdcer.get("prdcer_lyrs", {})),
-            "prdcer_ctlgs": prdcer_data.get("prdcer_ctlgs", existing_prdcer.get("prdcer_ctlgs", {})),
-            "draft_ctlgs": prdcer_data.get("draft_ctlgs", existing_prdcer.get("draft_ctlgs", {})),
-        }
-    }
-    merged_data = {**existing_data, **update_data}
-    firebase_db._cache[collection_name][user_id] = merged_data
+            patch[("prdcer", "prdcer_dataset", key)] = value
+    for section in ("prdcer_lyrs", "prdcer_ctlgs", "draft_ctlgs"):
+        if section in prdcer_data:
+            patch[("prdcer", section)] = prdcer_data[section]
 
-
-    async def _background_update():
-        doc_ref = firebase_db.get_async_client().collection(collection_name).document(user_id)
-        # Use Firestore's update instead of set to only update specified fields
-        await doc_ref.update(merged_data)
-
-    get_background_tasks().add_task(_background_update)
-    return merged_data
+    merged_data = await patch_user_profile(user_id, patch)
+    return merged_data if merged_data is not None else user_data
 
 
 async def update_user_profile_settings(settings_data: UserProfileSettings):
-    collection_name = "all_user_profiles"
     user_id = settings_data.user_id
 
-    existing_data = firebase_db._cache[collection_name].get(user_id, {})
-    
-    # Merge existing settings with new settings
-    existing_settings = existing_data.get("settings", {})
-    merged_settings = {
-        **existing_settings,
-        "show_price_on_purchase": settings_data.show_price_on_purchase
-    }
-
-    # Create update data with proper structure
-    update_data = {
-        "user_id": user_id,
-        "account_type": settings_data.account_type,
-        "admin_id": settings_data.admin_id,
-        "settings": merged_settings
-    }
-
-    # Preserve existing data while applying updates
-    merged_data = {**existing_data, **update_data}
-    firebase_db._cache[collection_name][user_id] = merged_data
-
-    async def _background_update():
-        doc_ref = firebase_db.get_async_client().collection(collection_name).document(user_id)
-        # Use Firestore's update instead of set to only update specified fields
-        await doc_ref.update(merged_data)
-
-    get_background_tasks().add_task(_background_update)
-    return merged_data
+    merged_data = await patch_user_profile(
+        user_id,
+        {
+            ("user_id",): user_id,
+            ("account_type",): settings_data.account_type,
+            ("admin_id",): settings_data.admin_id,
+            ("settings", "show_price_on_purchase"): settings_data.show_price_on_purchase,
+        },
+    )
+    return merged_data if merged_data is not None else settings_data.model_dump()
 
 
 async def load_user_profile(user_id: str) -> dict:
@@ -566,5 +811,9 @@ async def load_user_profile(user_id: str) -> dict:
         raise e
 
 
+async def get_firestore_cache_metrics() -> dict:
+    return firebase_db.get_cache_metrics() if firebase_db is not None else {}
+
+
 # Apply the decorator to all functions in this module
 apply_decorator_to_module(logger)(__name__)
\ No newline at end of file
@@ -16,8 +16,15 @@ class CommonApiConfig:
         "all_user_profiles",
         "firebase_stripe_mappings",
         "layer_matchings",
+        "dataset_layer_matchings",
+        "user_layer_matchings",
+        "layer_dataset_index",
         "ccc"
     ])
+    # Loaded on demand into a bounded LRU/TTL cache instead of listened to whole
+    firestore_bounded_collections: list[str] = field(default_factory=lambda: [
+        "all_user_profiles",
+    ])
     stripe_api_key: str = ""
     firebase_base_url: str = "https://identitytoolkit.googleapis.com/v1/accounts:"
     firebase_refresh_token = f"{firebase_base_url[:-9]}token?key="  ## Change
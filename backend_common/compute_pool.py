@@ -0,0 +1,140 @@
+# compute_pool.py
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from backend_common.logger import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(func: Callable, args: tuple, kwargs: dict):
+    """
+    Runs inside the worker process.
+    Returns the result together with the wall clock start time and the duration so the
+    parent can tell how long the task waited in the queue and how long it ran.
+    """
+    started_at = time.time()
+    result = func(*args, **kwargs)
+    return result, started_at, time.time() - started_at
+
+
+class ComputePool:
+    """
+    Process pool shared by the CPU heavy endpoints (NumPy/shapely/geopy work) so they do
+    not block the event loop. Tasks must be module level functions and their arguments
+    should be kept pickle light (coordinate arrays, plain lists) since they are copied to
+    the worker process.
+    """
+
+    executor: Optional[ProcessPoolExecutor] = None
+    max_workers: int = int(os.getenv("COMPUTE_POOL_WORKERS", "0")) or os.cpu_count() or 1
+    in_flight: int = 0
+    completed: int = 0
+    failed: int = 0
+    task_stats: Dict[str, Dict[str, float]] = {}
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        """
+        Retrieves the process pool, creating it on first use.
+        """
+        if cls.executor is None:
+            cls.executor = ProcessPoolExecutor(max_workers=cls.max_workers)
+            logger.info(f"Compute pool started with {cls.max_workers} workers")
+        return cls.executor
+
+    @classmethod
+    async def run(cls, func: Callable, *args, **kwargs) -> Any:
+        """
+        Runs `func(*args, **kwargs)` in a worker process and awaits its result.
+        Queue wait and run duration are recorded per function name.
+        """
+        name = getattr(func, "__qualname__", repr(func))
+        loop = asyncio.get_running_loop()
+        submitted_at = time.time()
+        cls.in_flight += 1
+        try:
+            result, started_at, duration = await loop.run_in_executor(
+                cls.get_executor(), _timed_call, func, args, kwargs
+            )
+        except Exception:
+            cls.failed += 1
+            cls._record(name, None, time.time() - submitted_at)
+            raise
+        finally:
+            cls.in_flight -= 1
+
+        cls.completed += 1
+        cls._record(name, duration, max(started_at - submitted_at, 0.0))
+        return result
+
+    @classmethod
+    def _record(cls, name: str, duration: Optional[float], queue_wait: float):
+        stats = cls.task_stats.setdefault(
+            name,
+            {
+                "count": 0,
+                "failed": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "total_queue_wait_seconds": 0.0,
+            },
+        )
+        stats["count"] += 1
+        stats["total_queue_wait_seconds"] += queue_wait
+        if duration is None:
+            stats["failed"] += 1
+            return
+        stats["total_seconds"] += duration
+        stats["max_seconds"] = max(stats["max_seconds"], duration)
+
+    @classmethod
+    def queue_depth(cls) -> int:
+        """
+        Number of submitted tasks still waiting for a free worker.
+        """
+        return max(cls.in_flight - cls.max_workers, 0)
+
+    @classmethod
+    def get_metrics(cls) -> dict:
+        """
+        Snapshot of the pool state and of the per task duration statistics.
+        """
+        tasks = {}
+        for name, stats in cls.task_stats.items():
+            succeeded = stats["count"] - stats["failed"]
+            tasks[name] = {
+                **stats,
+                "avg_seconds": stats["total_seconds"] / succeeded if succeeded else 0.0,
+                "avg_queue_wait_seconds": stats["total_queue_wait_seconds"]
+                / stats["count"],
+            }
+        return {
+            "workers": cls.max_workers,
+            "started": cls.executor is not None,
+            "in_flight": cls.in_flight,
+            "queue_depth": cls.queue_depth(),
+            "completed": cls.completed,
+            "failed": cls.failed,
+            "tasks": tasks,
+        }
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Stops the worker processes if the pool was started.
+        """
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=True, cancel_futures=True)
+        cls.executor = None
+
+
+async def run_in_compute_pool(func: Callable, *args, **kwargs) -> Any:
+    return await ComputePool.run(func, *args, **kwargs)
+
+
+async def get_compute_pool_metrics() -> dict:
+    return ComputePool.get_metrics()
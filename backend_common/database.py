@@ -1,11 +1,17 @@
 # database.py
+import asyncio
 import datetime
 import uuid
 import os
+import re
+import zlib
+from collections import deque
 import asyncpg
 from asyncpg.pool import Pool
-from typing import Optional, List
-from contextlib import asynccontextmanager
+from typing import Callable, Optional, List, Dict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
 import time
 from backend_common.logging_wrapper import apply_decorator_to_module
 
@@ -14,33 +20,164 @@ from backend_common.logger import logging
 logger = logging.getLogger(__name__)
 
 
+# Statements that write or take locks, a read only query must not contain any of them
+_WRITE_STATEMENT = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|UPSERT|CREATE|ALTER|DROP|TRUNCATE|GRANT|REVOKE|COPY"
+    r"|LOCK|VACUUM|ANALYZE|REFRESH|CALL|NEXTVAL|SETVAL|PG_NOTIFY|PG_(TRY_)?ADVISORY_\w+"
+    r"|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE)\b",
+    re.IGNORECASE,
+)
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_READ_STATEMENTS = ("SELECT", "WITH", "VALUES", "TABLE", "SHOW")
+
+# Lag of a replica that is not streaming (or of the primary itself) is reported as 0
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float AS lag_seconds;
+"""
+
+_PLACEHOLDER = re.compile(r"\$(\d+)")
+
+# time.time() of the last write made in the current task, reads right after it go to the primary
+last_write_at: ContextVar[float] = ContextVar("last_write_at", default=0.0)
+
+# Logs the rendered SQL of every statement of the current task, see Database.full_sql_logging
+log_full_sql: ContextVar[bool] = ContextVar("log_full_sql", default=False)
+
+
+@lru_cache(maxsize=2048)
+def is_read_only_query(query: str) -> bool:
+    """
+    Whether a statement only reads, so it can be served by a replica. Anything unsure
+    (DML, DDL, locking reads, advisory locks, NOTIFY, sequences) counts as a write.
+    """
+    statement = _SQL_COMMENT.sub(" ", query).strip().lstrip("(").upper()
+    return statement.startswith(_READ_STATEMENTS) and not _WRITE_STATEMENT.search(statement)
+
+
+@lru_cache(maxsize=2048)
+def _unnamed_statement(query: str) -> str:
+    return " ".join(_SQL_COMMENT.sub(" ", query).split())[:80]
+
+
+class _LazySql:
+    """
+    Formats the arguments (or the whole rendered statement) of a log record only when a
+    handler actually emits it.
+    """
+
+    __slots__ = ("query", "args", "max_arg_chars")
+
+    def __init__(self, query: str, args: tuple, max_arg_chars: Optional[int] = None):
+        self.query = query
+        self.args = args
+        self.max_arg_chars = max_arg_chars
+
+    def __str__(self) -> str:
+        if self.max_arg_chars is None:
+            return ", ".join(Database.describe_argument(arg) for arg in self.args)
+        return Database.generate_sql_script(
+            self.query, *self.args, max_arg_chars=self.max_arg_chars
+        )
+
+
+def _replica_dsns() -> List[str]:
+    return [dsn.strip() for dsn in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if dsn.strip()]
+
+
 class Database:
     pool: Optional[Pool] = None
     last_refresh_time: float = 0
     refresh_interval: int = 3600  # Refresh every hour
     time.sleep(5)
     dsn: str = os.getenv("DATABASE_URL")
+    pool_min_size: int = int(os.getenv("DATABASE_POOL_MIN_SIZE", "1"))
+    pool_max_size: int = int(os.getenv("DATABASE_POOL_MAX_SIZE", "10"))
+
+    # Read replicas, from the comma separated REPLICA_DATABASE_URLS
+    replica_dsns: List[str] = _replica_dsns()
+    replica_pools: List[Pool] = []
+    replica_pool_min_size: int = int(os.getenv("REPLICA_POOL_MIN_SIZE", "1"))
+    replica_pool_max_size: int = int(os.getenv("REPLICA_POOL_MAX_SIZE", "10"))
+    replica_max_lag_seconds: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+    replica_lag_check_interval: float = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+    replica_lag: Dict[int, float] = {}
+    replica_lag_checked_at: Dict[int, float] = {}
+    replica_cursor: int = 0
+    routed_reads: Dict[str, int] = {"replica": 0, "primary": 0, "fallback": 0}
+
+    # Pool rotation: the old pools are closed in the background once their connections
+    # are released, or terminated after pool_drain_timeout
+    refresh_lock: asyncio.Lock = asyncio.Lock()
+    pool_drain_timeout: float = float(os.getenv("DATABASE_POOL_DRAIN_TIMEOUT", "60"))
+    draining_pools: set = set()
+    refreshes: int = 0
+
+    # Statement logging: name, argument sizes and duration by default, the rendered SQL
+    # (arguments capped at sql_log_arg_max_chars) when enabled or for slow statements
+    sql_log_full: bool = os.getenv("SQL_LOG_FULL", "").lower() in ("1", "true", "yes")
+    slow_query_seconds: float = float(os.getenv("SQL_SLOW_QUERY_MS", "1000")) / 1000
+    sql_log_arg_max_chars: int = int(os.getenv("SQL_LOG_ARG_MAX_CHARS", "200"))
+
+    # Called with (name, query, args, duration) after every successful statement, see
+    # query_diagnostics.SlowQueryExplainer
+    slow_statement_hooks: List[Callable[[str, str, tuple, float], None]] = []
+
+    # Instrumentation
+    statement_names: Dict[str, str] = {}
+    statement_stats: Dict[str, Dict[str, float]] = {}
+    acquire_count: int = 0
+    acquire_wait_total: float = 0.0
+    acquire_wait_max: float = 0.0
+    acquire_waits: deque = deque(maxlen=1000)
 
     @classmethod
     async def create_pool(cls):
         """
-        Creates a new connection pool with specified configuration.
+        Creates the primary connection pool and one pool per configured read replica.
         
-        Sets up an asyncpg connection pool with min_size=1 and max_size=10.
+        Pool sizes come from DATABASE_POOL_MIN_SIZE/MAX_SIZE (defaults 1 and 10) and
+        REPLICA_POOL_MIN_SIZE/MAX_SIZE. A replica that cannot be reached is left out,
+        reads then go to the other replicas or the primary.
         Updates the last refresh time after creation.
         """
-        cls.pool = await asyncpg.create_pool(dsn=cls.dsn, min_size=1, max_size=10)
+        cls.pool = await asyncpg.create_pool(
+            dsn=cls.dsn, min_size=cls.pool_min_size, max_size=cls.pool_max_size
+        )
+        replica_pools = []
+        for dsn in cls.replica_dsns:
+            try:
+                replica_pools.append(
+                    await asyncpg.create_pool(
+                        dsn=dsn,
+                        min_size=cls.replica_pool_min_size,
+                        max_size=cls.replica_pool_max_size,
+                    )
+                )
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"Read replica unavailable, reads use the primary: {e}")
+        cls.replica_pools = replica_pools
+        cls.replica_lag.clear()
+        cls.replica_lag_checked_at.clear()
         cls.last_refresh_time = time.time()
 
     @classmethod
     async def close_pool(cls):
         """
-        Closes the existing connection pool if it exists.
-        Sets the pool reference to None after closing.
+        Closes the existing connection pools if they exist.
+        Sets the pool references to None after closing.
         """
         if cls.pool:
             await cls.pool.close()
         cls.pool = None
+        replica_pools, cls.replica_pools = cls.replica_pools, []
+        for pool in replica_pools:
+            await pool.close()
+        if cls.draining_pools:
+            await asyncio.gather(*cls.draining_pools, return_exceptions=True)
 
     @classmethod
     async def get_pool(cls):
@@ -62,13 +199,59 @@ class Database:
     @classmethod
     async def refresh_pool(cls):
         """
-        Refreshes the connection pool by creating a new one and closing the old one.
-        Prints a message indicating the refresh operation.
+        Rotates the connection pools without interrupting queries in flight.
+
+        The new pools are created first and swapped in, the old ones are then drained in
+        the background: pool.close() waits for their connections to be released and the
+        pool is terminated if that takes longer than pool_drain_timeout. Concurrent callers
+        keep using the current pool while a rotation is under way. If the new pool cannot
+        be created the old one is kept until the next refresh_interval.
         """
-        print("Refreshing connection pool...")
-        old_pool = cls.pool
-        await cls.create_pool()
-        await old_pool.close()
+        if cls.refresh_lock.locked():
+            return
+        async with cls.refresh_lock:
+            logger.info("Refreshing connection pool...")
+            old_pools = [cls.pool, *cls.replica_pools]
+            try:
+                await cls.create_pool()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"Could not refresh connection pool, keeping the old one: {e}")
+                cls.last_refresh_time = time.time()
+                return
+            cls.refreshes += 1
+            for pool in old_pools:
+                if pool is not None:
+                    task = asyncio.create_task(cls.drain_pool(pool))
+                    cls.draining_pools.add(task)
+                    task.add_done_callback(cls.draining_pools.discard)
+
+    @classmethod
+    async def drain_pool(cls, pool: Pool):
+        """
+        Closes a pool once its connections are released, terminates it after the timeout.
+        """
+        try:
+            await asyncio.wait_for(pool.close(), timeout=cls.pool_drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Connection pool not drained after {cls.pool_drain_timeout}s, terminating it"
+            )
+            pool.terminate()
+
+    @classmethod
+    @asynccontextmanager
+    async def acquire(cls, pool: Pool):
+        """
+        Acquires a connection from `pool`, recording how long the caller waited for it.
+        """
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            wait = time.perf_counter() - started
+            cls.acquire_count += 1
+            cls.acquire_wait_total += wait
+            cls.acquire_wait_max = max(cls.acquire_wait_max, wait)
+            cls.acquire_waits.append(wait)
+            yield conn
 
     @classmethod
     @asynccontextmanager
@@ -80,40 +263,224 @@ class Database:
             Connection: A database connection from the pool
         """
         pool = await cls.get_pool()
-        async with pool.acquire() as conn:
+        async with cls.acquire(pool) as conn:
             yield conn
 
     @classmethod
-    async def fetch(cls, query: str, *args):
+    def register_statements(cls, namespace):
+        """
+        Names the SQL strings held as attributes of `namespace` (like SqlObject) after
+        those attributes, for the per statement timings.
+        """
+        for name, value in vars(namespace).items():
+            if isinstance(value, str) and not name.startswith("_"):
+                cls.statement_names[value] = name
+
+    @classmethod
+    def statement_name(cls, query: str) -> str:
+        """
+        Registered name of a statement, or its first 80 normalized characters.
+        """
+        name = cls.statement_names.get(query)
+        return name if name is not None else _unnamed_statement(query)
+
+    @classmethod
+    @contextmanager
+    def timed(cls, query: str, args: tuple = (), operation: str = "execute"):
+        """
+        Records the duration of the enclosed statement under its name and logs it.
+        """
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            name = cls.statement_name(query)
+            stats = cls.statement_stats.setdefault(
+                name,
+                {"count": 0, "failed": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+            )
+            stats["count"] += 1
+            stats["failed"] += failed
+            stats["total_seconds"] += duration
+            stats["max_seconds"] = max(stats["max_seconds"], duration)
+            cls.log_statement(operation, name, query, args, duration, failed)
+            if not failed:
+                for hook in cls.slow_statement_hooks:
+                    hook(name, query, args, duration)
+
+    @classmethod
+    def log_statement(
+        cls,
+        operation: str,
+        name: str,
+        query: str,
+        args: tuple,
+        duration: float,
+        failed: bool = False,
+    ):
+        """
+        Logs a finished statement. Arguments are only described (size and hash of the
+        large ones) unless SQL_LOG_FULL, Database.full_sql_logging() or a duration past
+        SQL_SLOW_QUERY_MS asks for the rendered SQL. Nothing is formatted when the record
+        is filtered out.
+        """
+        slow = duration >= cls.slow_query_seconds
+        status = " failed" if failed else (" slow" if slow else "")
+        if slow or failed or cls.sql_log_full or log_full_sql.get():
+            logger.log(
+                logging.WARNING if slow or failed else logging.INFO,
+                "%s %s%s %.1f ms: %s",
+                operation,
+                name,
+                status,
+                duration * 1000,
+                _LazySql(query, args, cls.sql_log_arg_max_chars),
+            )
+        else:
+            logger.info(
+                "%s %s %.1f ms args=[%s]", operation, name, duration * 1000, _LazySql(query, args)
+            )
+
+    @classmethod
+    @contextmanager
+    def full_sql_logging(cls):
+        """
+        Logs the rendered SQL of every statement run inside the block, for debugging one
+        request without enabling SQL_LOG_FULL for the whole process.
+        """
+        token = log_full_sql.set(True)
+        try:
+            yield
+        finally:
+            log_full_sql.reset(token)
+
+    @staticmethod
+    def mark_write():
+        """
+        Records a write in the current task so its next reads see it on the primary.
+        """
+        last_write_at.set(max(last_write_at.get(), time.time()))
+
+    @classmethod
+    async def replica_lag_seconds(cls, index: int) -> float:
+        """
+        Replication lag of a replica, checked at most every replica_lag_check_interval.
+        An unreachable replica reports infinite lag until its next check.
+        """
+        now = time.time()
+        if now - cls.replica_lag_checked_at.get(index, 0) < cls.replica_lag_check_interval:
+            return cls.replica_lag[index]
+        cls.replica_lag_checked_at[index] = now
+        try:
+            async with cls.acquire(cls.replica_pools[index]) as conn:
+                cls.replica_lag[index] = await conn.fetchval(REPLICA_LAG_QUERY)
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            logger.warning(f"Read replica {index} lag check failed: {e}")
+            cls.replica_lag[index] = float("inf")
+        return cls.replica_lag[index]
+
+    @classmethod
+    async def get_read_pool(cls) -> Pool:
+        """
+        Pool for a read: the next replica in turn whose lag is within
+        replica_max_lag_seconds, or the primary when there is none, when all replicas lag
+        behind, or when the current task wrote within the lag window (read your writes).
+        """
+        primary = await cls.get_pool()
+        if not cls.replica_pools:
+            cls.routed_reads["primary"] += 1
+            return primary
+        if time.time() - last_write_at.get() < cls.replica_max_lag_seconds:
+            cls.routed_reads["primary"] += 1
+            return primary
+
+        count = len(cls.replica_pools)
+        for offset in range(count):
+            index = (cls.replica_cursor + offset) % count
+            if await cls.replica_lag_seconds(index) <= cls.replica_max_lag_seconds:
+                cls.replica_cursor = index + 1
+                cls.routed_reads["replica"] += 1
+                return cls.replica_pools[index]
+        cls.routed_reads["fallback"] += 1
+        return primary
+
+    @classmethod
+    @asynccontextmanager
+    async def read_connection(cls, read_only: Optional[bool] = None, query: str = ""):
+        """
+        Context manager for a connection to run a read on.
+
+        Args:
+            read_only: True routes to a replica, False to the primary, None classifies `query`
+            query: Statement used to classify the call when read_only is None
+
+        Yields:
+            Connection: A replica connection for reads, a primary one otherwise
+        """
+        if read_only is None:
+            read_only = is_read_only_query(query)
+        if not read_only:
+            cls.mark_write()
+            async with cls.connection() as conn:
+                yield conn
+            return
+        pool = await cls.get_read_pool()
+        async with cls.acquire(pool) as conn:
+            yield conn
+
+    @classmethod
+    @asynccontextmanager
+    async def use_primary(cls):
+        """
+        Routes every read of the enclosed block to the primary, for callers that need to
+        see a write made by another task or worker.
+        """
+        token = last_write_at.set(float("inf"))
+        try:
+            yield
+        finally:
+            last_write_at.reset(token)
+
+    @classmethod
+    async def fetch(cls, query: str, *args, read_only: Optional[bool] = None):
         """
         Executes a query and returns all results.
         
         Args:
             query: SQL query string
             *args: Query parameters
+            read_only: Routes to a replica when True, to the primary when False,
+                classifies the query when None
         
         Returns:
             List[Record]: List of all matching records
         """
-        logger.info(f"Executing fetch query: {cls.generate_sql_script(query, *args)}")
-        async with cls.connection() as conn:
-            return await conn.fetch(query, *args)
+        async with cls.read_connection(read_only, query) as conn:
+            with cls.timed(query, args, "fetch"):
+                return await conn.fetch(query, *args)
 
     @classmethod
-    async def fetchrow(cls, query: str, *args):
+    async def fetchrow(cls, query: str, *args, read_only: Optional[bool] = None):
         """
         Executes a query and returns the first result.
         
         Args:
             query: SQL query string
             *args: Query parameters
+            read_only: Routes to a replica when True, to the primary when False,
+                classifies the query when None
         
         Returns:
             Record: First matching record or None
         """
-        logger.info(f"Executing fetchrow query: {cls.generate_sql_script(query, *args)}")
-        async with cls.connection() as conn:
-            return await conn.fetchrow(query, *args)
+        async with cls.read_connection(read_only, query) as conn:
+            with cls.timed(query, args, "fetchrow"):
+                return await conn.fetchrow(query, *args)
 
     @classmethod
     async def execute(cls, query: str, *args, save_sql_script: bool = False):
@@ -128,8 +495,7 @@ class Database:
         Returns:
             str: Command completion tag
         """
-        formatted_query = cls.generate_sql_script(query, *args)
-        logger.info(f"Executing query: {formatted_query}")
+        cls.mark_write()
         async with cls.connection() as conn:
             if save_sql_script:
                 unique_id = str(uuid.uuid4())[:8]
@@ -137,7 +503,8 @@ class Database:
                 sql_script = cls.generate_sql_script(query, *args)
                 filename = f"sql_script_{timestamp}_{unique_id}.sql"
                 cls.save_sql_script(filename, sql_script)
-            return await conn.execute(query, *args)
+            with cls.timed(query, args, "execute"):
+                return await conn.execute(query, *args)
 
     @classmethod
     async def execute_many(cls, query: str, entries: List[list]):
@@ -151,31 +518,84 @@ class Database:
         Returns:
             List[str]: List of command completion tags
         """
-        logger.info(f"Executing many queries with template: {query}")
-        logger.debug(f"First few entries: {entries[:3]}")  # Log just first few entries to avoid overwhelming logs
+        cls.mark_write()
         async with cls.connection() as conn:
-            return await conn.executemany(query, entries)
+            with cls.timed(query, (entries,), "execute_many"):
+                return await conn.executemany(query, entries)
+
+    @classmethod
+    async def iterate(
+        cls, query: str, *args, chunk_size: int = 1000, read_only: Optional[bool] = None
+    ):
+        """
+        Streams the results of a query through a server side cursor.
+
+        The cursor lives in a transaction on one pooled connection, so rows are fetched
+        from the server chunk by chunk instead of being loaded all at once. Read only
+        queries are streamed from a replica like fetch.
+
+        Args:
+            query: SQL query string
+            *args: Query parameters
+            chunk_size: Number of records fetched per round trip
+            read_only: Same routing as for fetch
+
+        Yields:
+            List[Record]: Chunks of at most chunk_size records
+        """
+        async with cls.read_connection(read_only, query) as conn:
+            async with conn.transaction():
+                with cls.timed(query, args, "cursor"):
+                    cursor = await conn.cursor(query, *args)
+                while True:
+                    records = await cursor.fetch(chunk_size)
+                    if not records:
+                        break
+                    yield records
+
+    @staticmethod
+    def describe_argument(arg) -> str:
+        """
+        Short description of a bound argument for the logs: small scalars as they are,
+        long strings and binaries by type, size and CRC32, containers by length.
+        """
+        if isinstance(arg, (str, bytes, bytearray, memoryview)):
+            if len(arg) <= 32:
+                return repr(arg)
+            data = arg.encode() if isinstance(arg, str) else arg
+            return f"{type(arg).__name__}[{len(data)} B, crc {zlib.crc32(data):08x}]"
+        if isinstance(arg, (list, tuple, set, dict)):
+            return f"{type(arg).__name__}[{len(arg)}]"
+        text = repr(arg)
+        return text if len(text) <= 32 else type(arg).__name__
 
     @staticmethod
-    def generate_sql_script(query: str, *args) -> str:
+    def generate_sql_script(query: str, *args, max_arg_chars: Optional[int] = None) -> str:
         """
         Generates a SQL script by replacing placeholders with actual values.
         
         Args:
             query: SQL query string with placeholders
             *args: Values to replace placeholders
+            max_arg_chars: Cuts longer values, for logging
         
         Returns:
             str: SQL query with replaced values
         """
-        for i, arg in enumerate(args, start=1):
-            placeholder = f"${i}"
+
+        def render(match: re.Match) -> str:
+            index = int(match.group(1))
+            if index > len(args):
+                return match.group(0)
+            arg = args[index - 1]
+            text = arg if isinstance(arg, str) else str(arg)
+            if max_arg_chars is not None and len(text) > max_arg_chars:
+                text = f"{text[:max_arg_chars]}... ({len(text)} chars)"
             if isinstance(arg, str):
-                escaped_arg = arg.replace("'", "''")
-                query = query.replace(placeholder, f"'{escaped_arg}'", 1)
-            else:
-                query = query.replace(placeholder, str(arg), 1)
-        return query
+                return "'" + text.replace("'", "''") + "'"
+            return text
+
+        return _PLACEHOLDER.sub(render, query)
 
     @staticmethod
     def save_sql_script(filename: str, content: str):
@@ -200,6 +620,7 @@ class Database:
         Yields:
             Connection: A database connection within a transaction
         """
+        cls.mark_write()
         async with cls.connection() as conn:
             async with conn.transaction():
                 yield conn
@@ -219,6 +640,65 @@ class Database:
         except Exception:
             return False
 
+    @staticmethod
+    def pool_metrics(pool: Optional[Pool]) -> Optional[dict]:
+        if pool is None:
+            return None
+        size, idle = pool.get_size(), pool.get_idle_size()
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": pool.get_min_size(),
+            "max_size": pool.get_max_size(),
+        }
+
+    @classmethod
+    def get_metrics(cls) -> dict:
+        """
+        Snapshot of the pools (in use and idle connections), of the acquire wait times and
+        of the per statement durations, slowest total first.
+        """
+        waits = sorted(cls.acquire_waits)
+        statements = {}
+        for name, stats in sorted(
+            cls.statement_stats.items(), key=lambda item: -item[1]["total_seconds"]
+        ):
+            statements[name] = {
+                **stats,
+                "avg_seconds": stats["total_seconds"] / stats["count"],
+            }
+        return {
+            "primary": cls.pool_metrics(cls.pool),
+            "replicas": [cls.pool_metrics(pool) for pool in cls.replica_pools],
+            "draining_pools": len(cls.draining_pools),
+            "refreshes": cls.refreshes,
+            "acquire": {
+                "count": cls.acquire_count,
+                "avg_wait_seconds": cls.acquire_wait_total / cls.acquire_count
+                if cls.acquire_count
+                else 0.0,
+                "max_wait_seconds": cls.acquire_wait_max,
+                "p95_recent_wait_seconds": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            },
+            "statements": statements,
+            "replication": cls.get_replica_metrics(),
+        }
+
+    @classmethod
+    def get_replica_metrics(cls) -> dict:
+        return {
+            "replicas": len(cls.replica_pools),
+            "configured_replicas": len(cls.replica_dsns),
+            "max_lag_seconds": cls.replica_max_lag_seconds,
+            "lag_seconds": {str(index): lag for index, lag in cls.replica_lag.items()},
+            "routed_reads": dict(cls.routed_reads),
+        }
+
+
+async def get_database_metrics() -> dict:
+    return Database.get_metrics()
+
 
 # Apply the decorator to all functions in this module
 apply_decorator_to_module(logger)(__name__)
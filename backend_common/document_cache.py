@@ -0,0 +1,283 @@
+# document_cache.py
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+import orjson
+
+from backend_common.database import Database
+from backend_common.logger import logging
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "firestore_invalidation"
+# Collection and document id of the event asking to drop every cached document
+ALL_DOCUMENTS = "*"
+
+# (collection name, document id) of an invalidated document
+InvalidationHandler = Callable[[str, str], None]
+
+
+class BoundedDocumentCache(MutableMapping):
+    """
+    LRU of the documents of one Firestore collection, bounded by bytes, entries expiring
+    ttl_seconds after they were stored.
+
+    Used in place of the dict of a collection too large to hold whole: documents are
+    loaded on a miss and dropped when evicted, expired or invalidated by another worker.
+    Documents are kept as dicts, which callers may modify, and measured by their orjson
+    size when stored: a document modified in place is only measured again when stored
+    again. Nothing is stored while `suspended`, set while invalidations may be missed.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        # doc id -> (expires at, size, document)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self.current_bytes = 0
+        self.suspended = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def measure(document: Any) -> int:
+        return len(orjson.dumps(document, default=str))
+
+    def _live_entry(self, doc_id: str) -> Optional[Tuple[float, int, Any]]:
+        entry = self._entries.get(doc_id)
+        if entry is not None and entry[0] <= self.clock():
+            self._drop(doc_id)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _drop(self, doc_id: str) -> bool:
+        entry = self._entries.pop(doc_id, None)
+        if entry is None:
+            return False
+        self.current_bytes -= entry[1]
+        return True
+
+    def __getitem__(self, doc_id: str) -> Any:
+        entry = self._live_entry(doc_id)
+        if entry is None:
+            self.misses += 1
+            raise KeyError(doc_id)
+        self._entries.move_to_end(doc_id)
+        self.hits += 1
+        return entry[2]
+
+    def __contains__(self, doc_id: object) -> bool:
+        return self._live_entry(doc_id) is not None
+
+    def __setitem__(self, doc_id: str, document: Any):
+        """
+        Stores a document, evicting the least recently used ones past max_bytes.
+        Documents bigger than the whole budget are not kept.
+        """
+        self._drop(doc_id)
+        if self.suspended:
+            return
+        size = self.measure(document)
+        if size > self.max_bytes:
+            return
+        self._entries[doc_id] = (self.clock() + self.ttl_seconds, size, document)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._drop(evicted)
+            self.evictions += 1
+
+    def __delitem__(self, doc_id: str):
+        if not self._drop(doc_id):
+            raise KeyError(doc_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([doc_id for doc_id in list(self._entries) if self._live_entry(doc_id)])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def discard(self, doc_id: str):
+        if self._drop(doc_id):
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def get_metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "suspended": self.suspended,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class InvalidationChannel(ABC):
+    """
+    Carries "document changed" events between the workers. Each worker subscribes with
+    its handler and publishes after writing a document; a worker doesn't receive its own
+    events. The handler gets an ALL_DOCUMENTS event whenever `connected` changes.
+    """
+
+    def __init__(self):
+        self.sender = uuid.uuid4().hex
+        self.handler: Optional[InvalidationHandler] = None
+        self.connected = True
+
+    async def start(self, handler: InvalidationHandler):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    @abstractmethod
+    async def publish(self, collection_name: str, doc_id: str):
+        """
+        Sends the event to the other workers.
+        """
+
+    def encode(self, collection_name: str, doc_id: str) -> str:
+        return orjson.dumps([self.sender, collection_name, doc_id]).decode()
+
+    def receive(self, payload: str):
+        sender, collection_name, doc_id = orjson.loads(payload)
+        if sender != self.sender and self.handler is not None:
+            self.handler(collection_name, doc_id)
+
+
+class LocalInvalidationChannel(InvalidationChannel):
+    """
+    In-process stand-in: every channel of the same `hub` list gets the events of the
+    others, like workers sharing a Postgres channel.
+    """
+
+    def __init__(self, hub: Optional[List["LocalInvalidationChannel"]] = None):
+        super().__init__()
+        self.hub = hub if hub is not None else []
+
+    async def start(self, handler: InvalidationHandler):
+        await super().start(handler)
+        if self not in self.hub:
+            self.hub.append(self)
+
+    async def stop(self):
+        if self in self.hub:
+            self.hub.remove(self)
+        await super().stop()
+
+    async def publish(self, collection_name: str, doc_id: str):
+        payload = self.encode(collection_name, doc_id)
+        for channel in list(self.hub):
+            channel.receive(payload)
+
+
+class PostgresInvalidationChannel(InvalidationChannel):
+    """
+    Events go through Postgres NOTIFY on INVALIDATION_CHANNEL, received on a dedicated
+    connection, as for DatasetCache. The connection is opened again with backoff when
+    it drops or can't be opened.
+    """
+
+    min_reconnect_delay: float = 1.0
+    max_reconnect_delay: float = 60.0
+
+    def __init__(self, channel: str = INVALIDATION_CHANNEL):
+        super().__init__()
+        self.channel = channel
+        self.listener: Optional[asyncpg.Connection] = None
+        self.connected = False
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self.reconnect_delay = self.min_reconnect_delay
+
+    async def start(self, handler: InvalidationHandler):
+        await super().start(handler)
+        if self.listener is not None:
+            return
+        try:
+            listener = await asyncpg.connect(dsn=Database.dsn)
+            await listener.add_listener(self.channel, self._on_notification)
+            listener.add_termination_listener(self._on_listener_closed)
+        except Exception as e:
+            logger.warning(
+                f"Firestore cache invalidation channel unavailable, "
+                f"retrying in {self.reconnect_delay:.0f}s: {e}"
+            )
+            self._disconnect()
+            return
+        self.listener = listener
+        self.connected = True
+        self.reconnect_delay = self.min_reconnect_delay
+        # Events were missed while disconnected, the caches start again empty
+        self.handler(ALL_DOCUMENTS, ALL_DOCUMENTS)
+        logger.info(f"Firestore cache listening on {self.channel}")
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self.receive(payload)
+
+    def _disconnect(self):
+        self.listener = None
+        self.connected = False
+        if self.handler is None:
+            return
+        self.handler(ALL_DOCUMENTS, ALL_DOCUMENTS)
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = asyncio.get_event_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        await asyncio.sleep(self.reconnect_delay)
+        self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+        self.reconnect_task = None
+        if self.handler is not None:
+            await self.start(self.handler)
+
+    def _on_listener_closed(self, connection):
+        logger.warning("Firestore cache invalidation channel closed, caches cleared")
+        self._disconnect()
+
+    async def stop(self):
+        task, self.reconnect_task = self.reconnect_task, None
+        if task is not None:
+            task.cancel()
+        self.connected = False
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.remove_termination_listener(self._on_listener_closed)
+            await listener.close()
+        await super().stop()
+
+    async def publish(self, collection_name: str, doc_id: str):
+        try:
+            await Database.execute(
+                "SELECT pg_notify($1, $2);", self.channel, self.encode(collection_name, doc_id)
+            )
+        except Exception as e:
+            logger.warning(f"Could not publish invalidation of {collection_name}/{doc_id}: {e}")
+
+
+def bounded_cache_from_env() -> BoundedDocumentCache:
+    return BoundedDocumentCache(
+        max_bytes=int(os.getenv("FIRESTORE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl_seconds=float(os.getenv("FIRESTORE_CACHE_TTL_SECONDS", "300")),
+    )
@@ -0,0 +1,241 @@
+# query_diagnostics.py
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+import orjson
+
+from backend_common.database import Database, is_read_only_query
+from backend_common.logger import logging
+
+logger = logging.getLogger(__name__)
+
+CREATE_SLOW_QUERY_PLANS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_marketplace.slow_query_plans (
+        fingerprint TEXT PRIMARY KEY,
+        statement_name TEXT NOT NULL,
+        normalized_query TEXT NOT NULL,
+        plan JSONB NOT NULL,
+        duration_ms DOUBLE PRECISION NOT NULL,
+        max_duration_ms DOUBLE PRECISION NOT NULL,
+        captures INTEGER NOT NULL DEFAULT 1,
+        captured_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# The latest plan is kept, max_duration_ms and captures accumulate per fingerprint
+UPSERT_SLOW_QUERY_PLAN = """
+    INSERT INTO schema_marketplace.slow_query_plans
+        (fingerprint, statement_name, normalized_query, plan, duration_ms, max_duration_ms)
+    VALUES ($1, $2, $3, $4::jsonb, $5, $5)
+    ON CONFLICT (fingerprint) DO UPDATE SET
+        statement_name = EXCLUDED.statement_name,
+        plan = EXCLUDED.plan,
+        duration_ms = EXCLUDED.duration_ms,
+        max_duration_ms = GREATEST(slow_query_plans.max_duration_ms, EXCLUDED.duration_ms),
+        captures = slow_query_plans.captures + 1,
+        captured_at = now();
+"""
+
+LOAD_SLOW_QUERY_REPORT = """
+    SELECT fingerprint, statement_name, normalized_query, plan::text AS plan,
+           duration_ms, max_duration_ms, captures, captured_at
+    FROM schema_marketplace.slow_query_plans
+    ORDER BY max_duration_ms DESC
+    LIMIT $1;
+"""
+
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_statement(query: str) -> str:
+    """
+    Statement text with comments, literals and whitespace differences removed, so the
+    same query written with other constants shares one fingerprint. Placeholders ($1)
+    are kept.
+    """
+    statement = _SQL_COMMENT.sub(" ", query)
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _IN_LIST.sub("(?)", statement)
+    return " ".join(statement.split()).rstrip(";").strip()
+
+
+def statement_fingerprint(query: str) -> str:
+    return hashlib.md5(normalize_statement(query).encode()).hexdigest()[:16]
+
+
+def summarize_plan(plan: list) -> dict:
+    """
+    Headline numbers of an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) output.
+    """
+    if not plan:
+        return {}
+    top = plan[0]
+    root = top.get("Plan", {})
+    return {
+        "node_type": root.get("Node Type"),
+        "total_cost": root.get("Total Cost"),
+        "plan_rows": root.get("Plan Rows"),
+        "actual_rows": root.get("Actual Rows"),
+        "execution_ms": top.get("Execution Time"),
+        "planning_ms": top.get("Planning Time"),
+        "shared_hit_blocks": root.get("Shared Hit Blocks"),
+        "shared_read_blocks": root.get("Shared Read Blocks"),
+    }
+
+
+class SlowQueryExplainer:
+    """
+    Opt-in (SLOW_QUERY_EXPLAIN=1) capture of EXPLAIN (ANALYZE, BUFFERS) for statements
+    slower than SLOW_QUERY_EXPLAIN_MS.
+
+    Registered as a Database slow statement hook. Captures are sampled
+    (SLOW_QUERY_EXPLAIN_SAMPLE), at most SLOW_QUERY_EXPLAIN_PER_MINUTE overall, one at a
+    time, and a fingerprint is not explained again for SLOW_QUERY_EXPLAIN_INTERVAL
+    seconds. ANALYZE runs the statement a second time, so only read only statements are
+    explained, inside a transaction that is rolled back and under a statement timeout.
+    Plans are kept by fingerprint in schema_marketplace.slow_query_plans.
+    """
+
+    enabled: bool = os.getenv("SLOW_QUERY_EXPLAIN", "").lower() in ("1", "true", "yes")
+    threshold_seconds: float = float(os.getenv("SLOW_QUERY_EXPLAIN_MS", "2000")) / 1000
+    sample_rate: float = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+    max_per_minute: int = int(os.getenv("SLOW_QUERY_EXPLAIN_PER_MINUTE", "6"))
+    fingerprint_interval: float = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+    statement_timeout_ms: int = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "30000"))
+
+    table_ready: bool = False
+    capture_times: deque = deque()
+    last_capture: Dict[str, float] = {}
+    tasks: Set[asyncio.Task] = set()
+    captured: int = 0
+    skipped: int = 0
+
+    @classmethod
+    def start(cls):
+        """
+        Hooks into Database when diagnostics are enabled.
+        """
+        if cls.enabled and cls.on_slow_statement not in Database.slow_statement_hooks:
+            Database.slow_statement_hooks.append(cls.on_slow_statement)
+            logger.info(
+                f"Slow query EXPLAIN capture on, above {cls.threshold_seconds * 1000:.0f} ms"
+            )
+
+    @classmethod
+    async def stop(cls):
+        if cls.on_slow_statement in Database.slow_statement_hooks:
+            Database.slow_statement_hooks.remove(cls.on_slow_statement)
+        if cls.tasks:
+            await asyncio.gather(*cls.tasks, return_exceptions=True)
+
+    @classmethod
+    def should_capture(cls, query: str, fingerprint: str, duration: float) -> bool:
+        if duration < cls.threshold_seconds or not is_read_only_query(query):
+            return False
+        now = time.time()
+        if now - cls.last_capture.get(fingerprint, 0) < cls.fingerprint_interval:
+            return False
+        while cls.capture_times and now - cls.capture_times[0] > 60:
+            cls.capture_times.popleft()
+        if cls.tasks or len(cls.capture_times) >= cls.max_per_minute:
+            cls.skipped += 1
+            return False
+        if random.random() >= cls.sample_rate:
+            cls.skipped += 1
+            return False
+        cls.capture_times.append(now)
+        cls.last_capture[fingerprint] = now
+        return True
+
+    @classmethod
+    def on_slow_statement(cls, name: str, query: str, args: tuple, duration: float):
+        if duration < cls.threshold_seconds:
+            return
+        fingerprint = statement_fingerprint(query)
+        if not cls.should_capture(query, fingerprint, duration):
+            return
+        task = asyncio.create_task(cls.capture(fingerprint, name, query, args, duration))
+        cls.tasks.add(task)
+        task.add_done_callback(cls.tasks.discard)
+
+    @classmethod
+    async def capture(
+        cls, fingerprint: str, name: str, query: str, args: tuple, duration: float
+    ) -> Optional[list]:
+        """
+        Runs EXPLAIN (ANALYZE, BUFFERS) of the statement with its arguments and stores it.
+        Failures are logged, never raised to the request that triggered the capture.
+        """
+        try:
+            async with Database.read_connection(read_only=True) as conn:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    await conn.execute(
+                        f"SET LOCAL statement_timeout = {int(cls.statement_timeout_ms)}"
+                    )
+                    plan = await conn.fetchval(
+                        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, *args
+                    )
+                finally:
+                    await transaction.rollback()
+            plan = orjson.loads(plan) if isinstance(plan, str) else plan
+
+            async with Database.connection() as conn:
+                if not cls.table_ready:
+                    await conn.execute(CREATE_SLOW_QUERY_PLANS_TABLE)
+                    cls.table_ready = True
+                await conn.execute(
+                    UPSERT_SLOW_QUERY_PLAN,
+                    fingerprint,
+                    name,
+                    normalize_statement(query),
+                    orjson.dumps(plan).decode(),
+                    duration * 1000,
+                )
+            cls.captured += 1
+            logger.warning(f"Captured plan of slow statement {name}: {summarize_plan(plan)}")
+            return plan
+        except Exception as e:
+            logger.warning(f"Could not capture plan of slow statement {name}: {e}")
+            return None
+
+    @classmethod
+    async def report(cls, limit: int = 20) -> List[dict]:
+        """
+        Slowest captured statements first, with the summary of their latest plan.
+        """
+        try:
+            records = await Database.fetch(LOAD_SLOW_QUERY_REPORT, limit)
+        except Exception as e:
+            logger.warning(f"Slow query plans unavailable: {e}")
+            return []
+        report = []
+        for record in records:
+            entry = dict(record)
+            plan = orjson.loads(entry.pop("plan"))
+            entry["captured_at"] = entry["captured_at"].isoformat()
+            entry["plan_summary"] = summarize_plan(plan)
+            entry["plan"] = plan
+            report.append(entry)
+        return report
+
+
+async def get_slow_query_report() -> dict:
+    return {
+        "enabled": SlowQueryExplainer.enabled,
+        "threshold_ms": SlowQueryExplainer.threshold_seconds * 1000,
+        "captured": SlowQueryExplainer.captured,
+        "skipped": SlowQueryExplainer.skipped,
+        "statements": await SlowQueryExplainer.report(),
+    }
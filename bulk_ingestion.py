@@ -0,0 +1,284 @@
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import AsyncIterable, Callable, Iterable, Iterator, List, Optional, Sequence, Union
+
+import orjson
+
+from backend_common.database import Database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 10_000
+READ_SIZE = 1 << 20
+
+
+@dataclass
+class IngestProgress:
+    table: str
+    rows: int = 0
+    chunks: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def log_progress(progress: IngestProgress):
+    logger.info(
+        f"{progress.table}: {progress.rows} rows in {progress.chunks} chunks, "
+        f"{progress.rows_per_second:,.0f} rows/s"
+    )
+
+
+def _starts_with_feature_line(buffer: str) -> bool:
+    first_line, newline, _ = buffer.lstrip().partition("\n")
+    if not newline:
+        return False
+    try:
+        return orjson.loads(first_line).get("type") == "Feature"
+    except (orjson.JSONDecodeError, AttributeError):
+        return False
+
+
+def iter_geojson_features(path: str, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """
+    Streams the features of a GeoJSON file without loading it whole. Accepts a
+    FeatureCollection (features are decoded one at a time from the "features" array) or
+    newline delimited GeoJSON with one feature per line.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        while True:
+            more = f.read(read_size)
+            buffer += more
+            if _starts_with_feature_line(buffer):
+                # Newline delimited features
+                f.seek(0)
+                for line in f:
+                    if line.strip():
+                        yield orjson.loads(line)
+                return
+            start = buffer.find('"features"')
+            if start != -1:
+                break
+            if not more:
+                raise ValueError(f"{path} is neither a FeatureCollection nor newline delimited GeoJSON")
+
+        while buffer.find("[", start) == -1:
+            more = f.read(read_size)
+            if not more:
+                raise ValueError(f"{path} has no features array")
+            buffer += more
+        position = buffer.index("[", start) + 1
+        while True:
+            # Skip separators, refill when the next feature is not complete yet
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer):
+                    break
+                more = f.read(read_size)
+                if not more:
+                    return
+                buffer, position = more, 0
+            if buffer[position] == "]":
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                more = f.read(read_size)
+                if not more:
+                    raise
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield feature
+            position = end
+            if position > read_size:
+                buffer, position = buffer[position:], 0
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def geojson_point_rows(features: Iterable[dict]) -> Iterator[tuple]:
+    """
+    (custom id, feature json) rows, the id being "<lng>_<lat>" of the point.
+    """
+    for feature in features:
+        coordinates = feature["geometry"]["coordinates"]
+        if len(coordinates) != 2:
+            logger.warning(f"Skipping feature with invalid coordinates: {coordinates}")
+            continue
+        yield f"{coordinates[0]}_{coordinates[1]}", orjson.dumps(feature).decode()
+
+
+async def copy_upsert(
+    table_name: str,
+    columns: Sequence[str],
+    key_column: str,
+    chunks: Union[Iterable[List[tuple]], AsyncIterable[List[tuple]]],
+    progress_callback: Optional[Callable[[IngestProgress], None]] = log_progress,
+) -> IngestProgress:
+    """
+    Upserts row chunks into `table_name` with COPY: every chunk is copied into a temporary
+    staging table, then merged with one INSERT ... ON CONFLICT (key_column). Within a
+    chunk the last row of a key wins, like consecutive upserts would.
+    Runs in one transaction, nothing is visible until the whole input is merged.
+    """
+    progress = IngestProgress(table=table_name)
+    staging = f"staging_{uuid.uuid4().hex[:12]}"
+    column_list = ", ".join(columns)
+    updates = ", ".join(
+        f"{column} = EXCLUDED.{column}" for column in columns if column != key_column
+    )
+    merge = f"""
+        INSERT INTO {table_name} ({column_list})
+        SELECT DISTINCT ON ({key_column}) {column_list}
+        FROM {staging}
+        ORDER BY {key_column}, _seq DESC
+        ON CONFLICT ({key_column}) DO {f"UPDATE SET {updates}" if updates else "NOTHING"}
+    """
+
+    async def merge_chunk(conn, chunk: List[tuple]):
+        await conn.copy_records_to_table(staging, records=chunk, columns=list(columns))
+        await conn.execute(merge)
+        await conn.execute(f"TRUNCATE {staging}")
+        progress.rows += len(chunk)
+        progress.chunks += 1
+        if progress_callback:
+            progress_callback(progress)
+
+    async with Database.transaction() as conn:
+        await conn.execute(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table_name} WITH NO DATA"
+        )
+        await conn.execute(f"ALTER TABLE {staging} ADD COLUMN _seq BIGSERIAL")
+        if hasattr(chunks, "__aiter__"):
+            async for chunk in chunks:
+                await merge_chunk(conn, chunk)
+        else:
+            for chunk in chunks:
+                await merge_chunk(conn, chunk)
+    return progress
+
+
+async def ingest_geojson_features(
+    table_name: str,
+    features: Iterable[dict],
+    id_column: str = "id",
+    data_column: str = "data",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress_callback: Optional[Callable[[IngestProgress], None]] = log_progress,
+) -> IngestProgress:
+    """
+    Creates the (id TEXT, data JSONB) table if needed and upserts the point features into it.
+    """
+    await Database.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            {id_column} TEXT PRIMARY KEY,
+            {data_column} JSONB
+        );
+        """
+    )
+    return await copy_upsert(
+        table_name,
+        [id_column, data_column],
+        id_column,
+        chunked(geojson_point_rows(features), chunk_size),
+        progress_callback,
+    )
+
+
+def _synthetic_features(count: int) -> Iterator[dict]:
+    for i in range(count):
+        yield {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [46.0 + (i % 100_000) * 1e-5, 24.0 + (i // 100_000) * 1e-4],
+            },
+            "properties": {"price": str(1_000_000 + i), "url": f"https://example.com/{i}"},
+        }
+
+
+def _write_geojson(path: str, count: int):
+    with open(path, "wb") as f:
+        f.write(b'{"type": "FeatureCollection", "features": [\n')
+        for i, feature in enumerate(_synthetic_features(count)):
+            f.write((b",\n" if i else b"") + orjson.dumps(feature))
+        f.write(b"\n]}\n")
+
+
+async def _main():
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(
+        description="COPY based ingestion of GeoJSON point files into (id, data) tables"
+    )
+    parser.add_argument("path", nargs="?", help="GeoJSON or newline delimited GeoJSON file")
+    parser.add_argument("--table", default="bulk_ingestion_benchmark")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="FEATURES",
+        help="generate a file with this many features and time its ingestion",
+    )
+    parser.add_argument(
+        "--parse-only",
+        action="store_true",
+        help="time reading and row preparation without a database",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    path = args.path
+    if args.benchmark:
+        path = os.path.join(tempfile.gettempdir(), f"bulk_ingestion_{args.benchmark}.geojson")
+        if not os.path.exists(path):
+            _write_geojson(path, args.benchmark)
+    if not path:
+        parser.error("a path or --benchmark is required")
+
+    if args.parse_only:
+        progress = IngestProgress(table="(parse only)")
+        for chunk in chunked(geojson_point_rows(iter_geojson_features(path)), args.chunk_size):
+            progress.rows += len(chunk)
+            progress.chunks += 1
+        log_progress(progress)
+        return
+
+    await Database.create_pool()
+    try:
+        progress = await ingest_geojson_features(
+            args.table,
+            iter_geojson_features(path),
+            chunk_size=args.chunk_size,
+            progress_callback=lambda p: p.chunks % 10 == 0 and log_progress(p),
+        )
+        log_progress(progress)
+    finally:
+        await Database.close_pool()
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    asyncio.run(_main())
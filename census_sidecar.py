@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+POPULATION_PATH = "Backend/population_json_files/v{zoom_level}/all_features.geojson"
+INCOME_PATH = "Backend/area_income_geojson/v{zoom_level}/all_features.geojson"
+SIDECAR_DIR = "Backend/census_sidecar/v{zoom_level}"
+SIDECAR_VERSION = 1
+
+
+def _source_mtimes(zoom_level: int) -> List[Optional[float]]:
+    mtimes = []
+    for path in (POPULATION_PATH, INCOME_PATH):
+        try:
+            mtimes.append(os.path.getmtime(path.format(zoom_level=zoom_level)))
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def _column_kind(values: list) -> str:
+    """
+    int for whole numbers, float for numbers with gaps or decimals, str otherwise.
+    """
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present) and len(
+        present
+    ) == len(values):
+        return "int"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return "float"
+    return "str"
+
+
+def _save(directory: str, name: str, array: np.ndarray):
+    np.save(os.path.join(directory, f"{name}.npy"), array, allow_pickle=False)
+
+
+def build_sidecar(zoom_level: int) -> str:
+    """
+    Converts the population and income GeoJSON of a zoom level into one .npy file per column.
+    Geometries are stored as flat coordinates plus ring and polygon offsets, every property
+    becomes a typed column and the income is joined on Main_ID.
+
+    Returns the sidecar directory.
+    """
+    with open(POPULATION_PATH.format(zoom_level=zoom_level), "r") as f:
+        population_data = json.load(f)
+    income_lookup = {}
+    income_path = INCOME_PATH.format(zoom_level=zoom_level)
+    if os.path.exists(income_path):
+        with open(income_path, "r") as f:
+            for feature in json.load(f).get("features", []):
+                income_lookup[feature["properties"]["Main_ID"]] = feature["properties"][
+                    "income"
+                ]
+
+    features = [
+        feature
+        for feature in population_data.get("features", [])
+        if feature.get("geometry", {}).get("type") == "Polygon"
+    ]
+
+    coords, ring_offsets, polygon_offsets = [], [0], [0]
+    for feature in features:
+        for ring in feature["geometry"]["coordinates"]:
+            coords.extend(point[:2] for point in ring)
+            ring_offsets.append(len(coords))
+        polygon_offsets.append(len(ring_offsets) - 1)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    polygon_offsets = np.asarray(polygon_offsets, dtype=np.int64)
+
+    # Bounds and centroid (mean of the exterior ring vertices) of every polygon
+    bounds = np.empty((len(features), 4), dtype=np.float64)
+    centroids = np.empty((len(features), 2), dtype=np.float64)
+    for i in range(len(features)):
+        start = ring_offsets[polygon_offsets[i]]
+        points = coords[start : ring_offsets[polygon_offsets[i + 1]]]
+        exterior = coords[start : ring_offsets[polygon_offsets[i] + 1]]
+        bounds[i, :2] = points.min(axis=0)
+        bounds[i, 2:] = points.max(axis=0)
+        centroids[i] = exterior[:-1].mean(axis=0) if len(exterior) > 1 else exterior[0]
+
+    property_names: List[str] = []
+    for feature in features:
+        for name in feature.get("properties", {}):
+            if name not in property_names:
+                property_names.append(name)
+
+    directory = SIDECAR_DIR.format(zoom_level=zoom_level)
+    os.makedirs(directory, exist_ok=True)
+
+    columns = {}
+    for name in property_names:
+        values = [feature["properties"].get(name) for feature in features]
+        kind = _column_kind(values)
+        if kind == "int":
+            array = np.asarray(values, dtype=np.int64)
+        elif kind == "float":
+            array = np.asarray(
+                [np.nan if v is None else v for v in values], dtype=np.float64
+            )
+        else:
+            array = np.asarray(["" if v is None else str(v) for v in values], dtype=str)
+        _save(directory, f"prop_{name}", array)
+        columns[name] = kind
+
+    main_ids = [feature["properties"].get("Main_ID") for feature in features]
+    # Coerced like ZoomIndex.census_rows does, values that aren't numbers are NaN
+    income = pd.to_numeric(
+        pd.Series([income_lookup.get(main_id) for main_id in main_ids], dtype=object),
+        errors="coerce",
+    ).to_numpy(dtype=np.float64)
+
+    _save(directory, "coords", coords)
+    _save(directory, "ring_offsets", ring_offsets)
+    _save(directory, "polygon_offsets", polygon_offsets)
+    _save(directory, "bounds", bounds)
+    _save(directory, "centroids", centroids)
+    _save(directory, "income", income)
+
+    # The manifest is written last so a half written sidecar is never picked up
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(
+            {
+                "version": SIDECAR_VERSION,
+                "rows": len(features),
+                "columns": columns,
+                "source_mtimes": _source_mtimes(zoom_level),
+            },
+            f,
+            indent=2,
+        )
+    logger.info(
+        f"Census sidecar for zoom level {zoom_level}: {len(features)} polygons, {len(columns)} columns in {directory}"
+    )
+    return directory
+
+
+@dataclass
+class CensusSidecar:
+    """
+    Columns of a census sidecar opened with np.memmap (through np.load), so every worker
+    shares the same pages of the OS cache instead of holding a parsed copy of the GeoJSON.
+    """
+
+    rows: int
+    columns: Dict[str, np.ndarray]
+    kinds: Dict[str, str]
+    coords: np.ndarray
+    ring_offsets: np.ndarray
+    polygon_offsets: np.ndarray
+    bounds: np.ndarray
+    centroids: np.ndarray
+    income: np.ndarray
+
+    def polygon_coordinates(self, i: int) -> list:
+        first_ring, last_ring = self.polygon_offsets[i], self.polygon_offsets[i + 1]
+        ring_bounds = self.ring_offsets[first_ring : last_ring + 1]
+        points = self.coords[ring_bounds[0] : ring_bounds[-1]].tolist()
+        ring_bounds = ring_bounds - ring_bounds[0]
+        return [
+            points[start:end] for start, end in zip(ring_bounds[:-1], ring_bounds[1:])
+        ]
+
+    def property_values(self, positions: np.ndarray) -> Dict[str, list]:
+        """
+        Column values of the given rows converted back to the JSON types of the source.
+        """
+        values = {}
+        for name, column in self.columns.items():
+            kind = self.kinds[name]
+            selected = np.asarray(column[positions])
+            if kind == "float":
+                values[name] = [
+                    None if value != value else value for value in selected.tolist()
+                ]
+            elif kind == "str":
+                values[name] = [value or None for value in selected.tolist()]
+            else:
+                values[name] = selected.tolist()
+        return values
+
+    def features(self, positions: np.ndarray) -> List[dict]:
+        """
+        GeoJSON features of the given rows, shaped like the source file.
+        """
+        values = self.property_values(positions)
+        names = list(values)
+        rows = zip(*values.values()) if names else [()] * len(positions)
+        return [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": self.polygon_coordinates(i)},
+                "properties": dict(zip(names, row)),
+            }
+            for i, row in zip(positions, rows)
+        ]
+
+
+def load_sidecar(zoom_level: int) -> Optional[CensusSidecar]:
+    """
+    Opens the sidecar of a zoom level, or returns None when it is missing, from an older
+    format, or older than the GeoJSON it was built from.
+    """
+    directory = SIDECAR_DIR.format(zoom_level=zoom_level)
+    manifest_path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != SIDECAR_VERSION:
+        return None
+    current = _source_mtimes(zoom_level)
+    if any(
+        now is not None and (built is None or now > built)
+        for now, built in zip(current, manifest["source_mtimes"])
+    ):
+        logger.info(f"Census sidecar for zoom level {zoom_level} is stale, ignoring it")
+        return None
+
+    def open_column(name: str) -> np.ndarray:
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+    return CensusSidecar(
+        rows=manifest["rows"],
+        columns={name: open_column(f"prop_{name}") for name in manifest["columns"]},
+        kinds=manifest["columns"],
+        coords=open_column("coords"),
+        ring_offsets=open_column("ring_offsets"),
+        polygon_offsets=open_column("polygon_offsets"),
+        bounds=open_column("bounds"),
+        centroids=open_column("centroids"),
+        income=open_column("income"),
+    )
+
+
+def sidecar_mtime(zoom_level: int) -> Optional[float]:
+    try:
+        return os.path.getmtime(
+            os.path.join(SIDECAR_DIR.format(zoom_level=zoom_level), "manifest.json")
+        )
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    import re
+
+    parser = argparse.ArgumentParser(
+        description="Build the memory-mapped census sidecar from the population and income GeoJSON"
+    )
+    parser.add_argument(
+        "--zoom",
+        type=int,
+        action="append",
+        help="zoom level to convert, repeatable; all zoom levels on disk by default",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    zoom_levels = args.zoom or sorted(
+        int(re.search(r"v(\d+)", path).group(1))
+        for path in glob.glob(os.path.dirname(POPULATION_PATH.format(zoom_level="*")))
+    )
+    for zoom_level in zoom_levels:
+        build_sidecar(zoom_level)
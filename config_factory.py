@@ -33,6 +33,7 @@ class ApiConfig(CommonApiConfig):
     old_nearby_categories: str = backend_base_uri + "old_nearby_categories"
     fetch_dataset_full_data: str = backend_base_uri + "fetch_dataset/full_data"
     fetch_dataset: str = backend_base_uri + "fetch_dataset"
+    export_dataset: str = backend_base_uri + "fetch_dataset/export"
     save_layer: str = backend_base_uri + "save_layer"
     delete_layer: str = backend_base_uri + "delete_layer"
     user_layers: str = backend_base_uri + "user_layers"
@@ -84,6 +85,12 @@ class ApiConfig(CommonApiConfig):
         backend_base_uri + "fetch_population_by_viewport"
     )
     temp_sales_man_problem = backend_base_uri + "temp_sales_man_problem"
+    compute_pool_metrics = backend_base_uri + "compute_pool_metrics"
+    dataset_cache_metrics = backend_base_uri + "dataset_cache_metrics"
+    firestore_cache_metrics = backend_base_uri + "firestore_cache_metrics"
+    database_metrics = backend_base_uri + "database_metrics"
+    slow_query_report = backend_base_uri + "slow_query_report"
+    vector_tiles = backend_base_uri + "tiles/{layer}/{z}/{x}/{y}.mvt"
 
     @classmethod
     def get_conf(cls):
@@ -10,10 +10,12 @@ from collections import defaultdict
 import base64
 from fastapi import HTTPException
 from fastapi import status
+from firebase_admin import firestore
 import stripe
 from all_types.internal_types import UserId
 from backend_common.auth import (
     load_user_profile,
+    patch_user_profile,
     update_user_profile,
     update_user_profile_settings,
     firebase_db,
@@ -31,6 +33,7 @@ from all_types.request_dtypes import *
 from all_types.response_dtypes import ResLyrMapData, LayerInfo, UserCatalogInfo
 from cost_calculator import calculate_cost
 from geo_std_utils import fetch_lat_lng_bounding_box
+from geojson_serializer import features_json
 from google_api_connector import (
     fetch_cat_google_maps_api,
     fetch_ggl_nearby,
@@ -55,6 +58,7 @@ from storage import (
     get_real_estate_dataset_from_storage,
     get_census_dataset_from_storage,
     get_commercial_properties_dataset_from_storage,
+    stream_storage_dataset,
     fetch_dataset_id,
     load_dataset,
     update_dataset_layer_matching,
@@ -62,7 +66,7 @@ from storage import (
     delete_dataset_layer_matching,
     delete_user_layer_matching,
     fetch_user_catalogs,
-    load_user_layer_matching,
+    load_layer_owner,
     fetch_user_layers,
     load_store_catalogs,
     convert_to_serializable,
@@ -72,6 +76,7 @@ from storage import (
 )
 from boolean_query_processor import reduce_to_single_query
 from popularity_algo import get_plan
+from vector_tiles import invalidate_layer_tiles
 
 logging.basicConfig(
     level=logging.INFO,
@@ -162,6 +167,43 @@ async def fetch_census_realestate(
     return dataset, bknd_dataset_id, next_page_token, plan_name
 
 
+async def _feature_collection_chunks(feature_chunks):
+    """
+    Serializes streamed feature lists into the bytes of one GeoJSON FeatureCollection.
+    """
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    async for features in feature_chunks:
+        if not features:
+            continue
+        yield (b"" if first else b",") + features_json(features)
+        first = False
+    yield b"]}"
+
+
+async def export_dataset(req: ReqFetchDataset):
+    """
+    Resolves the dataset of a fetch_dataset request and returns an async iterator over the
+    GeoJSON bytes of every real estate or commercial feature in the city, read with a
+    server side cursor instead of page by page.
+    """
+    categories = await poi_categories(
+        ReqCityCountry(country_name=req.country_name, city_name=req.city_name)
+    )
+    data_type = determine_data_type(req.boolean_query, categories)
+    if data_type not in ("real_estate", "commercial"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only real estate and commercial datasets can be exported",
+        )
+
+    req._included_types, req._excluded_types = reduce_to_single_query(
+        req.boolean_query
+    )
+    req = fetch_lat_lng_bounding_box(req)
+    return _feature_collection_chunks(stream_storage_dataset(data_type, req))
+
+
 async def fetch_catlog_collection():
     """
     Generates and returns a collection of catalog metadata. This function creates
@@ -452,9 +494,9 @@ async def full_load(
 
         # TODO
         # we need to somehow deduplicate our data before we send it to the user, i'm not sure how
-        user_data = await load_user_profile(req.user_id)
-        user_data["prdcer"]["prdcer_dataset"][f"{plan_name}"] = plan_name
-        await update_user_profile(req.user_id, user_data)
+        await patch_user_profile(
+            req.user_id, {("prdcer", "prdcer_dataset", plan_name): plan_name}
+        )
 
         return progress
 
@@ -569,16 +611,19 @@ async def save_lyr(req: ReqSavePrdcerLyer) -> str:
                 )
 
         # Add the new layer to user profile
-        user_data["prdcer"]["prdcer_lyrs"][req.prdcer_lyr_id] = req.model_dump(
-            exclude={"user_id"}
+        await patch_user_profile(
+            req.user_id,
+            {
+                ("prdcer", "prdcer_lyrs", req.prdcer_lyr_id): req.model_dump(
+                    exclude={"user_id"}
+                )
+            },
         )
-
-        # Save updated user data
-        await update_user_profile(req.user_id, user_data)
         await update_dataset_layer_matching(
             req.prdcer_lyr_id, req.bknd_dataset_id
         )
         await update_user_layer_matching(req.prdcer_lyr_id, req.user_id)
+        await invalidate_layer_tiles(req.prdcer_lyr_id)
     except KeyError as ke:
         logger.error(f"Invalid user data structure for user_id: {req.user_id}")
         raise HTTPException(
@@ -619,12 +664,13 @@ async def delete_layer(req: ReqDeletePrdcerLayer) -> str:
             )
 
         # Delete the layer
-        del user_data["prdcer"]["prdcer_lyrs"][layer_to_delete]
-
-        # Save updated user data
-        await update_user_profile(req.user_id, user_data)
+        await patch_user_profile(
+            req.user_id,
+            {("prdcer", "prdcer_lyrs", layer_to_delete): firestore.DELETE_FIELD},
+        )
         await delete_dataset_layer_matching(layer_to_delete, bknd_dataset_id)
         await delete_user_layer_matching(layer_to_delete)
+        await invalidate_layer_tiles(layer_to_delete)
 
     except KeyError as ke:
         logger.error(f"Invalid user data structure for user_id: {req.user_id}")
@@ -685,8 +731,7 @@ async def fetch_lyr_map_data(req: ReqPrdcerLyrMapData) -> ResLyrMapData:
     Fetches detailed map data for a specific producer layer.
     """
     dataset = {}
-    user_layer_matching = await load_user_layer_matching()
-    layer_owner_id = user_layer_matching.get(req.prdcer_lyr_id)
+    layer_owner_id = await load_layer_owner(req.prdcer_lyr_id)
     layer_owner_data = await load_user_profile(layer_owner_id)
 
     try:
@@ -764,11 +809,10 @@ async def save_prdcer_ctlg(req: ReqSavePrdcerCtlg) -> str:
             ctlg_owner_user_id=req.user_id,
             display_elements=req.display_elements,
         )
-        user_data["prdcer"]["prdcer_ctlgs"][
-            new_ctlg_id
-        ] = new_catalog.model_dump()
-        # serializable_user_data = convert_to_serializable(user_data)
-        await update_user_profile(req.user_id, user_data)
+        await patch_user_profile(
+            req.user_id,
+            {("prdcer", "prdcer_ctlgs", new_ctlg_id): new_catalog.model_dump()},
+        )
         return new_ctlg_id
     except Exception as e:
         raise e
@@ -791,7 +835,10 @@ async def delete_prdcer_ctlg(req: ReqDeletePrdcerCtlg) -> str:
         ]
 
         # Delete the catalog
-        del user_data["prdcer"]["prdcer_ctlgs"][req.prdcer_ctlg_id]
+        await patch_user_profile(
+            req.user_id,
+            {("prdcer", "prdcer_ctlgs", req.prdcer_ctlg_id): firestore.DELETE_FIELD},
+        )
 
         # Delete the thumbnail image from Google Cloud Storage if it exists
         if thumbnail_url:
@@ -805,9 +852,6 @@ async def delete_prdcer_ctlg(req: ReqDeletePrdcerCtlg) -> str:
                 CONF.secrets_dir + CONF.gcloud_bucket_credentials_json_path,
             )
 
-        # Update the user profile after deleting the catalog
-        await update_user_profile(req.user_id, user_data)
-
         return f"Catalog with ID {req.prdcer_ctlg_id} deleted successfully."
 
     except Exception as e:
@@ -976,10 +1020,14 @@ async def save_draft_catalog(req: ReqSavePrdcerLyer) -> str:
                 "thumbnail_url": req.thumbnail_url,
                 "ctlg_owner_user_id": req.user_id,
             }
-            user_data["prdcer"]["draft_ctlgs"][new_ctlg_id] = new_catalog
-
-            serializable_user_data = convert_to_serializable(user_data)
-            await update_user_profile(req.user_id, serializable_user_data)
+            await patch_user_profile(
+                req.user_id,
+                {
+                    ("prdcer", "draft_ctlgs", new_ctlg_id): convert_to_serializable(
+                        new_catalog
+                    )
+                },
+            )
 
             return new_ctlg_id
         else:
@@ -1001,8 +1049,7 @@ async def fetch_gradient_colors() -> List[List]:
 
 async def given_layer_fetch_dataset(layer_id: str):
     # given layer id get dataset
-    user_layer_matching = await load_user_layer_matching()
-    layer_owner_id = user_layer_matching.get(layer_id)
+    layer_owner_id = await load_layer_owner(layer_id)
     layer_owner_data = await load_user_profile(layer_owner_id)
     try:
         layer_metadata = layer_owner_data["prdcer"]["prdcer_lyrs"][layer_id]
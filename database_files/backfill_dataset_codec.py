@@ -0,0 +1,94 @@
+# backfill_dataset_codec.py
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_common.database import Database
+from dataset_codec import CODEC_NAMES, decode_dataset, encode_payload
+from sql_object import SqlObject
+
+
+async def storage_size() -> dict:
+    return dict(await Database.fetchrow(SqlObject.datasets_storage_size))
+
+
+async def sample_read_latency(filenames: list[str]) -> float:
+    """
+    Average milliseconds to fetch and decode one dataset row.
+    """
+    if not filenames:
+        return 0.0
+    started = time.perf_counter()
+    for filename in filenames:
+        record = await Database.fetchrow(SqlObject.load_dataset_with_timestamp, filename)
+        decode_dataset(record)
+    return (time.perf_counter() - started) / len(filenames) * 1000
+
+
+async def backfill(codec: int, batch_size: int, dry_run: bool = False) -> int:
+    """
+    Rewrites every JSONB dataset row as a compressed blob, batch by batch in filename
+    order, each batch in its own transaction. Safe to stop and run again.
+    """
+    converted = 0
+    last_filename = ""
+    while True:
+        records = await Database.fetch(
+            SqlObject.load_datasets_to_backfill, last_filename, batch_size
+        )
+        if not records:
+            break
+        updates = [
+            (record["filename"], None, encode_payload(decode_dataset(record), codec))
+            for record in records
+        ]
+        if not dry_run:
+            async with Database.transaction() as conn:
+                await conn.executemany(SqlObject.update_dataset_response, updates)
+        converted += len(updates)
+        last_filename = records[-1]["filename"]
+        print(f"Converted {converted} datasets (last {last_filename})")
+    return converted
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the JSONB datasets payloads to the compressed dataset codec"
+    )
+    parser.add_argument("--codec", choices=sorted(CODEC_NAMES), default="orjson")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--sample", type=int, default=50, help="rows timed before and after")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        await Database.create_pool()
+        sample = [
+            record["filename"]
+            for record in await Database.fetch(
+                SqlObject.load_datasets_to_backfill, "", args.sample
+            )
+        ]
+        before_size = await storage_size()
+        before_latency = await sample_read_latency(sample)
+
+        converted = await backfill(CODEC_NAMES[args.codec], args.batch_size, args.dry_run)
+
+        after_size = await storage_size()
+        after_latency = await sample_read_latency(sample)
+        print(f"Converted {converted} datasets with {args.codec}+zstd")
+        print(f"Storage before: {before_size}")
+        print(f"Storage after:  {after_size}")
+        print(
+            f"Read latency over {len(sample)} rows: {before_latency:.2f} ms -> {after_latency:.2f} ms"
+        )
+    finally:
+        await Database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,5 @@
 # database_transformation.py
-import json
-from backend_common.database import Database
+from bulk_ingestion import ingest_geojson_features
 from all_types.response_dtypes import GeoJson
 from storage import (
     convert_to_serializable,
@@ -10,50 +9,32 @@ from storage import (
 async def insert_geojson_to_table(
     table_name: str, json_data: dict, id_column: str = "id", data_column: str = "data"
 ) -> list[str]:
-    # Create table if it doesn't exist
-    create_table_query = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            {id_column} TEXT PRIMARY KEY,
-            {data_column} JSONB
-        );
-        """
-    await Database.execute(create_table_query)
-
-    # Prepare the upsert query
-    upsert_query = f"""
-        INSERT INTO {table_name} ({id_column}, {data_column})  
-        VALUES 
-        """
+    """
+    Upserts the point features of a FeatureCollection into an (id, data) table with COPY,
+    see bulk_ingestion. Returns the "<lng>_<lat>" ids that were written.
+    """
+    if json_data["type"] != "FeatureCollection" or not json_data["features"]:
+        raise ValueError("Invalid JSON structure")
 
-    values = []
     inserted_or_updated_ids = []
-    params = []
-
-    if json_data["type"] == "FeatureCollection" and json_data["features"]:
-        for i, feature in enumerate(json_data["features"]):
-            coordinates = feature["geometry"]["coordinates"]
-            if len(coordinates) == 2:
-                custom_id = f"{coordinates[0]}_{coordinates[1]}"
-                feature_json = json.dumps(feature)
-                values.append(f"(${i * 2 + 1}, ${i * 2 + 2})")
-                params.extend([custom_id, feature_json])
-                inserted_or_updated_ids.append(custom_id)
-            else:
-                print(f"Skipping feature with invalid coordinates: {coordinates}")
 
-        if not inserted_or_updated_ids:
-            raise ValueError("No valid features found in the GeoJSON data")
+    def track_ids(features):
+        for feature in features:
+            if len(feature["geometry"]["coordinates"]) == 2:
+                coordinates = feature["geometry"]["coordinates"]
+                inserted_or_updated_ids.append(f"{coordinates[0]}_{coordinates[1]}")
+            yield feature
 
-        # Complete the upsert query
-        upsert_query += ",".join(values)
-        upsert_query += f" ON CONFLICT ({id_column}) DO UPDATE SET {data_column} = EXCLUDED.{data_column}"
-
-        # Execute the query with all the data
-        await Database.execute(upsert_query, *params, save_sql_script=True)
+    await ingest_geojson_features(
+        table_name,
+        track_ids(json_data["features"]),
+        id_column=id_column,
+        data_column=data_column,
+    )
 
-        return inserted_or_updated_ids
-    else:
-        raise ValueError("Invalid JSON structure")
+    if not inserted_or_updated_ids:
+        raise ValueError("No valid features found in the GeoJSON data")
+    return inserted_or_updated_ids
 
 
 def create_feature_collection(rows: list) -> GeoJson:
@@ -0,0 +1,159 @@
+# migrate_layer_matchings.py
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, Iterable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin import firestore
+
+from storage import (
+    DATASET_MATCHING_COLLECTION,
+    LAYER_INDEX_COLLECTION,
+    LEGACY_DATASET_DOCUMENT,
+    LEGACY_INDEX_DOCUMENT,
+    LEGACY_MATCHING_COLLECTION,
+    LEGACY_USER_DOCUMENT,
+    USER_MATCHING_COLLECTION,
+    commit_matching_writes,
+    firebase_db,
+    layer_index_entry,
+    matching_shard_id,
+)
+
+
+def shard_writes(
+    dataset_matching: Dict, user_matching: Dict, sharded_datasets: Iterable[str] = ()
+) -> List[Tuple[str, str, Dict]]:
+    """
+    Writes creating the dataset and user shards of the monolithic documents. Layers are
+    added with ArrayUnion, so the migration can run again after the deploy to pick up
+    layers the old code still wrote to the monolithic documents. records_count is not
+    written for datasets already sharded, their shard is newer.
+    """
+    sharded_datasets = set(sharded_datasets)
+    writes = []
+    for d_id, dataset_info in dataset_matching.items():
+        fields = {"dataset_id": d_id}
+        layers = list(dataset_info.get("prdcer_lyrs", []))
+        if layers:
+            fields["prdcer_lyrs"] = firestore.ArrayUnion(layers)
+        if d_id not in sharded_datasets:
+            fields["records_count"] = dataset_info.get("records_count")
+            fields.setdefault("prdcer_lyrs", [])
+        writes.append((DATASET_MATCHING_COLLECTION, matching_shard_id(d_id), fields))
+
+    layers_by_owner = {}
+    for lyr_id, owner_id in user_matching.items():
+        layers_by_owner.setdefault(owner_id, []).append(lyr_id)
+    for owner_id, layers in layers_by_owner.items():
+        writes.append(
+            (
+                USER_MATCHING_COLLECTION,
+                matching_shard_id(owner_id),
+                {"user_id": owner_id, "prdcer_lyrs": firestore.ArrayUnion(layers)},
+            )
+        )
+    return writes
+
+
+def index_writes(dataset_matching: Dict, user_matching: Dict) -> List[Tuple[str, str, Dict]]:
+    """
+    Writes creating the index document of every layer of the monolithic documents.
+    """
+    entries = {}
+    for d_id, dataset_info in dataset_matching.items():
+        for lyr_id in dataset_info.get("prdcer_lyrs", []):
+            entries.setdefault(lyr_id, {"layer_id": lyr_id}).update(layer_index_entry(d_id))
+    for lyr_id, owner_id in user_matching.items():
+        entries.setdefault(lyr_id, {"layer_id": lyr_id})["owner_id"] = owner_id
+    return [
+        (LAYER_INDEX_COLLECTION, matching_shard_id(lyr_id), fields)
+        for lyr_id, fields in entries.items()
+    ]
+
+
+def missing_layers(
+    dataset_matching: Dict, user_matching: Dict, dataset_shards: Dict, user_shards: Dict
+) -> List[str]:
+    """
+    Layers of the monolithic documents absent from the shards (keyed by dataset / user id).
+    """
+    missing = []
+    for d_id, dataset_info in dataset_matching.items():
+        sharded = set(dataset_shards.get(d_id, {}).get("prdcer_lyrs", []))
+        missing += [lyr_id for lyr_id in dataset_info.get("prdcer_lyrs", []) if lyr_id not in sharded]
+    for lyr_id, owner_id in user_matching.items():
+        if lyr_id not in user_shards.get(owner_id, {}).get("prdcer_lyrs", []):
+            missing.append(lyr_id)
+    return missing
+
+
+async def load_collection(client, collection_name: str, key: str) -> Dict:
+    docs = await client.collection(collection_name).get()
+    return {doc.get(key): doc.to_dict() for doc in docs}
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Split the dataset_matching and user_matching documents into one shard "
+        "per dataset, one per layer owner and one index document per layer"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="count the shard writes without committing them"
+    )
+    parser.add_argument(
+        "--delete-legacy",
+        action="store_true",
+        help="delete the monolithic documents once every layer is found in the shards",
+    )
+    args = parser.parse_args()
+
+    if firebase_db is None:
+        raise SystemExit("Firebase credentials not found, set firebase_sp_path")
+    client = firebase_db.get_async_client()
+    legacy = {}
+    for doc_id in (LEGACY_DATASET_DOCUMENT, LEGACY_USER_DOCUMENT):
+        doc = await client.collection(LEGACY_MATCHING_COLLECTION).document(doc_id).get()
+        legacy[doc_id] = doc.to_dict() if doc.exists else {}
+    dataset_matching = legacy[LEGACY_DATASET_DOCUMENT]
+    user_matching = legacy[LEGACY_USER_DOCUMENT]
+
+    dataset_shards = await load_collection(client, DATASET_MATCHING_COLLECTION, "dataset_id")
+    writes = shard_writes(dataset_matching, user_matching, dataset_shards)
+    writes += index_writes(dataset_matching, user_matching)
+    print(
+        f"{len(dataset_matching)} datasets and {len(user_matching)} layers, "
+        f"{len(writes)} shard and index writes"
+    )
+    if args.dry_run:
+        return
+
+    started = time.perf_counter()
+    await commit_matching_writes(writes)
+    print(f"Committed {len(writes)} writes in {time.perf_counter() - started:.1f}s")
+
+    missing = missing_layers(
+        dataset_matching,
+        user_matching,
+        await load_collection(client, DATASET_MATCHING_COLLECTION, "dataset_id"),
+        await load_collection(client, USER_MATCHING_COLLECTION, "user_id"),
+    )
+    if missing:
+        raise SystemExit(
+            f"{len(missing)} layers missing from the shards, e.g. {missing[:5]}, "
+            "the monolithic documents are kept"
+        )
+    print("Every layer is in the shards")
+
+    if args.delete_legacy:
+        for doc_id in (LEGACY_DATASET_DOCUMENT, LEGACY_USER_DOCUMENT, LEGACY_INDEX_DOCUMENT):
+            await client.collection(LEGACY_MATCHING_COLLECTION).document(doc_id).delete()
+        print("Deleted the monolithic documents")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
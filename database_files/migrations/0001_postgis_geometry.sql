@@ -0,0 +1,39 @@
+-- Point geometry and GiST indexes for the bounding box queries of
+-- census, saudi_real_estate and canada_commercial_properties.
+-- The geometry columns are generated from latitude/longitude so the existing
+-- ingestion keeps working unchanged.
+CREATE EXTENSION IF NOT EXISTS postgis;
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE "schema_marketplace".census
+    ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326)
+    GENERATED ALWAYS AS (
+        ST_SetSRID(ST_MakePoint(longitude::double precision, latitude::double precision), 4326)
+    ) STORED;
+
+-- Census is always filtered by zoom level, btree_gist lets it share the index with the envelope
+CREATE INDEX IF NOT EXISTS census_zoom_level_geom_gist
+    ON "schema_marketplace".census USING GIST (zoom_level, geom)
+    WHERE population IS NOT NULL;
+
+ALTER TABLE "schema_marketplace".saudi_real_estate
+    ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326)
+    GENERATED ALWAYS AS (
+        ST_SetSRID(ST_MakePoint(longitude::double precision, latitude::double precision), 4326)
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS saudi_real_estate_geom_gist
+    ON "schema_marketplace".saudi_real_estate USING GIST (geom);
+
+ALTER TABLE "schema_marketplace".canada_commercial_properties
+    ADD COLUMN IF NOT EXISTS geom geometry(Point, 4326)
+    GENERATED ALWAYS AS (
+        ST_SetSRID(ST_MakePoint(longitude::double precision, latitude::double precision), 4326)
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS canada_commercial_properties_geom_gist
+    ON "schema_marketplace".canada_commercial_properties USING GIST (geom);
+
+ANALYZE "schema_marketplace".census;
+ANALYZE "schema_marketplace".saudi_real_estate;
+ANALYZE "schema_marketplace".canada_commercial_properties;
@@ -0,0 +1,13 @@
+-- Stable ids for keyset pagination of the storage backed datasets.
+-- Pages are read with "id > last id ORDER BY id", so deep pages cost the same as the first one.
+ALTER TABLE "schema_marketplace".saudi_real_estate
+    ADD COLUMN IF NOT EXISTS id BIGINT GENERATED ALWAYS AS IDENTITY;
+
+CREATE UNIQUE INDEX IF NOT EXISTS saudi_real_estate_category_id
+    ON "schema_marketplace".saudi_real_estate (category, id);
+
+ALTER TABLE "schema_marketplace".canada_commercial_properties
+    ADD COLUMN IF NOT EXISTS id BIGINT GENERATED ALWAYS AS IDENTITY;
+
+CREATE UNIQUE INDEX IF NOT EXISTS canada_commercial_properties_id
+    ON "schema_marketplace".canada_commercial_properties (id);
@@ -0,0 +1,4 @@
+-- Compressed payloads written by dataset_codec (version byte + zstd body).
+-- Rows keep either response_data (JSONB) or response_blob, readers accept both.
+ALTER TABLE "schema_marketplace"."datasets"
+    ADD COLUMN IF NOT EXISTS response_blob BYTEA;
@@ -0,0 +1,4 @@
+-- Last time the sweeper tried to refresh a row. Rows whose refresh failed or came back
+-- empty keep their created_at, this keeps them from being selected on every sweep.
+ALTER TABLE "schema_marketplace"."datasets"
+    ADD COLUMN IF NOT EXISTS refresh_attempted_at TIMESTAMP;
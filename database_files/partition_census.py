@@ -0,0 +1,268 @@
+# partition_census.py
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Iterable, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_common.database import Database
+from sql_object import CENSUS_POPULATION_COLUMNS, SqlObject
+
+SCHEMA = '"schema_marketplace"'
+STAGING_TABLE = "census_partitioned"
+OLD_TABLE = "census_unpartitioned"
+PROJECTED_VIEW = "census_projected"
+
+# Not projected by the census queries (location columns are the index keys or derived)
+NOT_PROJECTED = {"latitude", "longitude", "city", "country", "geom"}
+# Postgres allows 32 index columns, two of them are the (latitude, longitude) keys
+MAX_INCLUDED_COLUMNS = 30
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def covering_columns(columns: List[dict], include: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Columns stored in the covering index next to (latitude, longitude): zoom_level and
+    population, which the query filters on, then `include` or the columns the census
+    queries project.
+    """
+    names = [column["column_name"] for column in columns]
+    if include is None:
+        include = CENSUS_POPULATION_COLUMNS
+    unknown = set(include) - set(names)
+    if unknown:
+        raise ValueError(f"Unknown census columns: {', '.join(sorted(unknown))}")
+    covered = ["zoom_level", "population"]
+    covered += [name for name in include if name not in covered and name not in NOT_PROJECTED]
+    if len(covered) > MAX_INCLUDED_COLUMNS:
+        raise ValueError(
+            f"{len(covered)} columns to cover, at most {MAX_INCLUDED_COLUMNS} fit in an index: "
+            "pass the commonly projected ones with --include"
+        )
+    return covered
+
+
+def partitioned_table_ddl(zoom_levels: List[int]) -> List[str]:
+    """
+    Statements creating the zoom_level list partitioned copy of census with one partition
+    per zoom level, plus a default one for NULL and future zoom levels.
+    """
+    staging = f"{SCHEMA}.{STAGING_TABLE}"
+    statements = [
+        f"DROP TABLE IF EXISTS {staging} CASCADE;",
+        f"CREATE TABLE {staging} (LIKE {SCHEMA}.census INCLUDING DEFAULTS INCLUDING GENERATED) "
+        "PARTITION BY LIST (zoom_level);",
+    ]
+    for zoom_level in zoom_levels:
+        statements.append(
+            f"CREATE TABLE {SCHEMA}.{STAGING_TABLE}_z{int(zoom_level)} "
+            f"PARTITION OF {staging} FOR VALUES IN ({int(zoom_level)});"
+        )
+    statements.append(f"CREATE TABLE {SCHEMA}.{STAGING_TABLE}_default PARTITION OF {staging} DEFAULT;")
+    return statements
+
+
+def index_ddl(covered: List[str]) -> List[str]:
+    """
+    The covering (latitude, longitude) index and the GiST index of the envelope queries,
+    created on the parent so every partition gets its own.
+    """
+    staging = f"{SCHEMA}.{STAGING_TABLE}"
+    return [
+        f"CREATE INDEX census_lat_lng_covering ON {staging} (latitude, longitude) "
+        f"INCLUDE ({', '.join(quote(name) for name in covered)}) "
+        "WHERE population IS NOT NULL;",
+        f"CREATE INDEX census_geom_gist ON {staging} USING GIST (geom) "
+        "WHERE population IS NOT NULL;",
+    ]
+
+
+def swap_ddl(zoom_levels: List[int], covered: List[str]) -> List[str]:
+    """
+    Renames the old table out of the way, the partitioned one (and its partitions) to
+    census, and creates the view exposing the covered columns, plus the projected ones
+    left out of the index by --include.
+    """
+    exposed = covered + [name for name in CENSUS_POPULATION_COLUMNS if name not in covered]
+    statements = [
+        f"ALTER TABLE {SCHEMA}.census RENAME TO {OLD_TABLE};",
+        f"ALTER TABLE {SCHEMA}.{STAGING_TABLE} RENAME TO census;",
+    ]
+    for zoom_level in zoom_levels:
+        statements.append(
+            f"ALTER TABLE {SCHEMA}.{STAGING_TABLE}_z{int(zoom_level)} "
+            f"RENAME TO census_z{int(zoom_level)};"
+        )
+    statements += [
+        f"ALTER TABLE {SCHEMA}.{STAGING_TABLE}_default RENAME TO census_default;",
+        f"CREATE OR REPLACE VIEW {SCHEMA}.{PROJECTED_VIEW} AS "
+        f"SELECT latitude, longitude, {', '.join(quote(name) for name in exposed)} "
+        f"FROM {SCHEMA}.census;",
+    ]
+    return statements
+
+
+async def census_columns(table: str = "census") -> List[dict]:
+    return [dict(record) for record in await Database.fetch(SqlObject.table_columns, table)]
+
+
+async def zoom_levels_of(table: str) -> List[int]:
+    records = await Database.fetch(
+        f"SELECT DISTINCT zoom_level FROM {SCHEMA}.{table} "
+        "WHERE zoom_level IS NOT NULL ORDER BY zoom_level;"
+    )
+    return [record["zoom_level"] for record in records]
+
+
+async def copy_rows(columns: List[dict], zoom_levels: List[Optional[int]]) -> int:
+    """
+    Copies census into the partitioned table one zoom level at a time, each in its own
+    transaction. Generated columns are recomputed by the new table.
+    """
+    names = ", ".join(quote(c["column_name"]) for c in columns if not c["is_generated"])
+    copied = 0
+    for zoom_level in [*zoom_levels, None]:
+        started = time.perf_counter()
+        async with Database.transaction() as conn:
+            status = await conn.execute(
+                f"INSERT INTO {SCHEMA}.{STAGING_TABLE} ({names}) "
+                f"SELECT {names} FROM {SCHEMA}.census "
+                "WHERE zoom_level IS NOT DISTINCT FROM $1;",
+                zoom_level,
+            )
+        rows = int(status.split()[-1])
+        copied += rows
+        print(
+            f"Copied {rows} rows of zoom level {zoom_level} "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+    return copied
+
+
+async def _time_query(query: str, args: tuple) -> float:
+    started = time.perf_counter()
+    await Database.fetch(query, *args)
+    return (time.perf_counter() - started) * 1000
+
+
+async def benchmark(old_table: str, zoom_levels: List[int], samples: int) -> List[dict]:
+    """
+    Times the envelope query on the unpartitioned table against the covering query on
+    the partitioned one, over the same random bounding boxes (a tenth of the extent of
+    each zoom level).
+    """
+    old_query = SqlObject.census_features_w_envelope.replace(
+        f"{SCHEMA}.census c", f"{SCHEMA}.{old_table} c"
+    )
+    rng = random.Random(0)
+    results = []
+    for zoom_level in zoom_levels:
+        extent = await Database.fetchrow(
+            f"SELECT min(latitude::double precision) AS min_lat, "
+            f"max(latitude::double precision) AS max_lat, "
+            f"min(longitude::double precision) AS min_lng, "
+            f"max(longitude::double precision) AS max_lng "
+            f"FROM {SCHEMA}.{old_table} WHERE zoom_level = $1;",
+            zoom_level,
+        )
+        if extent["min_lat"] is None:
+            continue
+        lat_span = (extent["max_lat"] - extent["min_lat"]) / 10
+        lng_span = (extent["max_lng"] - extent["min_lng"]) / 10
+        boxes = []
+        for _ in range(samples):
+            lat = rng.uniform(extent["min_lat"], extent["max_lat"] - lat_span)
+            lng = rng.uniform(extent["min_lng"], extent["max_lng"] - lng_span)
+            boxes.append((lat, lat + lat_span, lng, lng + lng_span, zoom_level))
+
+        before = [await _time_query(old_query, box) for box in boxes]
+        after = [await _time_query(SqlObject.census_features_w_bbox, box) for box in boxes]
+        results.append(
+            {
+                "zoom_level": zoom_level,
+                "samples": samples,
+                "before_median_ms": round(statistics.median(before), 2),
+                "after_median_ms": round(statistics.median(after), 2),
+                "before_max_ms": round(max(before), 2),
+                "after_max_ms": round(max(after), 2),
+            }
+        )
+        print(results[-1])
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Move census into zoom_level list partitions with covering bbox indexes"
+    )
+    parser.add_argument(
+        "--include",
+        help="comma separated columns to cover, defaults to the columns the census queries project",
+    )
+    parser.add_argument(
+        "--samples", type=int, default=20, help="bounding boxes timed per zoom level, 0 to skip"
+    )
+    parser.add_argument(
+        "--drop-old", action="store_true", help=f"drop {OLD_TABLE} after the benchmark"
+    )
+    parser.add_argument(
+        "--benchmark-only",
+        action="store_true",
+        help=f"only compare {OLD_TABLE} with the partitioned census",
+    )
+    args = parser.parse_args()
+
+    try:
+        await Database.create_pool()
+        if args.benchmark_only:
+            await benchmark(OLD_TABLE, await zoom_levels_of("census"), args.samples)
+            return
+
+        columns = await census_columns()
+        if not columns:
+            raise SystemExit("schema_marketplace.census not found")
+        include = args.include.split(",") if args.include else None
+        covered = covering_columns(columns, include)
+        zoom_levels = await zoom_levels_of("census")
+        print(f"Zoom levels {zoom_levels}, covering {covered}")
+
+        for statement in partitioned_table_ddl(zoom_levels):
+            await Database.execute(statement)
+        copied = await copy_rows(columns, zoom_levels)
+        for statement in index_ddl(covered):
+            await Database.execute(statement)
+        await Database.execute(f"ANALYZE {SCHEMA}.{STAGING_TABLE};")
+
+        async with Database.transaction() as conn:
+            await conn.execute(f"LOCK TABLE {SCHEMA}.census IN SHARE MODE;")
+            old_count = await conn.fetchval(f"SELECT count(*) FROM {SCHEMA}.census;")
+            if old_count != copied:
+                raise SystemExit(
+                    f"census changed during the copy ({old_count} rows, {copied} copied), run again"
+                )
+            for statement in swap_ddl(zoom_levels, covered):
+                await conn.execute(statement)
+        print(f"census is now partitioned by zoom level, the old table is {OLD_TABLE}")
+        print(
+            "Running workers that fell back to the unpartitioned census probe again every "
+            "CENSUS_PARTITION_RECHECK_SECONDS (300 by default), restart them to switch now"
+        )
+
+        if args.samples:
+            await benchmark(OLD_TABLE, zoom_levels, args.samples)
+        if args.drop_old:
+            await Database.execute(f"DROP TABLE {SCHEMA}.{OLD_TABLE};")
+    finally:
+        await Database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
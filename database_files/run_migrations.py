@@ -0,0 +1,58 @@
+# run_migrations.py
+import asyncio
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_common.database import Database
+from sql_object import SqlObject
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def pending_migrations(applied: set) -> list[str]:
+    """
+    Migration files not applied yet, in the order of their numeric prefix.
+    """
+    return [
+        path
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, "*.sql")))
+        if os.path.basename(path) not in applied
+    ]
+
+
+async def run_migrations() -> list[str]:
+    """
+    Applies every pending migration in its own transaction and records it in
+    schema_migrations, so running it again is a no-op.
+    """
+    await Database.execute(SqlObject.create_schema_migrations_table)
+    applied = {
+        record["name"] for record in await Database.fetch(SqlObject.load_applied_migrations)
+    }
+    done = []
+    for path in pending_migrations(applied):
+        name = os.path.basename(path)
+        with open(path, "r") as f:
+            script = f.read()
+        print(f"Applying migration {name}...")
+        async with Database.transaction() as conn:
+            await conn.execute(script)
+            await conn.execute(SqlObject.record_migration, name)
+        done.append(name)
+    return done
+
+
+async def main():
+    try:
+        await Database.create_pool()
+        done = await run_migrations()
+        print(f"Applied {len(done)} migration(s): {', '.join(done) or 'none'}")
+    finally:
+        await Database.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import asyncpg
+import orjson
+
+from backend_common.database import Database
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "dataset_invalidation"
+
+
+class DatasetCache:
+    """
+    Process wide LRU of the datasets read by load_dataset, bounded by bytes.
+
+    Entries are kept as orjson bytes of the decoded dataset: a hit costs one orjson.loads,
+    the size is exact, and callers get their own copy to modify. Each entry remembers the
+    created_at of its row so expiry keeps working on cached datasets, and is dropped
+    ttl_seconds after it was stored whatever happens to the invalidation channel.
+    store_data_resp invalidates the filename locally and through Postgres NOTIFY, which
+    every worker listening on INVALIDATION_CHANNEL applies to its own cache.
+
+    Readers take a generation() before reading the row and hand it to put: a row read
+    before an invalidation of its filename is not cached. Reads may also be served by a
+    lagging replica, so with replicas a filename is not cached again until
+    Database.replica_max_lag_seconds after its invalidation.
+    Nothing is cached while the listener is disconnected, it reconnects with backoff.
+    """
+
+    # filename -> (created_at, expires at, payload)
+    entries: "OrderedDict[str, Tuple[datetime, float, bytes]]" = OrderedDict()
+    max_bytes: int = int(os.getenv("DATASET_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    ttl_seconds: float = float(os.getenv("DATASET_CACHE_TTL_SECONDS", "900"))
+    current_bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    expirations: int = 0
+    rejected_puts: int = 0
+    listener: Optional[asyncpg.Connection] = None
+    disconnected: bool = False
+    reconnect_task: Optional[asyncio.Task] = None
+    min_reconnect_delay: float = 1.0
+    reconnect_delay: float = min_reconnect_delay
+    max_reconnect_delay: float = 60.0
+    invalidated_at: Dict[str, float] = {}
+    # Generation of the last invalidation of each filename, oldest first. Past
+    # max_tracked_invalidations the oldest are forgotten and forgotten_generation is
+    # used for every filename instead, which only rejects more puts.
+    current_generation: int = 0
+    invalidated_generation: "OrderedDict[str, int]" = OrderedDict()
+    forgotten_generation: int = 0
+    max_tracked_invalidations: int = 100_000
+
+    @classmethod
+    def generation(cls) -> int:
+        """
+        Token to take before reading a row, then to pass to put.
+        """
+        return cls.current_generation
+
+    @classmethod
+    def get(cls, filename: str) -> Optional[Tuple[datetime, dict]]:
+        """
+        Returns (created_at, dataset) of a cached filename, or None.
+        """
+        entry = cls.entries.get(filename)
+        if entry is not None and entry[1] <= time.monotonic():
+            cls._drop(filename)
+            cls.expirations += 1
+            entry = None
+        if entry is None:
+            cls.misses += 1
+            return None
+        cls.entries.move_to_end(filename)
+        cls.hits += 1
+        created_at, _, payload = entry
+        return created_at, orjson.loads(payload)
+
+    @classmethod
+    def put(cls, filename: str, created_at: datetime, dataset: dict, generation: int):
+        """
+        Caches a dataset read after generation() returned `generation`, evicting the least
+        recently used ones past max_bytes. Datasets bigger than the whole budget, read
+        before an invalidation of their filename, or read while disconnected are not cached.
+        """
+        if (
+            cls.disconnected
+            or cls._invalidated_since(filename, generation)
+            or cls._recently_invalidated(filename)
+        ):
+            cls.rejected_puts += 1
+            return
+        payload = orjson.dumps(dataset, default=str)
+        if len(payload) > cls.max_bytes:
+            return
+        cls._drop(filename)
+        cls.entries[filename] = (created_at, time.monotonic() + cls.ttl_seconds, payload)
+        cls.current_bytes += len(payload)
+        while cls.current_bytes > cls.max_bytes:
+            _, (_, _, evicted) = cls.entries.popitem(last=False)
+            cls.current_bytes -= len(evicted)
+            cls.evictions += 1
+
+    @classmethod
+    def _drop(cls, filename: str) -> bool:
+        entry = cls.entries.pop(filename, None)
+        if entry is None:
+            return False
+        cls.current_bytes -= len(entry[2])
+        return True
+
+    @classmethod
+    def _invalidated_since(cls, filename: str, generation: int) -> bool:
+        return cls.invalidated_generation.get(filename, cls.forgotten_generation) > generation
+
+    @classmethod
+    def _recently_invalidated(cls, filename: str) -> bool:
+        if not Database.replica_pools:
+            return False
+        invalidated_at = cls.invalidated_at.get(filename)
+        return invalidated_at is not None and (
+            time.time() - invalidated_at < Database.replica_max_lag_seconds
+        )
+
+    @classmethod
+    def discard(cls, filename: str):
+        """
+        Drops a filename from this worker's cache only.
+        """
+        cls.current_generation += 1
+        cls.invalidated_generation.pop(filename, None)
+        cls.invalidated_generation[filename] = cls.current_generation
+        while len(cls.invalidated_generation) > cls.max_tracked_invalidations:
+            _, cls.forgotten_generation = cls.invalidated_generation.popitem(last=False)
+        if Database.replica_pools:
+            now = time.time()
+            cls.invalidated_at = {
+                name: at
+                for name, at in cls.invalidated_at.items()
+                if now - at < Database.replica_max_lag_seconds
+            }
+            cls.invalidated_at[filename] = now
+        if cls._drop(filename):
+            cls.invalidations += 1
+
+    @classmethod
+    async def invalidate(cls, filename: str):
+        """
+        Drops a filename here and asks the other workers to drop it too.
+        """
+        cls.discard(filename)
+        try:
+            await Database.execute(
+                "SELECT pg_notify($1, $2);", INVALIDATION_CHANNEL, filename
+            )
+        except Exception as e:
+            logger.warning(f"Could not publish dataset invalidation for {filename}: {e}")
+
+    @classmethod
+    def clear(cls):
+        cls.entries.clear()
+        cls.current_bytes = 0
+
+    @classmethod
+    def _on_notification(cls, connection, pid, channel, payload):
+        cls.discard(payload)
+
+    @classmethod
+    async def start_listener(cls):
+        """
+        Opens a dedicated connection listening for invalidations from the other workers.
+        """
+        if cls.listener is not None:
+            return
+        try:
+            listener = await asyncpg.connect(dsn=Database.dsn)
+            await listener.add_listener(INVALIDATION_CHANNEL, cls._on_notification)
+            listener.add_termination_listener(cls._on_listener_closed)
+        except Exception as e:
+            # Without the channel other workers' writes are not seen, nothing is cached
+            # until it is back
+            logger.warning(f"Dataset cache invalidation channel unavailable, retrying: {e}")
+            cls._disconnect()
+            return
+        cls.listener = listener
+        cls.disconnected = False
+        cls.reconnect_delay = cls.min_reconnect_delay
+        logger.info(f"Dataset cache listening on {INVALIDATION_CHANNEL}")
+
+    @classmethod
+    def _disconnect(cls):
+        cls.listener = None
+        cls.disconnected = True
+        cls.clear()
+        if cls.reconnect_task is None or cls.reconnect_task.done():
+            cls.reconnect_task = asyncio.get_event_loop().create_task(cls._reconnect())
+
+    @classmethod
+    async def _reconnect(cls):
+        await asyncio.sleep(cls.reconnect_delay)
+        cls.reconnect_delay = min(cls.reconnect_delay * 2, cls.max_reconnect_delay)
+        cls.reconnect_task = None
+        await cls.start_listener()
+
+    @classmethod
+    def _on_listener_closed(cls, connection):
+        logger.warning("Dataset cache invalidation channel closed, cache cleared")
+        cls._disconnect()
+
+    @classmethod
+    async def stop_listener(cls):
+        task, cls.reconnect_task = cls.reconnect_task, None
+        if task is not None:
+            task.cancel()
+        listener, cls.listener = cls.listener, None
+        if listener is not None:
+            listener.remove_termination_listener(cls._on_listener_closed)
+            await listener.close()
+
+    @classmethod
+    def get_metrics(cls) -> Dict[str, float]:
+        lookups = cls.hits + cls.misses
+        return {
+            "entries": len(cls.entries),
+            "bytes": cls.current_bytes,
+            "max_bytes": cls.max_bytes,
+            "ttl_seconds": cls.ttl_seconds,
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_ratio": cls.hits / lookups if lookups else 0.0,
+            "evictions": cls.evictions,
+            "invalidations": cls.invalidations,
+            "expirations": cls.expirations,
+            "rejected_puts": cls.rejected_puts,
+            "listening": cls.listener is not None,
+        }
+
+
+async def get_dataset_cache_metrics() -> dict:
+    return DatasetCache.get_metrics()
@@ -0,0 +1,185 @@
+import logging
+import os
+from typing import Any, Optional, Tuple
+
+import orjson
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# First byte of every response_blob, tells how the rest was written
+CODEC_ORJSON_ZSTD = 1
+CODEC_MSGPACK_ZSTD = 2
+CODEC_NAMES = {"orjson": CODEC_ORJSON_ZSTD, "msgpack": CODEC_MSGPACK_ZSTD}
+
+ZSTD_LEVEL = int(os.getenv("DATASET_CODEC_LEVEL", "3"))
+
+
+def _json_default(obj: Any) -> Any:
+    return str(obj)
+
+
+def configured_codec() -> Optional[int]:
+    """
+    Codec used for new writes, from DATASET_CODEC ("orjson" or "msgpack").
+    None keeps writing plain JSONB, also when the libraries are missing.
+    """
+    name = os.getenv("DATASET_CODEC", "").strip().lower()
+    if not name:
+        return None
+    codec = CODEC_NAMES.get(name)
+    if codec is None:
+        logger.warning(f"Unknown DATASET_CODEC {name!r}, storing datasets as JSONB")
+        return None
+    if zstandard is None or (codec == CODEC_MSGPACK_ZSTD and msgpack is None):
+        logger.warning(f"DATASET_CODEC {name!r} needs zstandard/msgpack, storing datasets as JSONB")
+        return None
+    return codec
+
+
+def encode_payload(dataset: dict, codec: int) -> bytes:
+    """
+    Version byte followed by the zstd compressed orjson or msgpack body.
+    """
+    if codec == CODEC_ORJSON_ZSTD:
+        body = orjson.dumps(dataset, default=_json_default)
+    elif codec == CODEC_MSGPACK_ZSTD:
+        body = msgpack.packb(dataset, default=_json_default, use_bin_type=True)
+    else:
+        raise ValueError(f"Unknown dataset codec {codec}")
+    return bytes([codec]) + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+def decode_payload(blob: bytes) -> dict:
+    codec = blob[0]
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to read compressed datasets")
+    body = zstandard.ZstdDecompressor().decompress(blob[1:])
+    if codec == CODEC_ORJSON_ZSTD:
+        return orjson.loads(body)
+    if codec == CODEC_MSGPACK_ZSTD:
+        return msgpack.unpackb(body, raw=False)
+    raise ValueError(f"Unknown dataset codec {codec}")
+
+
+def encode_dataset(dataset: dict, codec: Optional[int] = None) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Returns the (response_data, response_blob) pair to store, only one of them is set.
+    """
+    codec = configured_codec() if codec is None else codec
+    if codec is None:
+        return orjson.dumps(dataset, default=_json_default).decode(), None
+    return None, encode_payload(dataset, codec)
+
+
+def decode_dataset(record) -> dict:
+    """
+    Decodes a datasets row whichever column holds it, compressed rows first.
+    """
+    blob = record.get("response_blob")
+    if blob:
+        return decode_payload(bytes(blob))
+    return orjson.loads(record.get("response_data") or "{}")
+
+
+def _sample_dataset(features: int) -> dict:
+    # Shaped like a stored Google nearby search page: photos, reviews and opening hours
+    import random
+    import string
+
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(2000)]
+
+    def token(length: int) -> str:
+        return "".join(rng.choices(string.ascii_letters + string.digits + "-_", k=length))
+
+    def text(count: int) -> str:
+        return " ".join(rng.choices(words, k=count))
+
+    return {
+        "type": "FeatureCollection",
+        "properties": ["name", "rating", "address", "photos", "reviews", "opening_hours"],
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [46.6 + i * 1e-4, 24.7 + i * 1e-4]},
+                "properties": {
+                    "id": f"ChIJ{token(23)}",
+                    "name": f"Coffee shop {i}",
+                    "rating": 4.1 + (i % 9) / 10,
+                    "user_ratings_total": 100 + i,
+                    "address": f"{i} King Fahd Rd, Al Olaya, Riyadh 12214, Saudi Arabia",
+                    "photos": [
+                        {
+                            "name": f"places/ChIJ{token(23)}/photos/{token(180)}",
+                            "widthPx": 4032,
+                            "heightPx": 3024,
+                            "authorAttributions": [
+                                {"displayName": f"Reviewer {j}", "uri": f"https://maps.google.com/maps/contrib/{i}{j}"}
+                            ],
+                        }
+                        for j in range(10)
+                    ],
+                    "reviews": [
+                        {
+                            "rating": 5 - j % 3,
+                            "text": text(rng.randint(10, 80)),
+                            "relativePublishTimeDescription": f"{j + 1} months ago",
+                        }
+                        for j in range(5)
+                    ],
+                    "opening_hours": [f"Day {d}: 6:00 AM – 1:00 AM" for d in range(7)],
+                },
+            }
+            for i in range(features)
+        ],
+    }
+
+
+def _benchmark(features: int, repeat: int) -> list:
+    import time
+
+    dataset = _sample_dataset(features)
+    json_text = orjson.dumps(dataset).decode()
+    results = []
+    for name, encoded in [
+        ("jsonb", (json_text, None)),
+        ("orjson+zstd", encode_dataset(dataset, CODEC_ORJSON_ZSTD)),
+        ("msgpack+zstd", encode_dataset(dataset, CODEC_MSGPACK_ZSTD)),
+    ]:
+        record = {"response_data": encoded[0], "response_blob": encoded[1]}
+        assert decode_dataset(record) == dataset
+        started = time.perf_counter()
+        for _ in range(repeat):
+            decode_dataset(record)
+        results.append(
+            {
+                "codec": name,
+                "bytes": len(encoded[0].encode()) if encoded[0] else len(encoded[1]),
+                "decode_ms": round((time.perf_counter() - started) / repeat * 1000, 3),
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Payload size and decode time of the dataset codecs on a Google-like page"
+    )
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for result in _benchmark(args.features, args.repeat):
+        print(result)
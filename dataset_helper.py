@@ -3,7 +3,7 @@ import json
 import random
 import re
 from collections import defaultdict
-from backend_common.auth import firebase_db
+from backend_common.auth import firebase_db, patch_user_profile
 from google_api_connector import fetch_ggl_nearby
 from all_types.request_dtypes import ReqFetchDataset
 import logging
@@ -116,6 +116,5 @@ async def excecute_dataset_plan(
     await firebase_db.get_async_client().collection("plan_progress").document(
         plan_name
     ).set({"progress": 100, "completed_at": datetime.now()}, merge=True)
-    await firebase_db.get_async_client().collection("all_user_profiles").document(
-        req.user_id
-    ).set({"prdcer_lyrs": {layer_id: {"progress": progress}}}, merge=True)
+    # Through the coalescer so the cached profile is patched too
+    await patch_user_profile(req.user_id, {("prdcer_lyrs", layer_id, "progress"): progress})
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+from pydantic import ValidationError
+
+from all_types.request_dtypes import ReqFetchDataset
+from backend_common.database import Database
+from backend_common.logging_wrapper import apply_decorator_to_module
+from dataset_cache import DatasetCache
+from geo_std_utils import fetch_lat_lng_bounding_box
+from google_api_connector import query_ggl
+from sql_object import SqlObject
+from storage import (
+    DATASET_MAX_AGE_DAYS,
+    DATASET_REFRESH_AFTER_DAYS,
+    make_dataset_filename,
+    revalidating_datasets,
+)
+
+logger = logging.getLogger(__name__)
+
+# Any constant shared by the workers, only the one holding it sweeps
+SWEEPER_LOCK_ID = 7_340_090
+
+
+class DatasetSweeper:
+    """
+    Keeps the datasets table fresh outside the request path (stale-while-revalidate).
+    Rows older than DATASET_REFRESH_AFTER_DAYS are fetched again from their stored request
+    before they reach DATASET_MAX_AGE_DAYS, requests keep being served the old row meanwhile.
+    Each row is attempted at most once per retry_hours. Rows that could not be refreshed
+    and are past the maximum age are deleted in batches.
+    """
+
+    task: Optional[asyncio.Task] = None
+    interval_seconds: int = int(os.getenv("DATASET_SWEEP_INTERVAL_SECONDS", str(6 * 3600)))
+    batch_size: int = int(os.getenv("DATASET_SWEEP_BATCH_SIZE", "500"))
+    max_refreshes: int = int(os.getenv("DATASET_SWEEP_MAX_REFRESHES", "50"))
+    # Rows attempted more recently are skipped, whether their refresh worked or not
+    retry_hours: float = float(os.getenv("DATASET_SWEEP_RETRY_HOURS", "24"))
+    last_run: Dict[str, float] = {}
+
+    @classmethod
+    def start(cls):
+        if cls.task is None or cls.task.done():
+            cls.task = asyncio.create_task(cls.run_forever())
+
+    @classmethod
+    async def stop(cls):
+        task, cls.task = cls.task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    @classmethod
+    async def run_forever(cls):
+        while True:
+            try:
+                await cls.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Dataset sweep failed: {e}")
+            await asyncio.sleep(cls.interval_seconds)
+
+    @classmethod
+    async def sweep(cls) -> Dict[str, float]:
+        """
+        One pass: refresh the rows due for it, then delete the expired leftovers.
+        Skipped when another worker holds the sweeper lock.
+        """
+        started = time.time()
+        requests = await cls.claim_due()
+        if requests is None:
+            return {"skipped": True}
+        refreshed, failed = await cls.refresh_requests(requests)
+        deleted = await cls.delete_expired()
+
+        cls.last_run = {
+            "started_at": started,
+            "duration_seconds": time.time() - started,
+            "refreshed": refreshed,
+            "refresh_failed": failed,
+            "deleted": deleted,
+        }
+        logger.info(f"Dataset sweep: {cls.last_run}")
+        return cls.last_run
+
+    @classmethod
+    async def claim_due(cls) -> Optional[List[ReqFetchDataset]]:
+        """
+        Picks the stored requests of the oldest rows due for refresh, once per request,
+        and marks the rows examined as attempted so the next sweeps move past them even
+        when their refresh fails. Part datasets share the request of their combined
+        dataset and are refreshed with it.
+
+        The sweeper lock is only held while claiming, returns None when another worker
+        holds it.
+        """
+        now = datetime.utcnow()
+        refresh_before = now - timedelta(days=DATASET_REFRESH_AFTER_DAYS)
+        retry_before = now - timedelta(hours=cls.retry_hours)
+        async with Database.connection() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1);", SWEEPER_LOCK_ID):
+                return None
+            try:
+                records = await conn.fetch(
+                    SqlObject.load_datasets_due_for_refresh,
+                    refresh_before,
+                    retry_before,
+                    cls.batch_size,
+                )
+                requests, attempted = cls.requests_from_records(records)
+                if attempted:
+                    await conn.execute(
+                        SqlObject.mark_datasets_refresh_attempted, attempted, now
+                    )
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1);", SWEEPER_LOCK_ID)
+        return requests
+
+    @classmethod
+    def requests_from_records(cls, records) -> Tuple[List[ReqFetchDataset], List[str]]:
+        """
+        Returns the distinct requests of the records, at most max_refreshes, and the
+        filenames of the records examined to find them.
+        """
+        requests = {}
+        attempted = []
+        for record in records:
+            if len(requests) >= cls.max_refreshes:
+                break
+            attempted.append(record["filename"])
+            try:
+                req = ReqFetchDataset.model_validate(orjson.loads(record["request_data"]))
+            except (ValidationError, orjson.JSONDecodeError, TypeError):
+                continue
+            key = (make_dataset_filename(req), req.search_type)
+            requests.setdefault(key, req)
+        return list(requests.values()), attempted
+
+    @classmethod
+    async def refresh_requests(cls, requests: List[ReqFetchDataset]) -> Tuple[int, int]:
+        """
+        Runs each request again against Google, outside of any database connection.
+        """
+        refreshed = failed = 0
+        for req in requests:
+            token = revalidating_datasets.set(True)
+            try:
+                req = fetch_lat_lng_bounding_box(req)
+                dataset = await query_ggl(req, req.search_type)
+                if isinstance(dataset, dict):
+                    refreshed += 1
+                else:
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Could not refresh dataset {make_dataset_filename(req)}: {e}")
+            finally:
+                revalidating_datasets.reset(token)
+        return refreshed, failed
+
+    @classmethod
+    async def refresh_due(cls) -> Tuple[int, int]:
+        """Claims and refreshes the rows due, without deleting the expired ones."""
+        requests = await cls.claim_due()
+        if requests is None:
+            return 0, 0
+        return await cls.refresh_requests(requests)
+
+    @classmethod
+    async def delete_expired(cls) -> int:
+        """
+        Deletes rows past the maximum age in batches, each batch its own statement.
+        """
+        expired_before = datetime.utcnow() - timedelta(days=DATASET_MAX_AGE_DAYS)
+        deleted = 0
+        while True:
+            records = await Database.fetch(
+                SqlObject.delete_expired_datasets, expired_before, cls.batch_size
+            )
+            for record in records:
+                await DatasetCache.invalidate(record["filename"])
+            deleted += len(records)
+            if len(records) < cls.batch_size:
+                return deleted
+
+
+apply_decorator_to_module(logger)(__name__)
@@ -20,7 +20,7 @@ import json
 from backend_common.background import set_background_tasks
 from fastapi.middleware.cors import CORSMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from pydantic import ValidationError
 import asyncio
@@ -64,12 +64,15 @@ from backend_common.auth import (
     create_firebase_user,
     login_user,
     my_verify_id_token,
+    verify_admin_token,
     reset_password,
     confirm_reset,
     change_password,
     refresh_id_token,
     change_email,
     firebase_db,
+    FieldPatchCoalescer,
+    get_firestore_cache_metrics,
     JWTBearer,
     create_user_profile,
 )
@@ -113,6 +116,7 @@ from data_fetcher import (
     get_user_profile,
     # fetch_nearest_points_Gmap,
     fetch_dataset,
+    export_dataset,
     load_area_intelligence_categories,
     update_profile,
     load_distance_drive_time_polygon,
@@ -132,7 +136,9 @@ from backend_common.dtypes.stripe_dtypes import (
     TopUpWalletReq,
     DeductWalletReq,
 )
-from backend_common.database import Database
+from backend_common.database import Database, get_database_metrics
+from backend_common.query_diagnostics import SlowQueryExplainer, get_slow_query_report
+from sql_object import SqlObject
 from backend_common.logging_wrapper import log_and_validate
 from backend_common.stripe_backend import (
     create_stripe_product,
@@ -164,7 +170,13 @@ from recoler_filter import (
     filter_based_on,
 )
 from storage import fetch_intelligence_by_viewport
+from viewport_engine import ViewportEngine
+from vector_tiles import get_vector_tile
 from sales_man_problem import get_clusters_for_sales_man
+from backend_common.compute_pool import ComputePool, get_compute_pool_metrics
+from dataset_cache import DatasetCache, get_dataset_cache_metrics
+from dataset_sweeper import DatasetSweeper
+from page_cursor import require_signing_key
 
 # TODO: Add stripe secret key
 
@@ -250,13 +262,25 @@ async def background_tasks_middleware(request, call_next):
 
 @app.on_event("startup")
 async def startup_event():
+    require_signing_key()
+    Database.register_statements(SqlObject)
     await Database.create_pool()
+    SlowQueryExplainer.start()
     await firebase_db.initialize_all()
+    await ViewportEngine.preload()
+    await DatasetCache.start_listener()
+    DatasetSweeper.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await FieldPatchCoalescer.flush_all()
+    await firebase_db.close_invalidation_channel()
+    await DatasetSweeper.stop()
+    await DatasetCache.stop_listener()
+    await SlowQueryExplainer.stop()
     await Database.close_pool()
+    await asyncio.get_event_loop().run_in_executor(None, ComputePool.shutdown)
     # Run cleanup in a thread to not block
     await asyncio.get_event_loop().run_in_executor(None, firebase_db.cleanup)
     # Wait a moment to ensure threads are cleaned up
@@ -355,6 +379,16 @@ async def fetch_dataset_ep(req: ReqModel[ReqFetchDataset], request: Request):
     return response
 
 
+@app.post(
+    CONF.export_dataset,
+    dependencies=[Depends(JWTBearer())],
+)
+async def export_dataset_ep(req: ReqModel[ReqFetchDataset], request: Request):
+    # Streamed as is, the whole city does not fit in a ResModel envelope
+    chunks = await export_dataset(req.request_body)
+    return StreamingResponse(chunks, media_type="application/geo+json")
+
+
 @app.post(
     CONF.process_llm_query,
     response_model=ResModel[ResLLMFetchDataset],
@@ -1211,3 +1245,106 @@ async def ep_fetch_clusters_for_sales_man(
         wrap_output=True,
     )
     return response
+
+
+@app.get(
+    CONF.compute_pool_metrics,
+    response_model=ResModel[dict],
+    dependencies=[Depends(my_verify_id_token)],
+)
+async def ep_compute_pool_metrics():
+    response = await request_handling(
+        None,
+        None,
+        ResModel[dict],
+        get_compute_pool_metrics,
+        wrap_output=True,
+    )
+    return response
+
+
+@app.get(
+    CONF.dataset_cache_metrics,
+    response_model=ResModel[dict],
+    dependencies=[Depends(my_verify_id_token)],
+)
+async def ep_dataset_cache_metrics():
+    response = await request_handling(
+        None,
+        None,
+        ResModel[dict],
+        get_dataset_cache_metrics,
+        wrap_output=True,
+    )
+    return response
+
+
+@app.get(
+    CONF.firestore_cache_metrics,
+    response_model=ResModel[dict],
+    dependencies=[Depends(my_verify_id_token)],
+)
+async def ep_firestore_cache_metrics():
+    response = await request_handling(
+        None,
+        None,
+        ResModel[dict],
+        get_firestore_cache_metrics,
+        wrap_output=True,
+    )
+    return response
+
+
+@app.get(
+    CONF.database_metrics,
+    response_model=ResModel[dict],
+    dependencies=[Depends(my_verify_id_token)],
+)
+async def ep_database_metrics():
+    response = await request_handling(
+        None,
+        None,
+        ResModel[dict],
+        get_database_metrics,
+        wrap_output=True,
+    )
+    return response
+
+
+@app.get(
+    CONF.slow_query_report,
+    response_model=ResModel[dict],
+    dependencies=[Depends(verify_admin_token)],
+)
+async def ep_slow_query_report():
+    response = await request_handling(
+        None,
+        None,
+        ResModel[dict],
+        get_slow_query_report,
+        wrap_output=True,
+    )
+    return response
+
+
+@app.get(CONF.vector_tiles)
+async def ep_vector_tile(
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    fields: Optional[str] = None,
+    decoded_token: dict = Depends(my_verify_id_token),
+):
+    """
+    Mapbox Vector Tile of an intelligence layer (population, income, intelligence) or of a
+    producer layer of the caller. `fields` is an optional comma separated list of
+    attributes to keep.
+    """
+    attributes = fields.split(",") if fields else None
+    tile = await get_vector_tile(layer, z, x, y, decoded_token["uid"], attributes)
+    return Response(
+        content=tile,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": "private, max-age=3600"},
+    )
@@ -0,0 +1,189 @@
+import logging
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import orjson
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return str(obj)
+
+
+def parse_json_column(values: Sequence[Optional[str]]) -> list:
+    """
+    Parses a column of JSON texts (ST_AsGeoJSON output, jsonb properties) with a single
+    orjson call on the joined array instead of one call per row.
+    """
+    if not values:
+        return []
+    return orjson.loads("[" + ",".join(value or "null" for value in values) + "]")
+
+
+def records_to_columns(records: Sequence) -> Dict[str, list]:
+    """
+    Transposes asyncpg records (or dicts) into a dict of column lists.
+    """
+    if not records:
+        return {}
+    values = zip(*(record.values() for record in records))
+    return dict(zip(records[0].keys(), map(list, values)))
+
+
+def _property_rows(
+    properties: Dict[str, Sequence], rows: int, drop_nulls: bool
+) -> List[dict]:
+    names = list(properties)
+    if not names:
+        return [{} for _ in range(rows)]
+    if drop_nulls:
+        return [
+            {name: value for name, value in zip(names, row) if value is not None}
+            for row in zip(*properties.values())
+        ]
+    return [dict(zip(names, row)) for row in zip(*properties.values())]
+
+
+def features_from_geometries(
+    geometries: Sequence[dict],
+    properties: Dict[str, Sequence],
+    drop_nulls: bool = False,
+) -> List[dict]:
+    """
+    Builds GeoJSON features from a column of geometries and a dict of property columns.
+    """
+    rows = _property_rows(properties, len(geometries), drop_nulls)
+    return [
+        {"type": "Feature", "geometry": geometry, "properties": row}
+        for geometry, row in zip(geometries, rows)
+    ]
+
+
+def features_from_records(
+    records: Sequence,
+    geometry_column: str = "geometry",
+    properties_column: Optional[str] = None,
+    exclude: Iterable[str] = (),
+    drop_nulls: bool = False,
+) -> List[dict]:
+    """
+    Builds GeoJSON features from query records whose `geometry_column` holds GeoJSON text.
+    Properties are either the JSON object in `properties_column` or every other column
+    except the ones in `exclude`.
+    """
+    columns = records_to_columns(records)
+    if not columns:
+        return []
+    geometries = parse_json_column(columns.pop(geometry_column))
+    if properties_column is not None:
+        rows = parse_json_column(columns[properties_column])
+        if drop_nulls:
+            rows = [
+                {name: value for name, value in row.items() if value is not None}
+                for row in rows
+            ]
+        return [
+            {"type": "Feature", "geometry": geometry, "properties": row}
+            for geometry, row in zip(geometries, rows)
+        ]
+    for name in exclude:
+        columns.pop(name, None)
+    return features_from_geometries(geometries, columns, drop_nulls)
+
+
+def features_json(features: List[dict]) -> bytes:
+    """
+    Comma separated JSON of the features, without the enclosing brackets, so chunks can
+    be streamed into one FeatureCollection.
+    """
+    return orjson.dumps(features, default=_json_default)[1:-1]
+
+
+def _iterrows_features(df: pd.DataFrame) -> List[dict]:
+    # The former storage converter, kept for the benchmark
+    features = []
+    for _, row in df.iterrows():
+        coordinates = [float(row["longitude"]), float(row["latitude"])]
+        properties = row.drop(["latitude", "longitude", "city"]).to_dict()
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": coordinates},
+                "properties": properties,
+            }
+        )
+    return features
+
+
+def _benchmark(rows: int) -> Dict[str, float]:
+    import json
+    import time
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "url": [f"https://example.com/{i}" for i in range(rows)],
+            "price": rng.integers(10_000, 5_000_000, rows),
+            "city": "Riyadh",
+            "latitude": rng.uniform(24.4, 25.0, rows),
+            "longitude": rng.uniform(46.4, 47.0, rows),
+            "category": rng.choice(["villa_for_sale", "apartment_for_rent"], rows),
+        }
+    )
+
+    started = time.perf_counter()
+    old = json.dumps(
+        {"type": "FeatureCollection", "features": _iterrows_features(df)},
+        default=str,
+    ).encode()
+    iterrows_seconds = time.perf_counter() - started
+
+    # Records as the envelope queries return them, the geometry as GeoJSON text
+    records = [
+        {
+            "geometry": f'{{"type":"Point","coordinates":[{lng},{lat}]}}',
+            "url": url,
+            "price": price,
+            "category": category,
+        }
+        for lng, lat, url, price, category in zip(
+            df["longitude"].tolist(),
+            df["latitude"].tolist(),
+            df["url"].tolist(),
+            df["price"].tolist(),
+            df["category"].tolist(),
+        )
+    ]
+    started = time.perf_counter()
+    new = (
+        b'{"type":"FeatureCollection","features":['
+        + features_json(features_from_records(records))
+        + b"]}"
+    )
+    vectorized_seconds = time.perf_counter() - started
+
+    assert json.loads(old) == orjson.loads(new)
+    return {
+        "rows": rows,
+        "iterrows_seconds": round(iterrows_seconds, 3),
+        "vectorized_seconds": round(vectorized_seconds, 3),
+        "speedup": round(iterrows_seconds / vectorized_seconds, 1),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compare the iterrows GeoJSON conversion with the vectorized serializer"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        print(_benchmark(rows))
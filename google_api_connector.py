@@ -28,6 +28,7 @@ from storage import (
     make_dataset_filename,
     make_dataset_filename_part,
     store_data_resp,
+    store_data_resps,
     store_place_details,
     load_place_details
 )
@@ -52,13 +53,23 @@ for category in raw_popularity_data.values():
     POPULARITY_DATA.update(category)
 
 
-async def process_and_store_to_db(req, dataset_id, query_results):
+async def format_ggl_response(req, query_results):
     format_response = await MapBoxConnector.new_ggl_to_boxmap(
         query_results, req.radius
     )
-    format_response = convert_strings_to_ints(format_response)
-    await store_data_resp(req, format_response, dataset_id)
-    return format_response
+    return convert_strings_to_ints(format_response)
+
+
+async def process_and_store_to_db(req, query_results_by_dataset_id):
+    """
+    Formats the Google results of several dataset ids and stores them in one bulk write.
+    """
+    formatted = {}
+    for dataset_id, query_results in query_results_by_dataset_id.items():
+        if query_results:
+            formatted[dataset_id] = await format_ggl_response(req, query_results)
+    await store_data_resps(req, formatted)
+    return formatted
 
 
 async def fetch_text_search_ggl_maps_api(
@@ -152,14 +163,11 @@ async def fetch_text_search_ggl_maps_api(
             k: v for d in all_missing_responses for k, v in d.items()
         }
 
-        for dataset_id, query_results in all_missing_query_results.items():
-            # convert the results into the format required by MapBoxConnector
-            # for each result, save the part seperately in db
-            if query_results:
-                format_response = await process_and_store_to_db(
-                    req, dataset_id, query_results
-                )
-                separte_parts_datasets[dataset_id] = format_response
+        # convert the results into the format required by MapBoxConnector
+        # and save every part seperately in db, in one write
+        separte_parts_datasets.update(
+            await process_and_store_to_db(req, all_missing_query_results)
+        )
 
     # recreate the partial dataset from the include and exclude datasets and save into db
     datasets = {}
@@ -290,15 +298,17 @@ async def fetch_cat_google_maps_api(
 
             all_query_results = await asyncio.gather(*query_tasks)
 
-            for (dataset_id, included, excluded), query_results in zip(
-                missing_queries, all_query_results
-            ):
-
-                if query_results:
-                    format_response = await process_and_store_to_db(
-                        req, dataset_id, query_results
-                    )
-                    datasets[dataset_id] = format_response
+            datasets.update(
+                await process_and_store_to_db(
+                    req,
+                    {
+                        dataset_id: query_results
+                        for (dataset_id, _, _), query_results in zip(
+                            missing_queries, all_query_results
+                        )
+                    },
+                )
+            )
 
         # Initialize the combined dictionary
         combined = {
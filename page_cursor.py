@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+from typing import Any, Optional
+
+import orjson
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+CURSOR_VERSION = 1
+
+# Shared by every worker, a token is redeemed by whichever worker gets the next request
+_signing_key = os.getenv("CURSOR_SIGNING_KEY", "").encode()
+
+
+def require_signing_key():
+    """
+    Called at startup: page tokens can't be signed without CURSOR_SIGNING_KEY.
+    """
+    if not _signing_key:
+        raise RuntimeError("CURSOR_SIGNING_KEY must be set to sign page tokens")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(payload: bytes) -> bytes:
+    require_signing_key()
+    return hmac.new(_signing_key, payload, hashlib.sha256).digest()[:16]
+
+
+def cursor_scope(*parts: Any) -> str:
+    """
+    Short fingerprint of what a cursor pages through (table, filters, bounding box), so a
+    token cannot be replayed against another query.
+    """
+    return hashlib.sha256(orjson.dumps(parts, default=str)).hexdigest()[:16]
+
+
+def encode_cursor(scope: str, last_key: Any) -> str:
+    """
+    Signed page token pointing after `last_key` in the keyset order of `scope`.
+    """
+    payload = orjson.dumps({"v": CURSOR_VERSION, "s": scope, "k": last_key})
+    return f"{_b64encode(payload)}.{_b64encode(_signature(payload))}"
+
+
+def decode_cursor(token: Optional[str], scope: str) -> Optional[Any]:
+    """
+    Returns the last key stored in a page token, or None for the first page.
+    Tampered tokens, tokens from another query and tokens of an older format are rejected.
+    """
+    if not token:
+        return None
+    try:
+        encoded_payload, encoded_signature = token.split(".", 1)
+        payload = _b64decode(encoded_payload)
+        valid = hmac.compare_digest(_signature(payload), _b64decode(encoded_signature))
+        cursor = orjson.loads(payload) if valid else None
+    except (ValueError, orjson.JSONDecodeError):
+        cursor = None
+
+    if (
+        not isinstance(cursor, dict)
+        or cursor.get("v") != CURSOR_VERSION
+        or cursor.get("s") != scope
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page token"
+        )
+    return cursor["k"]
@@ -7,6 +7,10 @@ from utils import make_ggl_layer_filename
 from use_json import use_json
 import asyncio
 from backend_common.database import Database
+from backend_common.compute_pool import run_in_compute_pool
+from dataset_codec import decode_dataset, encode_dataset
+from dataset_cache import DatasetCache
+from sql_object import SqlObject
 import json
 import numpy as np
 import pandas as pd
@@ -140,7 +144,7 @@ async def process_plan_popularity(plan_name: str):
 
         for result in results:
             try:
-                response_data = json.loads(result["response_data"])
+                response_data = decode_dataset(result)
                 features = response_data.get("features", [])
                 if not features:
                     print(f"No features found in dataset: {result['filename']}")
@@ -179,7 +183,7 @@ async def process_plan_popularity(plan_name: str):
 
         for result in results:
             try:
-                response_data = json.loads(result["response_data"])
+                response_data = decode_dataset(result)
                 features = response_data.get("features", [])
 
                 updated_features = []
@@ -210,15 +214,13 @@ async def process_plan_popularity(plan_name: str):
                 if "popularity_score_category" not in new_response_data["properties"]:
                     new_response_data["properties"].append("popularity_score_category")
 
-                update_query = """
-                    UPDATE schema_marketplace.datasets 
-                    SET response_data = $1
-                    WHERE filename = $2
-                """
-
+                # Written back with the same codec as new datasets
                 await Database.execute(
-                    update_query, json.dumps(new_response_data), result["filename"]
+                    SqlObject.update_dataset_response,
+                    result["filename"],
+                    *encode_dataset(new_response_data),
                 )
+                await DatasetCache.invalidate(result["filename"])
                 success_count += 1
                 print(
                     f"Updated database entry for {result['filename']} - {len(updated_features)} features updated"
@@ -465,6 +467,11 @@ def process_circles(input_strings):
 async def create_plan(lng, lat, radius, boolean_query, text_search):
     text = boolean_query + "_" + text_search
     text = text.strip("_")
+    # Building and filtering the circle hierarchy is pure CPU work, run it in the compute pool
+    return await run_in_compute_pool(build_plan, lng, lat, radius, text)
+
+
+def build_plan(lng, lat, radius, text):
     counter = Counter()
     circle_hierarchy = Circle(
         (lng, lat), radius / 1000, 1, id="1", counter=counter, is_center=True
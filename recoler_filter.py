@@ -13,6 +13,8 @@ from geopy.distance import geodesic
 import numpy as np
 import uuid
 
+from backend_common.compute_pool import run_in_compute_pool
+
 
 from all_types.response_dtypes import (
     ResGradientColorBasedOnZone,
@@ -88,40 +90,90 @@ async def calculate_nearest_points_drive_time(
     return results
 
 
-def average_metric_of_surrounding_points(
-    color_based_on, point, based_on_dataset, radius
-):
-    lat, lon = (
-        point["geometry"]["coordinates"][1],
-        point["geometry"]["coordinates"][0],
+def surrounding_metric_inputs(
+    color_based_on: str, based_on_dataset: dict
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[int, Any]]:
+    """
+    Flattens the based on layer into coordinate and value arrays so the influence
+    computation can be shipped to the compute pool cheaply.
+    Points carrying the property with an empty or boolean value keep a NaN value:
+    they count as nearby points but are left out of the average.
+    Values that don't convert to float are returned by index, they only fail the
+    computation when they are near a change point.
+    """
+    lats, lons, values, unparsable = [], [], [], {}
+    for point in based_on_dataset["features"]:
+        if color_based_on not in point["properties"]:
+            continue
+        value = point["properties"][color_based_on]
+        lons.append(point["geometry"]["coordinates"][0])
+        lats.append(point["geometry"]["coordinates"][1])
+        if not str(value).strip() or isinstance(value, bool):
+            values.append(np.nan)
+            continue
+        try:
+            values.append(float(value))
+        except (TypeError, ValueError):
+            unparsable[len(values)] = value
+            values.append(np.nan)
+    return (
+        np.asarray(lats, dtype=float),
+        np.asarray(lons, dtype=float),
+        np.asarray(values, dtype=float),
+        unparsable,
     )
 
-    nearby_metric_value = []
 
-    for point_2 in based_on_dataset["features"]:
-        if color_based_on not in point_2["properties"]:
-            continue
-
-        distance = geodesic(
-            (lat, lon),
-            (
-                point_2["geometry"]["coordinates"][1],
-                point_2["geometry"]["coordinates"][0],
-            ),
-        ).meters
+def compute_influence_scores(
+    change_lats: np.ndarray,
+    change_lons: np.ndarray,
+    based_lats: np.ndarray,
+    based_lons: np.ndarray,
+    based_values: np.ndarray,
+    unparsable: Dict[int, Any],
+    radius: float,
+) -> List[Any]:
+    """
+    Average of the values of the based on points within `radius` meters (geodesic) of
+    every change point, None when there are none.
+    A vectorized haversine pass settles the clear cases and geodesic is only evaluated
+    for the pairs whose distance is within 2% of the radius.
+    A nearby value that doesn't convert to float raises the error of its conversion.
+    """
+    scores = []
+    if len(based_lats) == 0:
+        return [None] * len(change_lats)
+
+    unparsable_idx = np.fromiter(unparsable, dtype=np.int64, count=len(unparsable))
+    based_lat_rad = np.radians(based_lats)
+    based_lon_rad = np.radians(based_lons)
+    for lat, lon in zip(change_lats, change_lons):
+        lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+        a = (
+            np.sin((based_lat_rad - lat_rad) / 2) ** 2
+            + np.cos(lat_rad)
+            * np.cos(based_lat_rad)
+            * np.sin((based_lon_rad - lon_rad) / 2) ** 2
+        )
+        approx = 2 * 6371008.8 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
 
-        if distance <= radius:
-            nearby_metric_value.append(point_2["properties"][color_based_on])
+        within = approx <= radius * 0.98
+        for idx in np.flatnonzero((approx > radius * 0.98) & (approx <= radius * 1.02)):
+            within[idx] = (
+                geodesic((lat, lon), (based_lats[idx], based_lons[idx])).meters
+                <= radius
+            )
 
-    if nearby_metric_value:
-        cleaned_list = [
-            float(x)
-            for x in nearby_metric_value
-            if str(x).strip() and not isinstance(x, bool)
-        ]
-        return np.mean(cleaned_list)
-    else:
-        return None
+        if not within.any():
+            scores.append(None)
+            continue
+        nearby_unparsable = unparsable_idx[within[unparsable_idx]]
+        if len(nearby_unparsable):
+            float(unparsable[int(nearby_unparsable[0])])
+        nearby_values = based_values[within]
+        nearby_values = nearby_values[~np.isnan(nearby_values)]
+        scores.append(float(np.mean(nearby_values)) if len(nearby_values) else np.nan)
+    return scores
 
 
 def filter_locations_by_drive_time(
@@ -706,16 +758,27 @@ async def process_color_based_on(
     else:
 
         # Calculate influence scores for change_layer_dataset and store them
+        # The distance work runs in the compute pool on plain coordinate arrays
+        change_features = change_layer_dataset["features"]
+        surrounding_metric_avgs = await run_in_compute_pool(
+            compute_influence_scores,
+            np.array(
+                [point["geometry"]["coordinates"][1] for point in change_features],
+                dtype=float,
+            ),
+            np.array(
+                [point["geometry"]["coordinates"][0] for point in change_features],
+                dtype=float,
+            ),
+            *surrounding_metric_inputs(req.color_based_on, based_on_layer_dataset),
+            req.coverage_value,
+        )
         influence_scores = []
         point_influence_map = {}
-        for change_point in change_layer_dataset["features"]:
+        for change_point, surrounding_metric_avg in zip(
+            change_features, surrounding_metric_avgs
+        ):
             change_point["id"] = str(uuid.uuid4())
-            surrounding_metric_avg = average_metric_of_surrounding_points(
-                req.color_based_on,
-                change_point,
-                based_on_layer_dataset,
-                req.coverage_value,
-            )
             if surrounding_metric_avg is not None:
                 influence_scores.append(surrounding_metric_avg)
                 point_influence_map[change_point["id"]] = surrounding_metric_avg
@@ -5,16 +5,19 @@ import geopandas as gpd
 from shapely.geometry import box, Polygon
 import shapely
 from all_types.request_dtypes import (
-    ReqIntelligenceData,
     ReqFetchDataset,
     ReqClustersForSalesManData,
 )
-from storage import fetch_intelligence_by_viewport
+from storage import fetch_population_and_income_by_viewport
 from data_fetcher import fetch_country_city_data, fetch_dataset
+from backend_common.compute_pool import run_in_compute_pool
 import contextily as ctx
 from typing import Tuple
 import asyncio
+import heapq
+import json
 import logging
+import time
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -23,6 +26,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Above this many stops a territory route is not improved with 2-opt/Or-opt because the
+# distance matrix would get too large (8 MB of float64 at 1000 stops, per compute pool
+# worker); the nearest neighbor tour is returned instead
+MAX_ROUTE_MATRIX_STOPS = 1000
+
 
 def define_boundary(bounding_box: list[tuple[float, float]]) -> Polygon:
     """
@@ -44,14 +52,14 @@ async def get_population_and_income(
 ) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
     """
     Fetch both population and income data for a specific bounding box and zoom level
-    using the API endpoint, making two separate calls.
+    with a single viewport query on the joined census grid.
 
     Args:
         bounding_box: List of (longitude, latitude) tuples defining the area
         zoom_level: The zoom level to retrieve data for
 
     Returns:
-        Tuple of (population_gdf, income_gdf) GeoDataFrames
+        Tuple of (population_gdf, income_gdf) GeoDataFrames sharing the same rows
     """
     # Calculate bounding box coordinates once
     min_lng = min(point[0] for point in bounding_box)
@@ -59,51 +67,13 @@ async def get_population_and_income(
     min_lat = min(point[1] for point in bounding_box)
     max_lat = max(point[1] for point in bounding_box)
 
-    # Create base request object with common parameters
-    base_request = {
-        "min_lng": min_lng,
-        "min_lat": min_lat,
-        "max_lng": max_lng,
-        "max_lat": max_lat,
-        "zoom_level": zoom_level,
-        "user_id": "your_user_id",  # You'll need to provide this
-    }
-
-    # Create population-only request
-    population_request = ReqIntelligenceData(
-        **base_request, population=True, income=False
-    )
-
-    # Create combined population and income request
-    income_request = ReqIntelligenceData(
-        **base_request, population=True, income=True
+    census_gdf = await fetch_population_and_income_by_viewport(
+        min_lng, min_lat, max_lng, max_lat, zoom_level
     )
 
-    # Fetch both datasets concurrently
-
-    population_task = fetch_intelligence_by_viewport(population_request)
-    income_task = fetch_intelligence_by_viewport(income_request)
-
-    # Wait for both tasks to complete
-    population_data, income_data = await asyncio.gather(
-        population_task, income_task
-    )
-
-    # Process population data
-    population_features = population_data.get("features", [])
-    population_gdf = (
-        gpd.GeoDataFrame.from_features(population_features)
-        if population_features
-        else gpd.GeoDataFrame()
-    )
-
-    # Process income data
-    income_features = income_data.get("features", [])
-    income_gdf = (
-        gpd.GeoDataFrame.from_features(income_features)
-        if income_features
-        else gpd.GeoDataFrame()
-    )
+    # Income rows line up with the population rows, get_grids_of_data relies on it
+    population_gdf = census_gdf.drop(columns=["income"])
+    income_gdf = census_gdf[["geometry", "income"]]
 
     return population_gdf, income_gdf
 
@@ -334,6 +304,148 @@ def haversine(
     return distances
 
 
+def haversine_pairwise(
+    lat1_array: np.ndarray,
+    lon1_array: np.ndarray,
+    lat2_array: np.ndarray,
+    lon2_array: np.ndarray,
+) -> np.ndarray:
+    """
+    args:
+    `lat1_array, lon1_array, lat2_array, lon2_array` are equally sized arrays of coordinates in degrees.
+    Element k of the origins is paired with element k of the destinations
+
+    return:
+    ------
+    A 1D numpy array with the haversine distance in km of every (origin, destination) pair.
+    Unlike `haversine` no M×N matrix is built, which keeps sparse neighbor lookups cheap
+    """
+    lat1_rad, lon1_rad = np.radians(lat1_array), np.radians(lon1_array)
+    lat2_rad, lon2_rad = np.radians(lat2_array), np.radians(lon2_array)
+
+    a = (
+        np.sin((lat2_rad - lat1_rad) / 2.0) ** 2
+        + np.cos(lat1_rad)
+        * np.cos(lat2_rad)
+        * np.sin((lon2_rad - lon1_rad) / 2.0) ** 2
+    )
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    R = 6371.0
+    return R * c
+
+
+def radius_neighbors_csr(
+    origin_lat: np.ndarray,
+    origin_lon: np.ndarray,
+    destination_lat: np.ndarray,
+    destination_lon: np.ndarray,
+    distance_limit: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds for every origin the destinations that are closer than `distance_limit` using a
+    spatial index radius query instead of a dense origins × destinations distance matrix.
+
+    args:
+    ----
+    `origin_lat, origin_lon` are the population centers in degrees
+    `destination_lat, destination_lon` are the places in degrees
+    `distance_limit` is the max distance in km a person is willing to travel
+
+    return:
+    ------
+    A CSR (compressed sparse row) triple `(indptr, indices, distances)`. The destinations
+    accessible from origin i are `indices[indptr[i]:indptr[i + 1]]`, sorted by distance,
+    with their haversine distances in km in the matching slice of `distances`.
+    Origins without any destination inside the limit are linked to their closest destination
+    so every origin has at least one accessible place (same fallback as the dense version).
+    """
+    n_origins = len(origin_lat)
+    n_destinations = len(destination_lat)
+
+    if n_origins == 0 or n_destinations == 0:
+        return (
+            np.zeros(n_origins + 1, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=float),
+        )
+
+    # Project both sets to a local equirectangular plane in km so that a planar radius
+    # query matches the haversine threshold closely (city-scale extents)
+    R = 6371.0
+    ref_lat = np.radians(np.mean(np.concatenate([origin_lat, destination_lat])))
+    cos_ref = np.cos(ref_lat)
+
+    def project(lat, lon):
+        return shapely.points(
+            R * np.radians(lon) * cos_ref,
+            R * np.radians(lat),
+        )
+
+    origin_points = project(origin_lat, origin_lon)
+    destination_tree = shapely.STRtree(project(destination_lat, destination_lon))
+
+    # Candidate pairs from the index, padded so projection error never drops a valid pair:
+    # east-west distances are overstated by up to cos_ref / cos(lat) at the latitude
+    # farthest from the equator, so the pad grows with the latitude span of the viewport.
+    # The exact haversine check below removes the false positives
+    max_abs_lat = np.radians(
+        min(max(np.abs(origin_lat).max(), np.abs(destination_lat).max()), 89.0)
+    )
+    stretch = max(1.0, cos_ref / np.cos(max_abs_lat))
+    origin_idx, destination_idx = destination_tree.query(
+        origin_points, predicate="dwithin", distance=distance_limit * 1.01 * stretch + 1e-6
+    )
+    distances = haversine_pairwise(
+        origin_lat[origin_idx],
+        origin_lon[origin_idx],
+        destination_lat[destination_idx],
+        destination_lon[destination_idx],
+    )
+    within = distances < distance_limit
+    origin_idx = origin_idx[within]
+    destination_idx = destination_idx[within]
+    distances = distances[within]
+
+    # Fallback: origins with no destination inside the limit get their nearest destination
+    has_neighbor = np.zeros(n_origins, dtype=bool)
+    has_neighbor[origin_idx] = True
+    isolated = np.flatnonzero(~has_neighbor)
+    if len(isolated) > 0:
+        # The planar nearest distance bounds the search; the exact haversine picks the winner
+        _, planar_nearest = destination_tree.query_nearest(
+            origin_points[isolated], all_matches=False, return_distance=True
+        )
+        cand_origin, cand_destination = destination_tree.query(
+            origin_points[isolated],
+            predicate="dwithin",
+            distance=planar_nearest * 1.01 + 1e-6,
+        )
+        cand_origin = isolated[cand_origin]
+        cand_distances = haversine_pairwise(
+            origin_lat[cand_origin],
+            origin_lon[cand_origin],
+            destination_lat[cand_destination],
+            destination_lon[cand_destination],
+        )
+        order = np.lexsort((cand_distances, cand_origin))
+        first = np.unique(cand_origin[order], return_index=True)[1]
+        origin_idx = np.concatenate([origin_idx, cand_origin[order][first]])
+        destination_idx = np.concatenate(
+            [destination_idx, cand_destination[order][first]]
+        )
+        distances = np.concatenate([distances, cand_distances[order][first]])
+
+    # Sort by origin then distance and compress the origin column into row pointers
+    order = np.lexsort((distances, origin_idx))
+    indices = destination_idx[order].astype(np.int64)
+    distances = distances[order]
+    indptr = np.zeros(n_origins + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origin_idx, minlength=n_origins), out=indptr[1:])
+
+    return indptr, indices, distances
+
+
 def get_grids_of_data(
     population_gdf: gpd.GeoDataFrame,
     places: gpd.GeoDataFrame,
@@ -406,64 +518,28 @@ def get_grids_of_data(
         f"Prepared {len(origins)} origins and {len(destinations)} destinations for analysis"
     )
 
-    # Compute full distance matrix between all origins and destinations
-    # Uses Haversine formula to account for Earth's curvature
-    # Results in M×N matrix where M=origins, N=destinations
+    # Build the sparse origin -> destinations neighbor structure within the distance limit
+    # Uses an STRtree radius query so only nearby pairs are ever evaluated
+    # Results in a CSR structure: destinations of origin i are indices[indptr[i]:indptr[i+1]]
     # This implements spatial interaction theory for accessibility analysis
-    # Example: 500 population centers × 150 supermarkets = 500×150 matrix with distances 0.2-25.8 km
-    matrix = haversine(
+    # Example: 20,000 population centers × 150 supermarkets with a 2.5km limit keeps ~40,000 pairs
+    # instead of a 3,000,000 cell distance matrix
+    logger.info("Calculating accessibility for each population center...")
+    indptr, indices, _ = radius_neighbors_csr(
         origins.latitude.values,
         origins.longitude.values,
         destinations.latitude.values,
         destinations.longitude.values,
+        distanace_limit,
     )
+    # Row index of every stored (origin, destination) pair
+    pair_origins = np.repeat(np.arange(len(origins)), np.diff(indptr))
 
-    # Initialize accessibility mapping using origin-destination cost matrix
-    # Dictionary stores lists of accessible destination indices for each origin
-    # This implements the concept of service catchment areas in spatial analysis
-    od_cost_matrix = {k: [] for k in range(matrix.shape[0])}
-
-    logger.info("Calculating accessibility for each population center...")
-
-    # Calculate accessibility for each population center (origin)
-    # Implements distance-based accessibility measurement theory
-    accessibility_counts = []
-
-    for i in range(matrix.shape[0]):
-        # Get distances from current origin to all destinations
-        # Example: [1.2, 3.4, 0.8, 5.2, 2.1, 8.9, 1.5, 4.3] km to 8 supermarkets
-        od = matrix[i].tolist()  # Convert to list for manipulation
-
-        # Iteratively find accessible destinations within distance threshold
-        # Continues until all destinations are evaluated or distance limit exceeded
-        while len(od_cost_matrix[i]) < matrix.shape[1]:
-
-            # Check if closest remaining destination is within travel threshold
-            # Implements spatial accessibility theory with distance decay
-            # Example: If distance_limit=5km, destinations at [1.2, 3.4, 0.8, 2.1, 1.5, 4.3] qualify
-            if np.min(od) < distanace_limit:
-                amn = np.argmin(od)  # Find index of closest destination
-
-                # Validate that the index is finite (not NaN or infinite)
-                if np.isfinite(amn):
-                    od_cost_matrix[i].append(
-                        amn
-                    )  # Add to accessible destinations
-
-                # Mark destination as processed by setting distance to infinity
-                # Prevents re-selection in subsequent iterations
-                od[amn] = np.inf
-            else:
-                # Fallback: if no destinations within limit, assign closest one
-                # Ensures every origin has at least one accessible destination
-                # Prevents zero-division errors in subsequent calculations
-                if len(od_cost_matrix[i]) == 0:
-                    amn = np.argmin(od)
-                    if np.isfinite(amn):
-                        od_cost_matrix[i].append(amn)
-                break  # Exit loop when distance threshold exceeded
+    logger.info(
+        f"Sparse accessibility structure: {len(indices):,} origin-destination pairs within limit"
+    )
 
-        accessibility_counts.append(len(od_cost_matrix[i]))
+    accessibility_counts = np.diff(indptr)
 
     # Calculate accessibility indicator for each population center
     # Counts number of services/facilities reachable within distance limit
@@ -483,10 +559,10 @@ def get_grids_of_data(
         f"  Range: {min_accessibility} to {max_accessibility} accessible places"
     )
     logger.info(
-        f"  {sum(1 for x in accessibility_counts if x == 1)} centers have only 1 accessible place (service deserts)"
+        f"  {(accessibility_counts == 1).sum()} centers have only 1 accessible place (service deserts)"
     )
     logger.info(
-        f"  {sum(1 for x in accessibility_counts if x >= 5)} centers have 5+ accessible places (well-served areas)"
+        f"  {(accessibility_counts >= 5).sum()} centers have 5+ accessible places (well-served areas)"
     )
 
     # Compute effective population using accessibility-weighted demographics
@@ -606,10 +682,6 @@ def get_grids_of_data(
     # Calculate market potential for each destination (place/facility)
     # Implements gravity model theory: sum of accessible effective populations
     # Each destination's market size = sum of all populations that can reach it
-    market = {
-        k: [] for k in range(matrix.shape[1])
-    }  # Initialize market potential storage
-
     logger.info("Calculating market potential for each destination...")
     logger.info("Market calculation diagnostic:")
     logger.info(
@@ -619,72 +691,55 @@ def get_grids_of_data(
         f"  Effective population NaN count: {origins['effective_population'].isna().sum()}"
     )
 
-    for i in range(matrix.shape[1]):  # Iterate through each destination
-        for (
-            k,
-            v,
-        ) in (
-            od_cost_matrix.items()
-        ):  # Check each origin's accessible destinations
-            if i in v:  # If current destination is accessible from origin k
-                # Add origin's effective population to destination's market potential
-                # This implements cumulative accessibility/market catchment theory
-                market[i].append(origins["effective_population"].iloc[k])
-
-    # Aggregate market potential for each destination
-    # Sum all effective populations that can access each destination
-    # Results in total market size/customer base for each facility
+    # Sparse transpose matrix-vector product: market = Aᵀ · effective_population
+    # where A is the origin × destination accessibility matrix held in CSR form
+    # Each stored pair contributes its origin's effective population to its destination
     # Example: Downtown supermarket might have 25,000 total potential customers, suburban one has 8,500
-    destinations["market"] = [sum(v) for v in market.values()]
+    effective_population = origins["effective_population"].values.astype(float)
+    pair_contributions = effective_population[pair_origins]
+    destinations["market"] = np.bincount(
+        indices, weights=pair_contributions, minlength=len(destinations)
+    )
     logger.info("Market calculation results:")
     logger.info(f"  Market values sample: {destinations['market'][:5]}")
-    logger.info(f"  Market NaN count: {sum(np.isnan(destinations['market']))}")
-    logger.info(
-        f"  Market zero count: {sum(np.array(destinations['market']) == 0)}"
-    )
-    logger.info(
-        f"  Non-zero market count: {sum(np.array(destinations['market']) > 0)}"
-    )
+    logger.info(f"  Market NaN count: {destinations['market'].isna().sum()}")
+    logger.info(f"  Market zero count: {(destinations['market'] == 0).sum()}")
+    logger.info(f"  Non-zero market count: {(destinations['market'] > 0).sum()}")
 
-    # ===== INSERT ENHANCED MARKET CALCULATION DEBUGGING HERE =====
     logger.info("=== MARKET CALCULATION DEBUG ===")
     logger.info(
-        f"Total origins with valid effective_population: {sum(~np.isnan(origins['effective_population']))}"
+        f"Total origins with valid effective_population: {(~np.isnan(effective_population)).sum()}"
     )
     logger.info(
-        f"Total origins with zero effective_population: {sum(origins['effective_population'] == 0)}"
+        f"Total origins with zero effective_population: {(effective_population == 0).sum()}"
     )
 
-    # Check each destination's market calculation
+    # Check a few destinations' market calculation
+    contributors_per_destination = np.bincount(
+        indices, minlength=len(destinations)
+    )
     for i in range(min(5, len(destinations))):
-        dest_market_contributors = market[i]
+        dest_market_contributors = pair_contributions[indices == i]
         logger.info(f"Destination {i} market calculation:")
         logger.info(
-            f"  Number of contributing origins: {len(dest_market_contributors)}"
+            f"  Number of contributing origins: {contributors_per_destination[i]}"
         )
         if len(dest_market_contributors) > 0:
             logger.info(
                 f"  Contributors sample: {dest_market_contributors[:3]}"
             )
-            logger.info(f"  Contributors sum: {sum(dest_market_contributors)}")
+            logger.info(f"  Contributors sum: {dest_market_contributors.sum()}")
             logger.info(
-                f"  Any NaN contributors: {any(np.isnan(dest_market_contributors))}"
+                f"  Any NaN contributors: {np.isnan(dest_market_contributors).any()}"
             )
         else:
             logger.info(f"  No origins can access this destination")
 
-    # Check accessibility matrix
-    accessible_destinations_per_origin = [
-        len(v) for v in od_cost_matrix.values()
-    ]
-    logger.info(
-        f"Origins with 0 accessible destinations: {sum(x == 0 for x in accessible_destinations_per_origin)}"
-    )
     logger.info(
-        f"Total accessible origin-destination pairs: {sum(accessible_destinations_per_origin)}"
+        f"Origins with 0 accessible destinations: {(accessibility_counts == 0).sum()}"
     )
+    logger.info(f"Total accessible origin-destination pairs: {len(indices)}")
     logger.info("=== END MARKET CALCULATION DEBUG ===")
-    # ===== END ENHANCED MARKET CALCULATION DEBUGGING =====
 
     market_stats = destinations["market"]
     logger.info("Market potential calculated:")
@@ -882,85 +937,640 @@ def get_grids_of_data(
     return data
 
 
-def select_nbrs_with_sum(
-    i: int, cost: np.ndarray, max_share: float, shares: dict, used: list[int]
-) -> list[int]:
+def project_to_local_km(
+    latitude: np.ndarray, longitude: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    A helper function for clustering funtionality. It makes sure that the cluster are formed by neighboring
-    gridcells and calculates the sum of indicator value for each itteration.
+    args:
+    ----
+    `latitude, longitude` are arrays of coordinates in degrees
+
+    return:
+    ------
+    x, y arrays in km on a local equirectangular plane centered on the data.
+    Good enough for city-scale planar distances (heaps, seeds, nearest lookups)
+    """
+    R = 6371.0
+    cos_ref = np.cos(np.radians(np.mean(latitude))) if len(latitude) else 1.0
+    return R * np.radians(longitude) * cos_ref, R * np.radians(latitude)
+
+
+def build_grid_adjacency(
+    cells: gpd.GeoSeries,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the queen contiguity graph (8 neighbors) of regular square grid cells such as the
+    ones produced by `create_grid`. Cells are snapped to integer (column, row) positions so the
+    lookup is a sorted-key search instead of pairwise geometry tests.
 
     args:
     ----
-    `i` is index of the origin
-    `cost` is od distnace matrix
-    `max_share` is the max share of the indicator each cluster can have
-    `shares` is the assigned value to each destination
-    `used` is the a list of gridcells that are taken
+    `cells` are the grid cell polygons (all of the same size)
 
     return:
     ------
-    a list of neighboring gridcells for origin i that will become of cluster
+    A CSR pair `(indptr, indices)`; the neighbors of cell i are `indices[indptr[i]:indptr[i + 1]]`
     """
+    n_cells = len(cells)
+    if n_cells == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    bounds = shapely.bounds(np.asarray(cells.values))
+    size_x = bounds[0, 2] - bounds[0, 0]
+    size_y = bounds[0, 3] - bounds[0, 1]
+    cols = np.rint((bounds[:, 0] - bounds[:, 0].min()) / size_x).astype(np.int64)
+    rows = np.rint((bounds[:, 1] - bounds[:, 1].min()) / size_y).astype(np.int64)
+
+    # Pad by one so every neighbor offset maps to a non-negative unique key
+    n_key_rows = rows.max() + 3
+    keys = (cols + 1) * n_key_rows + (rows + 1)
+    key_order = np.argsort(keys)
+    sorted_keys = keys[key_order]
+
+    sources, targets = [], []
+    for d_col in (-1, 0, 1):
+        for d_row in (-1, 0, 1):
+            if d_col == 0 and d_row == 0:
+                continue
+            neighbor_keys = keys + d_col * n_key_rows + d_row
+            pos = np.minimum(np.searchsorted(sorted_keys, neighbor_keys), n_cells - 1)
+            found = sorted_keys[pos] == neighbor_keys
+            sources.append(np.flatnonzero(found))
+            targets.append(key_order[pos[found]])
+
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    order = np.argsort(sources, kind="stable")
+    indptr = np.zeros(n_cells + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_cells), out=indptr[1:])
+    return indptr, targets[order].astype(np.int64)
+
+
+def select_territory_seeds(
+    x: np.ndarray, y: np.ndarray, workload: np.ndarray, n_territories: int, n_iter: int = 10
+) -> np.ndarray:
+    """
+    Picks one seed cell per territory with a workload-weighted k-means on the cell centroids.
+    Centers are initialised by farthest point sampling starting from the heaviest cell, so the
+    result does not depend on the order of the cells.
 
-    logger.debug(f"Building cluster starting from grid cell {i}")
-    logger.debug(
-        f"Target max share: {max_share:,.0f}, Available unused cells: {len(cost) - len(used)}"
-    )
+    args:
+    ----
+    `x, y` are the projected cell centroids in km
+    `workload` is the indicator each territory should share (potential customers)
+    `n_territories` is the number of seeds to return (capped by the number of cells)
 
-    # Sort grid cells by distance from origin i (nearest neighbor ordering)
-    # Implements spatial contiguity constraint for cluster formation
-    # Ensures clusters are geographically compact rather than spatially fragmented
-    # Example: From grid cell 45, sorted neighbors might be [46, 44, 55, 35, 47, 43, 56, 34...]
-    x = np.argsort(cost)  # Returns indices sorted by ascending distance
+    return:
+    ------
+    An array of distinct cell indices used as territory seeds
+    """
+    points = np.column_stack([x, y])
+    n_seeds = min(n_territories, len(points))
+    if n_seeds == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    centers = [points[np.argmax(workload)]]
+    min_dist = np.linalg.norm(points - centers[0], axis=1)
+    for _ in range(1, n_seeds):
+        centers.append(points[np.argmax(min_dist)])
+        min_dist = np.minimum(min_dist, np.linalg.norm(points - centers[-1], axis=1))
+    centers = np.array(centers)
+
+    for _ in range(n_iter):
+        dist = np.linalg.norm(points[:, None, :] - centers[None, :, :], axis=2)
+        labels = np.argmin(dist, axis=1)
+        weight_sum = np.bincount(labels, weights=workload, minlength=n_seeds)
+        for axis in range(2):
+            moved = np.bincount(
+                labels, weights=workload * points[:, axis], minlength=n_seeds
+            )
+            has_weight = weight_sum > 0
+            centers[has_weight, axis] = moved[has_weight] / weight_sum[has_weight]
+
+    # Snap each center to its closest cell, never reusing a cell
+    seeds = []
+    taken = np.zeros(len(points), dtype=bool)
+    for center in centers:
+        dist = np.linalg.norm(points - center, axis=1)
+        dist[taken] = np.inf
+        seed = int(np.argmin(dist))
+        taken[seed] = True
+        seeds.append(seed)
+    return np.array(seeds, dtype=np.int64)
+
+
+def grow_balanced_territories(
+    adjacency: Tuple[np.ndarray, np.ndarray],
+    x: np.ndarray,
+    y: np.ndarray,
+    workload: np.ndarray,
+    seeds: np.ndarray,
+) -> np.ndarray:
+    """
+    Capacitated region growing on the grid adjacency graph. At every step the territory with the
+    lowest workload claims the unassigned frontier cell closest to its seed, so territories stay
+    contiguous and grow towards equal shares. Each territory keeps its own frontier heap and a
+    global heap orders territories by load, which keeps the whole run at O(n log n).
 
-    logger.debug(f"Sorted {len(x)} neighbors by distance from seed cell {i}")
+    Cells that cannot be reached from any seed (grid islands) are attached afterwards, one
+    connected island at a time, to the territory owning the nearest assigned cell.
 
-    # Initialize accumulator variables for greedy cluster building
-    value = 0  # Running sum of indicator values (market potential)
-    nbrs = []  # List of neighbor indices to include in cluster
+    args:
+    ----
+    `adjacency` is the CSR pair returned by `build_grid_adjacency`
+    `x, y` are the projected cell centroids in km
+    `workload` is the indicator value of each cell
+    `seeds` are the starting cells, one per territory
 
-    # Greedy nearest-neighbor selection with capacity constraint
-    # Implements load-balancing principle: distribute total workload equally
-    for idx, cell_idx in enumerate(
-        x
-    ):  # Iterate through grid cells in order of proximity
+    return:
+    ------
+    An integer array with the territory index of every cell
+    """
+    indptr, indices = adjacency
+    n_cells = len(workload)
+    labels = np.full(n_cells, -1, dtype=np.int64)
+    loads = np.zeros(len(seeds), dtype=float)
+    frontiers = [[] for _ in seeds]
+    territory_heap = []
+
+    def claim(cell: int, territory: int):
+        labels[cell] = territory
+        loads[territory] += workload[cell]
+        seed = seeds[territory]
+        for nbr in indices[indptr[cell] : indptr[cell + 1]]:
+            if labels[nbr] == -1:
+                dist = (x[nbr] - x[seed]) ** 2 + (y[nbr] - y[seed]) ** 2
+                heapq.heappush(frontiers[territory], (dist, int(nbr)))
+
+    for territory, seed in enumerate(seeds):
+        claim(int(seed), territory)
+    for territory in range(len(seeds)):
+        heapq.heappush(territory_heap, (loads[territory], territory))
+
+    while territory_heap:
+        _, territory = heapq.heappop(territory_heap)
+        frontier = frontiers[territory]
+        while frontier and labels[frontier[0][1]] != -1:
+            heapq.heappop(frontier)
+        if not frontier:
+            continue  # territory is enclosed, it cannot grow any further
+        _, cell = heapq.heappop(frontier)
+        claim(cell, territory)
+        heapq.heappush(territory_heap, (loads[territory], territory))
+
+    unassigned = labels == -1
+    if unassigned.any() and (~unassigned).any():
+        assigned_idx = np.flatnonzero(~unassigned)
+        tree = shapely.STRtree(shapely.points(x[assigned_idx], y[assigned_idx]))
+        for start in np.flatnonzero(unassigned):
+            if labels[start] != -1:
+                continue
+            # Collect the whole island so it stays in one territory
+            island, stack = [], [int(start)]
+            labels[start] = -2
+            while stack:
+                cell = stack.pop()
+                island.append(cell)
+                for nbr in indices[indptr[cell] : indptr[cell + 1]]:
+                    if labels[nbr] == -1:
+                        labels[nbr] = -2
+                        stack.append(int(nbr))
+            island = np.array(island)
+            island_center = shapely.points(x[island].mean(), y[island].mean())
+            nearest = assigned_idx[tree.query_nearest(island_center)[0]]
+            labels[island] = labels[nearest]
+
+    return labels
+
+
+def territory_balance_stats(
+    labels: np.ndarray,
+    workload: np.ndarray,
+    adjacency: Tuple[np.ndarray, np.ndarray],
+    n_territories: int,
+) -> list[dict]:
+    """
+    args:
+    ----
+    `labels` is the territory index of every cell
+    `workload` is the indicator value of every cell
+    `adjacency` is the CSR pair returned by `build_grid_adjacency`
+    `n_territories` is the requested number of territories
 
-        # Skip grid cells already assigned to other clusters
-        # Ensures each spatial unit belongs to exactly one cluster (partition constraint)
-        if cell_idx in used:
-            logger.debug(f"  Cell {cell_idx} already used, skipping")
+    return:
+    ------
+    One dict per territory with its cell count, workload, share of the total, deviation from the
+    equitable share and the number of connected parts (1 means contiguous)
+    """
+    indptr, indices = adjacency
+    total = workload.sum()
+    target = total / n_territories if n_territories else 0.0
+    cells = np.bincount(labels, minlength=n_territories)
+    loads = np.bincount(labels, weights=workload, minlength=n_territories)
+
+    # Count connected parts per territory with a flood fill restricted to same-label neighbors
+    parts = np.zeros(n_territories, dtype=np.int64)
+    visited = np.zeros(len(labels), dtype=bool)
+    for start in range(len(labels)):
+        if visited[start]:
             continue
+        parts[labels[start]] += 1
+        visited[start] = True
+        stack = [start]
+        while stack:
+            cell = stack.pop()
+            for nbr in indices[indptr[cell] : indptr[cell + 1]]:
+                if not visited[nbr] and labels[nbr] == labels[cell]:
+                    visited[nbr] = True
+                    stack.append(nbr)
+
+    return [
+        {
+            "group": group,
+            "cells": int(cells[group]),
+            "potential_customers": float(loads[group]),
+            "share_of_total": float(loads[group] / total) if total else 0.0,
+            "deviation_from_target": (
+                float((loads[group] - target) / target) if target else 0.0
+            ),
+            "connected_parts": int(parts[group]),
+        }
+        for group in range(n_territories)
+    ]
 
-        # Add current grid cell's indicator value to cluster total
-        # Accumulates market potential/workload for current cluster
-        # Example: Adding grid cells with 2500, 1800, 3200 customers → value = 7500
-        cell_value = shares[cell_idx]
-        value += cell_value
-        nbrs.append(cell_idx)  # Include grid cell in current cluster
 
-        logger.debug(
-            f"  Added cell {cell_idx} with {cell_value:,.0f} customers. Cluster total: {value:,.0f}"
-        )
+def nearest_neighbor_tour(dist: np.ndarray, start: int = 0) -> np.ndarray:
+    """
+    args:
+    ----
+    `dist` is a symmetric (n, n) distance matrix in km
+    `start` is the index of the first stop
+
+    return:
+    ------
+    A tour (array of stop indices) built by always walking to the closest unvisited stop
+    """
+    n = dist.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    tour = np.empty(n, dtype=np.int64)
+    current = start
+    for step in range(n):
+        tour[step] = current
+        visited[current] = True
+        if step < n - 1:
+            row = np.where(visited, np.inf, dist[current])
+            current = int(np.argmin(row))
+    return tour
+
+
+def tour_length(tour: np.ndarray, dist: np.ndarray) -> float:
+    """Length in km of the closed tour (the last stop returns to the first)"""
+    return float(dist[tour, np.roll(tour, -1)].sum())
+
+
+def two_opt(tour: np.ndarray, dist: np.ndarray, deadline: float) -> np.ndarray:
+    """
+    Improves a closed tour with 2-opt moves until no move helps or `deadline` (time.monotonic)
+    passes. For every first edge (a, b) the gain of all second edges (c, d) is evaluated at once
+    with numpy and the best one is applied by reversing the segment between them.
+    """
+    tour = tour.copy()
+    n = len(tour)
+    if n < 4:
+        return tour
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(n - 2):
+            a, b = tour[i], tour[i + 1]
+            # second edge (c, d) = (tour[j], tour[j + 1]) with j > i + 1, skipping the edge
+            # adjacent to (a, b) when i == 0
+            j = np.arange(i + 2, n if i > 0 else n - 1)
+            if len(j) == 0:
+                continue
+            c = tour[j]
+            d = tour[(j + 1) % n]
+            gains = dist[a, b] + dist[c, d] - dist[a, c] - dist[b, d]
+            best = int(np.argmax(gains))
+            if gains[best] > 1e-9:
+                k = j[best]
+                tour[i + 1 : k + 1] = tour[i + 1 : k + 1][::-1]
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+    return tour
+
+
+def or_opt(
+    tour: np.ndarray, dist: np.ndarray, deadline: float, max_segment: int = 3
+) -> np.ndarray:
+    """
+    Improves a closed tour with Or-opt moves: segments of 1 to `max_segment` consecutive stops
+    are moved, possibly reversed, to the cheapest other position. All insertion positions of a
+    segment are priced at once with numpy. Stops when no move helps or `deadline` passes.
+    """
+    tour = tour.copy()
+    n = len(tour)
+    if n < 5:
+        return tour
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for seg_len in range(1, max_segment + 1):
+            i = 0
+            while i < n and time.monotonic() < deadline:
+                positions = (np.arange(i, i + seg_len)) % n
+                segment = tour[positions]
+                prev = tour[(i - 1) % n]
+                nxt = tour[(i + seg_len) % n]
+                first, last = segment[0], segment[-1]
+                removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+                rest = np.delete(tour, positions)
+                p = rest
+                q = np.roll(rest, -1)
+                forward = dist[p, first] + dist[last, q] - dist[p, q]
+                backward = dist[p, last] + dist[first, q] - dist[p, q]
+                insert_cost = np.minimum(forward, backward)
+                # inserting back between prev and nxt is the current tour
+                insert_cost[np.flatnonzero(p == prev)] = np.inf
+                best = int(np.argmin(insert_cost))
+
+                if removal_gain - insert_cost[best] > 1e-9:
+                    piece = segment if forward[best] <= backward[best] else segment[::-1]
+                    tour = np.concatenate([rest[: best + 1], piece, rest[best + 1 :]])
+                    improved = True
+                i += 1
+    return tour
+
+
+def solve_route(
+    latitude: np.ndarray, longitude: np.ndarray, time_budget: float = 2.0
+) -> Tuple[list[int], float]:
+    """
+    Orders the stops of one territory into a short closed tour.
+    Nearest neighbor construction followed by 2-opt and Or-opt on a haversine matrix, bounded
+    by `time_budget` seconds. Territories above MAX_ROUTE_MATRIX_STOPS skip the improvement
+    phase and use the nearest neighbor tour so memory stays bounded, built within the same
+    budget.
+
+    Plain arrays in and out so it can be shipped to a worker process cheaply.
+
+    args:
+    ----
+    `latitude, longitude` are the stop coordinates in degrees
+    `time_budget` is the max number of seconds spent improving the tour
 
-        # Check if cluster has reached target capacity (load balancing)
-        # Stops growing cluster when maximum share threshold is exceeded
-        # Implements equitable distribution of total market potential across clusters
-        # Example: If max_share=25000 and value=26300, stop adding cells to this cluster
-        if value >= max_share:
-            logger.debug(
-                f"  Cluster reached target capacity ({value:,.0f} >= {max_share:,.0f})"
+    return:
+    ------
+    A tuple (visit order as indices into the inputs, total tour distance in km)
+    """
+    n = len(latitude)
+    if n == 0:
+        return [], 0.0
+    if n == 1:
+        return [0], 0.0
+
+    deadline = time.monotonic() + time_budget
+    if n > MAX_ROUTE_MATRIX_STOPS:
+        # Nearest neighbor walk, O(n²) overall: once the deadline passes the remaining
+        # stops are visited by increasing distance from the last one instead
+        visited = np.zeros(n, dtype=bool)
+        order = [0]
+        visited[0] = True
+        while len(order) < n and time.monotonic() < deadline:
+            current = order[-1]
+            row = haversine_pairwise(
+                np.full(n, latitude[current]), np.full(n, longitude[current]), latitude, longitude
             )
-            break
+            row[visited] = np.inf
+            nxt = int(np.argmin(row))
+            visited[nxt] = True
+            order.append(nxt)
+        if len(order) < n:
+            remaining = np.flatnonzero(~visited)
+            current = order[-1]
+            row = haversine_pairwise(
+                np.full(len(remaining), latitude[current]),
+                np.full(len(remaining), longitude[current]),
+                latitude[remaining],
+                longitude[remaining],
+            )
+            order += remaining[np.argsort(row, kind="stable")].tolist()
+        tour = np.asarray(order)
+        following = np.roll(tour, -1)
+        total = haversine_pairwise(
+            latitude[tour], longitude[tour], latitude[following], longitude[following]
+        ).sum()
+        return order, float(total)
+
+    dist = haversine(latitude, longitude, latitude, longitude)
+    tour = nearest_neighbor_tour(dist)
+    tour = two_opt(tour, dist, deadline)
+    tour = or_opt(tour, dist, deadline)
+    return tour.tolist(), tour_length(tour, dist)
+
+
+async def get_territory_routes(
+    places: gpd.GeoDataFrame,
+    territories: gpd.GeoDataFrame,
+    time_budget: float = 2.0,
+) -> list[dict]:
+    """
+    Builds an optimized visiting order over the places of every territory.
+    Each territory is solved in the shared compute pool so large territories never block the event loop.
+
+    args:
+    ----
+    `places` are the target places with `longitude` and `latitude` columns
+    `territories` are the grid cells with their `group` column
+    `time_budget` is the max number of seconds spent improving each territory route
 
+    return:
+    ------
+    One dict per territory with the ordered [lng, lat] coordinates and the total distance in km
+    """
+    stops = gpd.sjoin(
+        places[["geometry", "longitude", "latitude"]].set_crs("EPSG:4326", allow_override=True),
+        territories[["geometry", "group"]].set_crs("EPSG:4326", allow_override=True),
+        how="inner",
+        predicate="within",
+    )
+    # A place on a shared cell border matches two cells; keep it in one territory
+    stops = stops[~stops.index.duplicated(keep="first")]
+
+    groups = sorted(stops["group"].unique().tolist())
+    jobs = []
+    for group in groups:
+        territory_stops = stops[stops["group"] == group]
+        jobs.append(
+            run_in_compute_pool(
+                solve_route,
+                territory_stops["latitude"].values.astype(float),
+                territory_stops["longitude"].values.astype(float),
+                time_budget,
+            )
+        )
+    solutions = await asyncio.gather(*jobs)
+
+    routes = []
+    for group, (order, total_distance) in zip(groups, solutions):
+        territory_stops = stops[stops["group"] == group]
+        lngs = territory_stops["longitude"].values[order]
+        lats = territory_stops["latitude"].values[order]
+        routes.append(
+            {
+                "group": int(group),
+                "stops": len(order),
+                "coordinates": [[float(lng), float(lat)] for lng, lat in zip(lngs, lats)],
+                "total_distance_km": total_distance,
+            }
+        )
+        logger.info(
+            f"  Route for cluster {group}: {len(order)} stops, {total_distance:,.1f} km"
+        )
+    return routes
+
+
+def build_territories(
+    population_wkb: np.ndarray,
+    population_counts: np.ndarray,
+    income: np.ndarray | None,
+    place_latitudes: np.ndarray,
+    place_longitudes: np.ndarray,
+    distance_limit: float,
+    num_sales_man: int,
+) -> Tuple[np.ndarray, dict, list[dict]]:
+    """
+    CPU bound part of the salesman problem, kept free of I/O so it can run in the compute pool.
+    Takes and returns plain arrays, the GeoDataFrames are rebuilt on each side
+    args:
+    ----
+    `population_wkb, population_counts` are the census geometries as WKB and their population
+    `income` is the income of every census row, `None` if unavailable
+    `place_latitudes, place_longitudes` are the places coordinates in degrees
+    `distance_limit` is the max distace a cosumer is willing to travel to reach destination
+    `num_sales_man` is the number of territories to build
+
+    return:
+    ------
+    A tuple (bounds of the grid cells with market potential, their columns including the
+    `group` label, per territory balance report), see `territories_from_arrays`
+    """
+    population_gdf = gpd.GeoDataFrame(
+        {"Population_Count": population_counts},
+        geometry=shapely.from_wkb(population_wkb),
+        crs="EPSG:4326",
+    )
+    places = gpd.GeoDataFrame(
+        {"longitude": place_longitudes, "latitude": place_latitudes},
+        geometry=shapely.points(place_longitudes, place_latitudes),
+        crs="EPSG:4326",
+    )
+    income_gdf = None if income is None else pd.DataFrame({"income": income})
+
+    # Generate grid-based spatial aggregation with accessibility analysis
+    # Implements spatial tessellation with market potential calculation
+    # Combines population, facilities, income, and accessibility into unified spatial framework
+    logger.info("Generating grid-based spatial aggregation...")
+    grided_data = get_grids_of_data(
+        population_gdf, places, income_gdf, distance_limit
+    )
+
+    # Filter to grid cells with actual market potential
+    # Removes empty/irrelevant spatial units to focus clustering on viable areas
+    mask = grided_data.number_of_potential_customers > 0
+    masked_grided_data = grided_data[mask].reset_index(drop=True)
+    if len(masked_grided_data) == 0:
+        logger.error("No grid cells with market potential found!")
+        logger.error("This usually means:")
+        logger.error("  1. Income data contains only NaN values")
+        logger.error(
+            "  2. Spatial join failed to assign population to grid cells"
+        )
+        logger.error("  3. Distance limit is too restrictive")
+    logger.info("Grid filtering results:")
+    logger.info(f"  Total grid cells: {len(grided_data)}")
     logger.info(
-        f"Cluster built from seed {i}: {len(nbrs)} cells, {value:,.0f} total customers"
+        f"  Cells with market potential: {len(masked_grided_data)} ({100*len(masked_grided_data)/len(grided_data):.1f}%)"
     )
-    logger.info(f"  Cells included: {nbrs}")
     logger.info(
-        f"  Load balancing: {100*value/max_share:.1f}% of target capacity"
+        f"  Removed {len(grided_data) - len(masked_grided_data)} empty cells"
     )
 
-    return nbrs
+    # Calculate geometric centroids projected to a local km plane
+    # Used for seed selection and for ordering each territory's frontier by distance
+    centroids = masked_grided_data.geometry.map(shapely.centroid)
+    x, y = project_to_local_km(centroids.y.values, centroids.x.values)
+    workload = masked_grided_data["number_of_potential_customers"].values.astype(float)
+
+    logger.info(f"Calculated centroids for {len(masked_grided_data)} grid cells")
+
+    # Calculate target market share per salesperson
+    # Implements equitable distribution principle: divide total market equally
+    # Ensures balanced workload assignment across sales territories
+    # Example: 180,000 total customers ÷ 8 salespeople = 22,500 customers per territory
+    total_customers = workload.sum()
+    equitable_share = total_customers / num_sales_man
+
+    logger.info("Market distribution analysis:")
+    logger.info(f"  Total potential customers: {total_customers:,.0f}")
+    logger.info(f"  Target customers per territory: {equitable_share:,.0f}")
+    logger.info(
+        f"  This represents balanced workload distribution across {num_sales_man} salespeople"
+    )
+
+    # Balanced territory engine:
+    # 1. queen contiguity graph of the grid cells
+    # 2. workload-weighted k-means seeds (independent of cell order)
+    # 3. capacitated region growing where the lightest territory always expands next
+    logger.info("Starting balanced region-growing clustering...")
+    adjacency = build_grid_adjacency(masked_grided_data.geometry)
+    seeds = select_territory_seeds(x, y, workload, num_sales_man)
+    labels = grow_balanced_territories(adjacency, x, y, workload, seeds)
+
+    # Apply cluster labels to grid data
+    # Example: Final output has 'group' column with values 0-7 for 8 sales territories
+    masked_grided_data["group"] = labels
+
+    territory_stats = territory_balance_stats(
+        labels, workload, adjacency, num_sales_man
+    )
+
+    logger.info("Final cluster statistics:")
+    for stats in territory_stats:
+        logger.info(
+            f"  Cluster {stats['group']}: {stats['cells']} cells, "
+            f"{stats['potential_customers']:,.0f} customers "
+            f"({100*stats['share_of_total']:.1f}% of total, "
+            f"{100*stats['deviation_from_target']:+.1f}% vs target, "
+            f"{stats['connected_parts']} connected part(s))"
+        )
+    if territory_stats:
+        worst = max(abs(stats["deviation_from_target"]) for stats in territory_stats)
+        logger.info(f"  Largest deviation from equitable share: {100*worst:.1f}%")
+
+    logger.info("Sales territory clustering completed successfully")
+
+    columns = {
+        name: masked_grided_data[name].values
+        for name in masked_grided_data.columns
+        if name != "geometry"
+    }
+    return shapely.bounds(masked_grided_data.geometry.values), columns, territory_stats
+
+
+def territories_from_arrays(bounds: np.ndarray, columns: dict) -> gpd.GeoDataFrame:
+    """
+    Rebuilds the grid cells returned by `build_territories`, every cell being a box
+    """
+    return gpd.GeoDataFrame(
+        columns,
+        geometry=shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3]),
+        crs="EPSG:4326",
+    )
 
 
 async def get_clusters_for_sales_man(
@@ -977,11 +1587,14 @@ async def get_clusters_for_sales_man(
     `bounding_box` is a list if longitude, latitude pair
     `distance_limit` is the max distace a cosumer is willing to travel to reach destination
     `zoom_level` is the zoom_level for the census data
+    `route_time_budget` is the max number of seconds spent improving each territory route
 
     return:
     ------
-    A geodataframe constaining gridcells (polygons) under geometry column
-    each grid cell is classfied by cluster index under group column
+    A GeoJSON string constaining gridcells (polygons) as features
+    each grid cell is classfied by cluster index under group property
+    and the per territory balance report is added under `territory_stats`
+    and the ordered visiting route of every territory under `routes`
     """
 
     default_zoom = 14
@@ -1061,208 +1674,32 @@ async def get_clusters_for_sales_man(
         f"Removed {original_count - len(places)} duplicate locations, {len(places)} unique places remain"
     )
 
-    # Generate grid-based spatial aggregation with accessibility analysis
-    # Implements spatial tessellation with market potential calculation
-    # Combines population, facilities, income, and accessibility into unified spatial framework
-    logger.info("Generating grid-based spatial aggregation...")
-    grided_data = get_grids_of_data(
-        population_gdf, places, income_gdf, req.distance_limit
-    )
-
-    # Filter to grid cells with actual market potential
-    # Removes empty/irrelevant spatial units to focus clustering on viable areas
-    mask = grided_data.number_of_potential_customers > 0
-    masked_grided_data = grided_data[mask].reset_index(drop=True)
-    if len(masked_grided_data) == 0:
-        logger.error("No grid cells with market potential found!")
-        logger.error("This usually means:")
-        logger.error("  1. Income data contains only NaN values")
-        logger.error(
-            "  2. Spatial join failed to assign population to grid cells"
-        )
-        logger.error("  3. Distance limit is too restrictive")
-    logger.info("Grid filtering results:")
-    logger.info(f"  Total grid cells: {len(grided_data)}")
-    logger.info(
-        f"  Cells with market potential: {len(masked_grided_data)} ({100*len(masked_grided_data)/len(grided_data):.1f}%)"
-    )
-    logger.info(
-        f"  Removed {len(grided_data) - len(masked_grided_data)} empty cells"
-    )
-
-    # Calculate geometric centroids for distance calculations
-    # Converts polygon grid cells to representative point locations
-    # Implements spatial geometry simplification for efficient distance computation
-    centroids = masked_grided_data.geometry.map(shapely.centroid)
-
-    # Convert centroids to coordinate DataFrame for distance matrix calculation
-    nbrs = centroids.to_frame()
-    nbrs["longitude"] = nbrs.geometry.x  # Extract longitude coordinates
-    nbrs["latitude"] = nbrs.geometry.y  # Extract latitude coordinates
-
-    logger.info(f"Calculated centroids for {len(nbrs)} grid cells")
-
-    # Compute distance matrix between all grid cell centroids
-    # Implements spatial proximity analysis for cluster contiguity constraints
-    # Results in symmetric matrix of inter-centroid distances
-    # Example: 450×450 matrix with distances ranging 0.8-28.5 km between grid centroids
-    logger.info("Computing distance matrix between grid centroids...")
-    matrix = haversine(
-        nbrs.latitude.values,
-        nbrs.longitude.values,
-        nbrs.latitude.values,
-        nbrs.longitude.values,
-    )
-
-    # Calculate target market share per salesperson
-    # Implements equitable distribution principle: divide total market equally
-    # Ensures balanced workload assignment across sales territories
-    # Example: 180,000 total customers ÷ 8 salespeople = 22,500 customers per territory
-    total_customers = masked_grided_data["number_of_potential_customers"].sum()
-    equitable_share = total_customers / req.num_sales_man
-
-    logger.info("Market distribution analysis:")
-    logger.info(f"  Total potential customers: {total_customers:,.0f}")
-    logger.info(f"  Target customers per territory: {equitable_share:,.0f}")
-    logger.info(
-        f"  This represents balanced workload distribution across {req.num_sales_man} salespeople"
-    )
-
-    # Initialize clustering data structures
-    used = []  # Track assigned grid cells to prevent overlap
-    groups = {
-        i: [] for i in range(req.num_sales_man)
-    }  # Store cluster assignments
-
-    logger.info("Starting greedy spatial clustering algorithm...")
-
-    # Greedy spatial clustering algorithm with load balancing
-    # Implements modified k-means with spatial contiguity constraints
-    j = 0  # Current cluster index
-    clusters_created = 0
-
-    for i in range(masked_grided_data.shape[0]):
-
-        # Skip grid cells already assigned to clusters
-        # Maintains partition constraint: each cell belongs to exactly one cluster
-        if i in used:
-            continue
-        else:
-            logger.info(f"Creating cluster {j} starting from grid cell {i}")
-
-            # Find spatially contiguous neighbors within capacity limit
-            # Implements greedy nearest-neighbor expansion with load balancing
-            # Example: Starting from grid 25, might select [25, 26, 35, 24, 36, 15] totaling 23,100 customers
-            nbrs = select_nbrs_with_sum(
-                i,  # Current seed grid cell
-                matrix[i],  # Distances from seed to all other cells
-                equitable_share,  # Maximum market capacity per cluster
-                masked_grided_data[
-                    "number_of_potential_customers"
-                ].values,  # Market values
-                used,  # Already assigned cells to avoid
-            )
-
-            # Assign selected neighbors to current cluster
-            groups[j].extend(nbrs)  # Add cells to cluster j
-            used.extend(nbrs)  # Mark cells as assigned
-
-            cluster_customers = sum(
-                masked_grided_data["number_of_potential_customers"].iloc[idx]
-                for idx in nbrs
-            )
-            logger.info(
-                f"Cluster {j} completed: {len(nbrs)} cells, {cluster_customers:,.0f} customers"
-            )
-
-            j += 1  # Move to next cluster
-            clusters_created += 1
-
-        # Stop when all requested clusters are created
-        # Implements termination condition for clustering algorithm
-        if j >= req.num_sales_man:
-            logger.info(
-                f"Reached target number of clusters ({req.num_sales_man})"
-            )
-            break
-
-    logger.info("Clustering completed:")
-    logger.info(f"  Clusters created: {clusters_created}")
-    logger.info(
-        f"  Grid cells assigned: {len(used)}/{len(masked_grided_data)} ({100*len(used)/len(masked_grided_data):.1f}%)"
-    )
-    logger.info(f"  Unassigned cells: {len(masked_grided_data) - len(used)}")
-
-    # Helper function to map grid cell indices to cluster labels
-    # Implements reverse lookup for cluster assignment labeling
-    def return_group_number(index: int) -> int:
-        """
-        Returns back the class/group index for each grid cell based in the `groups` dict
-        `groups` is the dict created in the `get_clusters_for_sales_man`
-        `index`is the index of the gridcell in the `masked_grided_data`
-        """
-        for k, v in groups.items():
-            if index in v:
-                return k
-        return None  # Return None for unassigned cells
-
-    # Apply cluster labels to grid data
-    # Implements final data preparation with cluster identification
-    # Creates new column indicating which sales territory each grid cell belongs to
-    # Example: Final output has 'group' column with values 0-7 for 8 sales territories
-    masked_grided_data = masked_grided_data.assign(group=lambda x: x.index)
-    masked_grided_data["group"] = masked_grided_data["group"].map(
-        return_group_number
-    )
-
-    # Log final cluster statistics
-    cluster_stats = (
-        masked_grided_data.groupby("group")
-        .agg({"number_of_potential_customers": ["sum", "count"]})
-        .round(0)
-    )
-
-    logger.info("Final cluster statistics:")
-    for group_id in range(req.num_sales_man):
-        if group_id in groups:
-            cells = len(groups[group_id])
-            customers = masked_grided_data[
-                masked_grided_data["group"] == group_id
-            ]["number_of_potential_customers"].sum()
-            logger.info(
-                f"  Cluster {group_id}: {cells} cells, {customers:,.0f} customers ({100*customers/total_customers:.1f}% of total)"
-            )
-
-    unassigned = len(masked_grided_data[masked_grided_data["group"].isna()])
-    if unassigned > 0:
-        logger.warning(f"  {unassigned} cells remain unassigned")
-
-    logger.info("Sales territory clustering completed successfully")
-
-
-    # import matplotlib.pyplot as plt
-    # colors = ["Greens", "Reds", "Blues", "Purples", "Oranges", "YlOrBr", "plasma"]
-    # data_columns = [col for col in masked_grided_data.columns if col != 'geometry']
-    # for i, column in enumerate(data_columns):
-    #     # Create a dataframe with geometry FIRST, then the data column
-    #     single_column_data = masked_grided_data[['geometry', column]].copy()
-        
-    #     plot_results(
-    #         single_column_data, 
-    #         n_cols=1, 
-    #         n_rows=1, 
-    #         colors=[colors[i]], 
-    #         alpha=0.75, 
-    #         subplot_size=(8, 8)
-    #     )
-
-    # # For the group plot
-    # group_data = masked_grided_data[["geometry", "group"]].copy()
-    # plot_results(group_data, 1, 1, ["tab20c"], 
-    #             alpha=1, show_legends=False, edge_color=None, show_title=False, 
-    #             subplot_size=(6, 6))
-
-    return masked_grided_data.to_json()
+    # Grid aggregation and territory building are pure CPU work, run them in the compute pool
+    # on plain arrays rather than pickled GeoDataFrames
+    bounds, columns, territory_stats = await run_in_compute_pool(
+        build_territories,
+        shapely.to_wkb(population_gdf.geometry.values),
+        population_gdf["Population_Count"].values,
+        None if income_gdf is None else income_gdf["income"].values.astype(float),
+        places["latitude"].values.astype(float),
+        places["longitude"].values.astype(float),
+        req.distance_limit,
+        req.num_sales_man,
+    )
+    masked_grided_data = territories_from_arrays(bounds, columns)
+
+    # Order the target places of every territory into a visiting route
+    logger.info("Computing visiting routes per territory...")
+    routes = await get_territory_routes(
+        places, masked_grided_data, time_budget=req.route_time_budget
+    )
+
+    # Keep the GeoJSON FeatureCollection shape and add the balance report and the
+    # routes as foreign members
+    territories = json.loads(masked_grided_data.to_json())
+    territories["territory_stats"] = territory_stats
+    territories["routes"] = routes
+    return json.dumps(territories)
 
 
 def plot_results(
@@ -1,4 +1,28 @@
 from dataclasses import dataclass
+from typing import List
+
+# Properties of the "Population Area Intelligence" data type
+# (Backend/area_intelligence_categories.json), the only census columns the queries read
+CENSUS_POPULATION_COLUMNS = [
+    "zoom_level",
+    "population",
+    "TotalPopulation",
+    "PopulationDensity",
+    "MedianAgeMale",
+    "MedianAgeFemale",
+    "HouseholdAverageSize",
+    "HouseholdMedianSize",
+    "MalePopulation",
+    "FemalePopulation",
+]
+
+
+def census_properties(columns: List[str]) -> str:
+    """
+    jsonb_build_object of the given columns of the census row `c`, without the nulls.
+    """
+    pairs = ",\n                ".join(f"'{name}', c.\"{name}\"" for name in columns)
+    return f"jsonb_strip_nulls(jsonb_build_object(\n                {pairs}\n            ))"
 
 
 @dataclass
@@ -51,6 +75,78 @@ class SqlObject:
             AND longitude BETWEEN $4 AND $5
         LIMIT $6 OFFSET $7;
     """
+    # Bounding box queries on the PostGIS geometry columns (database_files/migrations/0001).
+    # Parameters keep the ReqFetchDataset bounding box order (min_lat, max_lat, min_lng, max_lng),
+    # only the projected columns are read and the geometry comes out as GeoJSON text.
+    census_features_w_envelope: str = f"""
+        SELECT ST_AsGeoJSON(c.geom) AS geometry,
+            {census_properties(CENSUS_POPULATION_COLUMNS)}::text AS properties
+        FROM "schema_marketplace".census c
+        WHERE c.population IS NOT NULL
+            AND c.zoom_level = $5
+            AND c.geom && ST_MakeEnvelope($3, $1, $4, $2, 4326);
+    """
+    # Keyset pages: $6 is the last id of the previous page (0 for the first one) and
+    # $7 the page size, NULL reads every remaining row (used by the streaming export)
+    canada_commercial_features_w_envelope_and_property_type: str = """
+        SELECT id, ST_AsGeoJSON(geom) AS geometry,
+            address, price, price_description, property_type, description, region_stats_summary
+        FROM "schema_marketplace".canada_commercial_properties
+        WHERE lower(property_type) LIKE '%' || lower($1) || '%'
+            AND geom && ST_MakeEnvelope($4, $2, $5, $3, 4326)
+            AND id > $6
+        ORDER BY id
+        LIMIT $7;
+    """
+    saudi_real_estate_features_w_envelope_and_category: str = """
+        SELECT id, ST_AsGeoJSON(geom) AS geometry, url, price, category
+        FROM "schema_marketplace".saudi_real_estate
+        WHERE "category" = ANY($1)
+            AND geom && ST_MakeEnvelope($4, $2, $5, $3, 4326)
+            AND id > $6
+        ORDER BY id
+        LIMIT $7;
+    """
+
+    # Covering variant for the zoom partitioned census (database_files/partition_census.py):
+    # census_projected only exposes the columns included in the (latitude, longitude) index of
+    # every zoom_level partition, so the bounding box is answered by an index only scan
+    census_features_w_bbox: str = f"""
+        SELECT json_build_object(
+                'type', 'Point',
+                'coordinates', json_build_array(
+                    c.longitude::double precision, c.latitude::double precision
+                )
+            )::text AS geometry,
+            {census_properties(CENSUS_POPULATION_COLUMNS)}::text AS properties
+        FROM "schema_marketplace".census_projected c
+        WHERE c.population IS NOT NULL
+            AND c.zoom_level = $5
+            AND c.latitude BETWEEN $1 AND $2
+            AND c.longitude BETWEEN $3 AND $4;
+    """
+    table_columns: str = """
+    SELECT column_name, data_type, is_generated = 'ALWAYS' AS is_generated
+    FROM information_schema.columns
+    WHERE table_schema = 'schema_marketplace' AND table_name = $1
+    ORDER BY ordinal_position;
+    """
+
+    create_schema_migrations_table: str = """
+    CREATE SCHEMA IF NOT EXISTS "schema_marketplace";
+
+    CREATE TABLE IF NOT EXISTS "schema_marketplace"."schema_migrations" (
+        name TEXT PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+    load_applied_migrations: str = """
+    SELECT name FROM "schema_marketplace"."schema_migrations";
+    """
+    record_migration: str = """
+    INSERT INTO "schema_marketplace"."schema_migrations" (name) VALUES ($1);
+    """
+
     create_datasets_table: str = """
     CREATE SCHEMA IF NOT EXISTS "schema_marketplace";
     
@@ -58,32 +154,82 @@ class SqlObject:
         filename TEXT PRIMARY KEY,
         request_data JSONB,
         response_data JSONB,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        response_blob BYTEA,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        refresh_attempted_at TIMESTAMP
     );
     """
 
     store_dataset: str = """
     INSERT INTO "schema_marketplace"."datasets" 
-    (filename, request_data, response_data, created_at)
-    VALUES ($1, $2, $3, $4)
+    (filename, request_data, response_data, response_blob, created_at)
+    VALUES ($1, $2, $3, $4, $5)
     ON CONFLICT (filename) 
     DO UPDATE SET 
         request_data = $2,
         response_data = $3,
-        created_at = $4;
+        response_blob = $4,
+        created_at = $5;
     """
 
     load_dataset: str = """
-    SELECT response_data 
+    SELECT response_data, response_blob
     FROM "schema_marketplace"."datasets" 
     WHERE filename = $1;
     """
     load_dataset_with_timestamp: str = """
-    SELECT response_data, created_at
+    SELECT response_data, response_blob, created_at
     FROM "schema_marketplace"."datasets"
     WHERE filename = $1;
     """
 
+    # response_data holds plain JSONB rows, response_blob the ones written with dataset_codec
+    update_dataset_response: str = """
+    UPDATE "schema_marketplace"."datasets"
+    SET response_data = $2, response_blob = $3
+    WHERE filename = $1;
+    """
+    load_datasets_to_backfill: str = """
+    SELECT filename, response_data, response_blob
+    FROM "schema_marketplace"."datasets"
+    WHERE response_blob IS NULL AND response_data IS NOT NULL AND filename > $1
+    ORDER BY filename
+    LIMIT $2;
+    """
+    datasets_storage_size: str = """
+    SELECT count(*) AS rows,
+        coalesce(sum(pg_column_size(response_data)), 0) AS response_data_bytes,
+        coalesce(sum(pg_column_size(response_blob)), 0) AS response_blob_bytes,
+        pg_total_relation_size('"schema_marketplace"."datasets"') AS table_bytes
+    FROM "schema_marketplace"."datasets";
+    """
+
+    # Only rows stored with a replayable request (place details store ""), and not
+    # attempted since $2, so failed or empty refreshes don't take every batch
+    load_datasets_due_for_refresh: str = """
+    SELECT filename, request_data, created_at
+    FROM "schema_marketplace"."datasets"
+    WHERE created_at < $1
+      AND jsonb_typeof(request_data) = 'object'
+      AND (refresh_attempted_at IS NULL OR refresh_attempted_at < $2)
+    ORDER BY created_at
+    LIMIT $3;
+    """
+    mark_datasets_refresh_attempted: str = """
+    UPDATE "schema_marketplace"."datasets"
+    SET refresh_attempted_at = $2
+    WHERE filename = ANY($1::text[]);
+    """
+    delete_expired_datasets: str = """
+    DELETE FROM "schema_marketplace"."datasets"
+    WHERE filename IN (
+        SELECT filename FROM "schema_marketplace"."datasets"
+        WHERE created_at < $1
+        LIMIT $2
+    )
+    RETURNING filename;
+    """
+
     delete_dataset: str = """
     DELETE FROM "schema_marketplace"."datasets"
     WHERE filename = $1;
@@ -3,7 +3,10 @@ import uuid
 from datetime import datetime, date, timedelta, timezone
 from typing import Any, Dict, Tuple, Optional, List
 import json
+import math
 import os
+from urllib.parse import quote
+from contextvars import ContextVar
 from use_json import use_json
 from fastapi import HTTPException, status
 from pydantic import BaseModel
@@ -11,10 +14,17 @@ from backend_common.auth import load_user_profile
 from backend_common.database import Database
 import pandas as pd
 from sql_object import SqlObject
+from page_cursor import cursor_scope, decode_cursor, encode_cursor
+from geojson_serializer import features_from_records
+from dataset_codec import decode_dataset, encode_dataset
+from dataset_cache import DatasetCache
+from bulk_ingestion import copy_upsert
+from viewport_engine import ViewportEngine
 from all_types.request_dtypes import ReqFetchDataset, ReqIntelligenceData
 from all_types.response_dtypes import PopulationViewportData
 from backend_common.logging_wrapper import apply_decorator_to_module
 from backend_common.auth import firebase_db
+from firebase_admin import firestore
 import asyncpg
 from backend_common.background import get_background_tasks
 import orjson
@@ -43,6 +53,19 @@ STORE_CATALOGS_PATH = "Backend/store_catalogs.json"
 DATASET_LAYER_MATCHING_PATH = "Backend/dataset_layer_matching.json"
 DATASETS_PATH = "Backend/datasets"
 USER_LAYER_MATCHING_PATH = "Backend/user_layer_matching.json"
+# Reverse index of the layer matchings, one document per layer
+LAYER_INDEX_COLLECTION = "layer_dataset_index"
+# Monolithic matchings of the layer_matchings collection, still read until
+# migrate_layer_matchings.py --delete-legacy removes them
+LEGACY_MATCHING_COLLECTION = "layer_matchings"
+LEGACY_DATASET_DOCUMENT = "dataset_matching"
+LEGACY_USER_DOCUMENT = "user_matching"
+LEGACY_INDEX_DOCUMENT = "dataset_matching_index"
+# Layer matchings sharded in one document per dataset and one per layer owner
+DATASET_MATCHING_COLLECTION = "dataset_layer_matchings"
+USER_MATCHING_COLLECTION = "user_layer_matchings"
+# Firestore accepts at most 500 writes per batch
+MATCHING_BATCH_SIZE = 500
 METASTORE_PATH = "Backend/layer_category_country_city_matching"
 STORAGE_DIR = "Backend/storage"
 COLOR_PATH = "Backend/gradient_colors.json"
@@ -61,6 +84,13 @@ CENSUS_FILE_MAPPING = {
 }
 
 DEFAULT_LIMIT = 20
+# Stored datasets older than this are never served, the freshness sweeper refreshes
+# them from DATASET_REFRESH_AFTER_DAYS on and deletes the ones it cannot refresh
+DATASET_MAX_AGE_DAYS = 90
+DATASET_REFRESH_AFTER_DAYS = int(os.getenv("DATASET_REFRESH_AFTER_DAYS", "80"))
+# Set while the sweeper revalidates, datasets due for refresh then read as missing
+revalidating_datasets: ContextVar[bool] = ContextVar("revalidating_datasets", default=False)
+EXPORT_CHUNK_SIZE = 2000
 
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
@@ -170,11 +200,22 @@ def make_dataset_filename_part(
 async def fetch_dataset_id(lyr_id: str) -> Tuple[str, Dict]:
     """
     Searches for the dataset ID associated with a given layer ID.
+    Looked up in the layer index, the dataset shards are only scanned for layers missing
+    from it, which are then added to the index. Layers not sharded yet are found in the
+    legacy dataset_matching document.
     """
-    dataset_layer_matching = await load_dataset_layer_matching()
+    d_id = (await load_layer_index_entry(lyr_id)).get("dataset_id")
+    dataset_info = await load_dataset_matching(d_id) if d_id else None
+    if dataset_info is not None and lyr_id in dataset_info["prdcer_lyrs"]:
+        return d_id, dataset_info
 
-    for d_id, dataset_info in dataset_layer_matching.items():
+    for d_id, dataset_info in (await load_dataset_layer_matching()).items():
         if lyr_id in dataset_info["prdcer_lyrs"]:
+            await update_layer_dataset_index(lyr_id, layer_index_entry(d_id))
+            return d_id, dataset_info
+
+    for d_id, dataset_info in load_legacy_matching(LEGACY_DATASET_DOCUMENT).items():
+        if lyr_id in dataset_info.get("prdcer_lyrs", []):
             return d_id, dataset_info
     # raise HTTPException(
     #     status_code=status.HTTP_404_NOT_FOUND, detail="Dataset not found for this layer"
@@ -259,201 +300,296 @@ def fetch_layer_owner(prdcer_lyr_id: str) -> str:
 #         )
 
 
-async def load_dataset_layer_matching() -> Dict:
-    """Load dataset layer matching from Firestore"""
+def layer_index_entry(dataset_id: str) -> Dict:
+    """
+    Layer index entry of a dataset. Google dataset ids ("<lng>_<lat>_<radius>_<query>...")
+    also give the bounding box of the search circle, in the ReqFetchDataset order
+    (min_lat, max_lat, min_lng, max_lng), and the query as category.
+    """
+    entry = {"dataset_id": dataset_id, "bbox": None, "category": None}
+    parts = dataset_id.split("_", 3)
+    try:
+        lng, lat, radius = (float(part) for part in parts[:3])
+    except ValueError:
+        return entry
+    lat_delta = radius / 111_320
+    lng_delta = radius / (111_320 * max(math.cos(math.radians(lat)), 1e-6))
+    entry["bbox"] = [lat - lat_delta, lat + lat_delta, lng - lng_delta, lng + lng_delta]
+    if len(parts) == 4:
+        entry["category"] = parts[3].split("_token=")[0]
+    return entry
+
+
+def matching_shard_id(key: str) -> str:
+    """
+    Document id of a dataset or user shard. Dataset ids may contain "/", which document
+    ids can't, so the key is percent encoded (and kept as a field of the shard).
+    """
+    return quote(key, safe="")
+
+
+async def commit_matching_writes(writes: List[Tuple[str, str, Dict]]):
+    """
+    Commits (collection, document id, fields) merge writes, MATCHING_BATCH_SIZE per batch,
+    fields None deleting the document.
+    Layer lists change through ArrayUnion / ArrayRemove, which Firestore applies to the
+    stored document: concurrent writers of the same shard don't overwrite each other's
+    layers.
+    """
+    client = firebase_db.get_async_client()
+    for start in range(0, len(writes), MATCHING_BATCH_SIZE):
+        batch = client.batch()
+        for collection_name, doc_id, fields in writes[start : start + MATCHING_BATCH_SIZE]:
+            doc_ref = client.collection(collection_name).document(doc_id)
+            if fields is None:
+                batch.delete(doc_ref)
+            else:
+                batch.set(doc_ref, fields, merge=True)
+        await batch.commit()
+
+
+def load_legacy_matching(doc_id: str) -> Dict:
+    """
+    Monolithic matching document from the listened layer_matchings collection, empty
+    once the migration deleted it.
+    """
+    return firebase_db._cache.get(LEGACY_MATCHING_COLLECTION, {}).get(doc_id) or {}
+
+
+async def load_layer_index_entry(lyr_id: str) -> Dict:
+    """
+    Index document of a layer: {layer_id, dataset_id, owner_id, bbox, category}, empty
+    when the layer isn't indexed.
+    """
     try:
-        return await firebase_db.get_document("layer_matchings", "dataset_matching")
+        return await firebase_db.get_document(
+            LAYER_INDEX_COLLECTION, matching_shard_id(lyr_id)
+        )
     except HTTPException as e:
         if e.status_code == status.HTTP_404_NOT_FOUND:
             return {}
         raise e
 
 
-async def update_dataset_layer_matching(
-    prdcer_lyr_id: str, bknd_dataset_id: str, records_count: int = 9191919
-):
-    collection_name = "layer_matchings"
-    document_id = "dataset_matching"
+def stage_layer_index_update(
+    lyr_id: str, fields: Optional[Dict]
+) -> Tuple[str, str, Optional[Dict]]:
+    """
+    Merges `fields` into the cached index document of a layer, or drops it when None.
+    Returns the write persisting that document.
+    """
+    doc_id = matching_shard_id(lyr_id)
+    layer_index = firebase_db._cache[LAYER_INDEX_COLLECTION]
+    if fields is None:
+        layer_index.pop(doc_id, None)
+        return LAYER_INDEX_COLLECTION, doc_id, None
+    fields = {"layer_id": lyr_id, **fields}
+    layer_index[doc_id] = {**(layer_index.get(doc_id) or {}), **fields}
+    return LAYER_INDEX_COLLECTION, doc_id, fields
+
+
+async def update_layer_dataset_index(lyr_id: str, fields: Optional[Dict]):
+    """
+    Merges `fields` into the index document of a layer, or deletes it when None.
+    """
+    get_background_tasks().add_task(
+        commit_matching_writes, [stage_layer_index_update(lyr_id, fields)]
+    )
+
 
+async def load_dataset_matching(dataset_id: str) -> Optional[Dict]:
+    """Shard of a dataset: {dataset_id, records_count, prdcer_lyrs}, None when missing"""
     try:
-        dataset_layer_matching = await firebase_db.get_document(
-            collection_name, document_id
+        return await firebase_db.get_document(
+            DATASET_MATCHING_COLLECTION, matching_shard_id(dataset_id)
         )
     except HTTPException as e:
         if e.status_code == status.HTTP_404_NOT_FOUND:
-            dataset_layer_matching = {}
-        else:
-            raise e
+            return None
+        raise e
 
-    if bknd_dataset_id not in dataset_layer_matching:
-        dataset_layer_matching[bknd_dataset_id] = {
-            "records_count": records_count,
-            "prdcer_lyrs": [],
-        }
 
-    if (
-        prdcer_lyr_id
-        not in dataset_layer_matching[bknd_dataset_id]["prdcer_lyrs"]
-    ):
-        dataset_layer_matching[bknd_dataset_id]["prdcer_lyrs"].append(
-            prdcer_lyr_id
-        )
+async def load_dataset_layer_matching() -> Dict:
+    """
+    dataset id -> shard of every dataset, from the listened shard collection.
+    For scans only, a single dataset is read with load_dataset_matching.
+    """
+    return {
+        shard["dataset_id"]: shard
+        for shard in firebase_db._cache[DATASET_MATCHING_COLLECTION].values()
+    }
 
-    dataset_layer_matching[bknd_dataset_id]["records_count"] = records_count
 
-    # Update cache immediately
-    firebase_db._cache[collection_name][document_id] = dataset_layer_matching
+async def update_dataset_layer_matching(
+    prdcer_lyr_id: str, bknd_dataset_id: str, records_count: int = 9191919
+):
+    shard_id = matching_shard_id(bknd_dataset_id)
+    dataset_matching = await load_dataset_matching(bknd_dataset_id) or {
+        "dataset_id": bknd_dataset_id,
+        "prdcer_lyrs": [],
+    }
+    if prdcer_lyr_id not in dataset_matching["prdcer_lyrs"]:
+        dataset_matching["prdcer_lyrs"].append(prdcer_lyr_id)
+    dataset_matching["records_count"] = records_count
 
-    async def _background_update():
-        doc_ref = (
-            firebase_db.get_async_client()
-            .collection(collection_name)
-            .document(document_id)
+    # Update cache immediately
+    firebase_db._cache[DATASET_MATCHING_COLLECTION][shard_id] = dataset_matching
+
+    writes = [
+        (
+            DATASET_MATCHING_COLLECTION,
+            shard_id,
+            {
+                "dataset_id": bknd_dataset_id,
+                "records_count": records_count,
+                "prdcer_lyrs": firestore.ArrayUnion([prdcer_lyr_id]),
+            },
         )
-        await doc_ref.set(dataset_layer_matching)
-
-    get_background_tasks().add_task(_background_update)
-    return dataset_layer_matching
+    ]
+    writes.append(
+        stage_layer_index_update(prdcer_lyr_id, layer_index_entry(bknd_dataset_id))
+    )
+    get_background_tasks().add_task(commit_matching_writes, writes)
+    return dataset_matching
 
 
 async def delete_dataset_layer_matching(
     prdcer_lyr_id: str, bknd_dataset_id: str, records_count: int = 9191919
 ):
-    collection_name = "layer_matchings"
-    document_id = "dataset_matching"
-
-    try:
-        dataset_layer_matching = await firebase_db.get_document(
-            collection_name, document_id
-        )
-    except HTTPException as e:
-        if e.status_code == status.HTTP_404_NOT_FOUND:
-            dataset_layer_matching = {}
-        else:
-            raise e
-
-    if bknd_dataset_id not in dataset_layer_matching:
-        dataset_layer_matching[bknd_dataset_id] = {
-            "records_count": records_count,
-            "prdcer_lyrs": [],
-        }
+    shard_id = matching_shard_id(bknd_dataset_id)
+    dataset_matching = await load_dataset_matching(bknd_dataset_id)
 
     # Check if the producer layer exists in the dataset
-    if (
-        prdcer_lyr_id
-        not in dataset_layer_matching[bknd_dataset_id]["prdcer_lyrs"]
-    ):
+    if dataset_matching is None or prdcer_lyr_id not in dataset_matching["prdcer_lyrs"]:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Layer {prdcer_lyr_id} not found in dataset {bknd_dataset_id}",
         )
 
     # Remove the layer ID from the dataset's 'prdcer_lyrs' list
-    dataset_layer_matching[bknd_dataset_id]["prdcer_lyrs"].remove(prdcer_lyr_id)
+    dataset_matching["prdcer_lyrs"].remove(prdcer_lyr_id)
 
     # Update cache immediately
-    firebase_db._cache[collection_name][document_id] = dataset_layer_matching
-
-    async def _background_update():
-        # Update the dataset layer matching document in the database
-        doc_ref = (
-            firebase_db.get_async_client()
-            .collection(collection_name)
-            .document(document_id)
+    firebase_db._cache[DATASET_MATCHING_COLLECTION][shard_id] = dataset_matching
+
+    writes = [
+        (
+            DATASET_MATCHING_COLLECTION,
+            shard_id,
+            {
+                "dataset_id": bknd_dataset_id,
+                "prdcer_lyrs": firestore.ArrayRemove([prdcer_lyr_id]),
+            },
         )
-        await doc_ref.set(dataset_layer_matching)
-
+    ]
+    writes.append(stage_layer_index_update(prdcer_lyr_id, None))
     # Run background task to persist the changes in the database
-    get_background_tasks().add_task(_background_update)
+    get_background_tasks().add_task(commit_matching_writes, writes)
 
     return {
         "message": f"Layer {prdcer_lyr_id} removed from dataset {bknd_dataset_id} successfully"
     }
 
 
-async def load_user_layer_matching() -> Dict:
-    """Load user layer matching from Firestore"""
+async def load_user_matching(user_id: str) -> Optional[Dict]:
+    """Shard of a user: {user_id, prdcer_lyrs}, None when missing"""
     try:
-        return await firebase_db.get_document("layer_matchings", "user_matching")
+        return await firebase_db.get_document(
+            USER_MATCHING_COLLECTION, matching_shard_id(user_id)
+        )
     except HTTPException as e:
         if e.status_code == status.HTTP_404_NOT_FOUND:
-            return {}
+            return None
         raise e
 
 
-async def update_user_layer_matching(layer_id: str, layer_owner_id: str):
-    collection_name = "layer_matchings"
-    document_id = "user_matching"
-
-    try:
-        user_layer_matching = await firebase_db.get_document(
-            collection_name, document_id
-        )
-    except HTTPException as e:
-        if e.status_code == status.HTTP_404_NOT_FOUND:
-            user_layer_matching = {}
-        else:
-            raise e
+async def load_user_layer_matching() -> Dict:
+    """
+    layer id -> owner id of every layer, from the listened user shards.
+    For scans only, the owner of a layer is read with load_layer_owner.
+    """
+    return {
+        lyr_id: shard["user_id"]
+        for shard in firebase_db._cache[USER_MATCHING_COLLECTION].values()
+        for lyr_id in shard.get("prdcer_lyrs", [])
+    }
 
-    user_layer_matching[layer_id] = layer_owner_id
 
-    # Update cache immediately
-    firebase_db._cache[collection_name][document_id] = user_layer_matching
+async def load_layer_owner(layer_id: str, repair_index: bool = True) -> Optional[str]:
+    """
+    Owner of a layer from the layer index, checked against the owner's shard.
+    Layers missing from the index are looked up in every user shard, then indexed.
+    Layers not sharded yet are found in the legacy user_matching document.
+    """
+    owner_id = (await load_layer_index_entry(layer_id)).get("owner_id")
+    if owner_id is not None:
+        user_matching = await load_user_matching(owner_id)
+        if user_matching is not None and layer_id in user_matching["prdcer_lyrs"]:
+            return owner_id
 
-    async def _background_update():
-        doc_ref = (
-            firebase_db.get_async_client()
-            .collection(collection_name)
-            .document(document_id)
-        )
-        await doc_ref.set(user_layer_matching)
+    owner_id = (await load_user_layer_matching()).get(layer_id)
+    if owner_id is not None and repair_index:
+        await update_layer_dataset_index(layer_id, {"owner_id": owner_id})
+    if owner_id is None:
+        owner_id = load_legacy_matching(LEGACY_USER_DOCUMENT).get(layer_id)
+    return owner_id
 
-    get_background_tasks().add_task(_background_update)
-    return user_layer_matching
 
+async def update_user_layer_matching(layer_id: str, layer_owner_id: str):
+    shard_id = matching_shard_id(layer_owner_id)
+    user_matching = await load_user_matching(layer_owner_id) or {
+        "user_id": layer_owner_id,
+        "prdcer_lyrs": [],
+    }
+    if layer_id not in user_matching["prdcer_lyrs"]:
+        user_matching["prdcer_lyrs"].append(layer_id)
 
-async def delete_user_layer_matching(layer_id: str):
-    collection_name = "layer_matchings"
-    document_id = "user_matching"
+    # Update cache immediately
+    firebase_db._cache[USER_MATCHING_COLLECTION][shard_id] = user_matching
 
-    try:
-        # Fetch the current layer matching data
-        user_layer_matching = await firebase_db.get_document(
-            collection_name, document_id
+    writes = [
+        (
+            USER_MATCHING_COLLECTION,
+            shard_id,
+            {"user_id": layer_owner_id, "prdcer_lyrs": firestore.ArrayUnion([layer_id])},
         )
-    except HTTPException as e:
-        # Handle cases where the document is not found
-        if e.status_code == status.HTTP_404_NOT_FOUND:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User layer matching document not found",
-            )
-        else:
-            raise e
+    ]
+    writes.append(stage_layer_index_update(layer_id, {"owner_id": layer_owner_id}))
+    get_background_tasks().add_task(commit_matching_writes, writes)
+    return user_matching
 
-    # Check if the layer_id exists in the mapping
-    if layer_id not in user_layer_matching:
+
+async def delete_user_layer_matching(layer_id: str):
+    # Not repaired into the index, the layer is going away
+    layer_owner_id = await load_layer_owner(layer_id, repair_index=False)
+    if layer_owner_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Layer {layer_id} not found in the user layer matching.",
         )
 
-    # Remove the layer from the user_layer_matching
-    del user_layer_matching[layer_id]
+    shard_id = matching_shard_id(layer_owner_id)
+    user_matching = await load_user_matching(layer_owner_id)
+    if user_matching is None or layer_id not in user_matching["prdcer_lyrs"]:
+        # Only in the legacy document, the migration hasn't run yet
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Layer {layer_id} is not migrated to the user layer shards yet.",
+        )
+    user_matching["prdcer_lyrs"].remove(layer_id)
 
     # Update cache immediately
-    firebase_db._cache[collection_name][document_id] = user_layer_matching
-
-    # Background update to persist the change in the database
-    async def _background_update():
-        doc_ref = (
-            firebase_db.get_async_client()
-            .collection(collection_name)
-            .document(document_id)
-        )
-        await doc_ref.set(user_layer_matching)
+    firebase_db._cache[USER_MATCHING_COLLECTION][shard_id] = user_matching
 
-    get_background_tasks().add_task(_background_update)
+    writes = [
+        (
+            USER_MATCHING_COLLECTION,
+            shard_id,
+            {"user_id": layer_owner_id, "prdcer_lyrs": firestore.ArrayRemove([layer_id])},
+        )
+    ]
+    writes.append(stage_layer_index_update(layer_id, None))
+    get_background_tasks().add_task(commit_matching_writes, writes)
     return {"message": f"Layer {layer_id} removed successfully."}
 
 
@@ -550,9 +686,10 @@ async def store_place_details(filename_id: str, place_details: dict):
             SqlObject.store_dataset,
             filename_id,
             json.dumps(""),
-            json.dumps(place_details),
+            *encode_dataset(place_details),
             datetime.utcnow(),
         )
+        await DatasetCache.invalidate(filename_id)
 
 
 async def store_data_resp(
@@ -578,14 +715,18 @@ async def store_data_resp(
         if dataset.get("features"):
             # Convert request object to dictionary using Pydantic's model_dump
             req_dict = req.model_dump()
+            # JSONB or a compressed blob depending on DATASET_CODEC
+            response_data, response_blob = encode_dataset(dataset)
 
             await Database.execute(
                 SqlObject.store_dataset,
                 file_name,
                 json.dumps(req_dict),
-                json.dumps(dataset),
+                response_data,
+                response_blob,
                 datetime.utcnow(),
             )
+            await DatasetCache.invalidate(file_name)
 
             return file_name
 
@@ -594,12 +735,54 @@ async def store_data_resp(
         await Database.execute(SqlObject.create_datasets_table)
         return await store_data_resp(req, dataset, file_name)
 
+
+async def store_data_resps(req: ReqFetchDataset, datasets: Dict[str, Dict]) -> List[str]:
+    """
+    Stores several datasets of the same request at once, like store_data_resp, with a
+    single COPY into a staging table merged into the datasets table.
+
+    Returns:
+        List[str]: Filenames that were stored
+    """
+    request_data = json.dumps(req.model_dump())
+    created_at = datetime.utcnow()
+    rows = []
+    for file_name, dataset in datasets.items():
+        dataset["features"] = [
+            feature
+            for feature in dataset.get("features", [])
+            if feature["properties"]["id"] != "n/a"
+        ]
+        if dataset["features"]:
+            rows.append(
+                (file_name, request_data, *encode_dataset(dataset), created_at)
+            )
+    if not rows:
+        return []
+
+    try:
+        await copy_upsert(
+            '"schema_marketplace"."datasets"',
+            ["filename", "request_data", "response_data", "response_blob", "created_at"],
+            "filename",
+            [rows],
+            progress_callback=None,
+        )
+    except asyncpg.exceptions.UndefinedTableError:
+        await Database.execute(SqlObject.create_datasets_table)
+        return await store_data_resps(req, datasets)
+
+    for row in rows:
+        await DatasetCache.invalidate(row[0])
+    return [row[0] for row in rows]
+
+
 async def load_place_details(place_id: str) -> Optional[dict]:
     json_content = await Database.fetchrow(
         SqlObject.load_dataset_with_timestamp, place_id
     )
     if json_content:
-        json_content = orjson.loads(json_content.get("response_data", "{}"))
+        json_content = decode_dataset(json_content)
     return json_content
 
 
@@ -614,7 +797,6 @@ async def load_dataset(dataset_id: str, fetch_full_plan_datasets=False) -> Dict:
     # using the page number and the plan , load and concatenate all datasets from the plan that have page number equal to that number or less
     # each dataset is a list of dictionaries , so just extend the list  and save the big final list into dataset variable
     # else load dataset with dataset id
-    three_months_ago = datetime.now(timezone.utc) - timedelta(days=90)
 
     if "plan" in dataset_id and fetch_full_plan_datasets:
         # Extract plan name and page number
@@ -668,18 +850,8 @@ async def load_dataset(dataset_id: str, fetch_full_plan_datasets=False) -> Dict:
         properties_set = set()  # Initialize a set to store unique properties
         for i in range(page_number):
             dataset_id = new_plan[i]  # Get the formatted item for this page
-            json_content = await Database.fetchrow(
-                SqlObject.load_dataset_with_timestamp, dataset_id
-            )
-            if json_content:
-                created_at = json_content.get("created_at")
-                if created_at.tzinfo is None:
-                    created_at = created_at.replace(tzinfo=timezone.utc)
-                if created_at and created_at < three_months_ago:
-                    await Database.execute(SqlObject.delete_dataset, dataset_id)
-                    json_content = None
-            if json_content:
-                dataset = orjson.loads(json_content.get("response_data", "{}"))
+            dataset = await load_stored_dataset(dataset_id)
+            if dataset:
                 all_features.extend(dataset.get("features", []))
                 properties_set.update(dataset.get("properties", []))
         if all_features:
@@ -687,22 +859,57 @@ async def load_dataset(dataset_id: str, fetch_full_plan_datasets=False) -> Dict:
             feat_collec["features"] = all_features
             feat_collec["properties"] = list(properties_set)
     else:
-        feat_collec = None
+        feat_collec = await load_stored_dataset(dataset_id)
+
+    return feat_collec
+
+
+async def load_stored_dataset(dataset_id: str) -> Optional[Dict]:
+    """
+    Reads one row of the datasets table through DatasetCache.
+    Rows past DATASET_MAX_AGE_DAYS read as missing so the caller fetches them again, they
+    are never deleted here (see dataset_sweeper).
+    """
+    cached = DatasetCache.get(dataset_id)
+    if cached is not None:
+        created_at, dataset = cached
+    else:
+        generation = DatasetCache.generation()
         json_content = await Database.fetchrow(
             SqlObject.load_dataset_with_timestamp, dataset_id
         )
-        if json_content:
-            created_at = json_content.get("created_at")
-            if created_at.tzinfo is None:
-                created_at = created_at.replace(tzinfo=timezone.utc)
-            if created_at and created_at < three_months_ago:
-                await Database.execute(SqlObject.delete_dataset, dataset_id)
-                json_content = None
+        if not json_content:
+            return None
+        created_at = json_content.get("created_at")
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        dataset = decode_dataset(json_content)
+        DatasetCache.put(dataset_id, created_at, dataset, generation)
+
+    max_age = (
+        DATASET_REFRESH_AFTER_DAYS
+        if revalidating_datasets.get()
+        else DATASET_MAX_AGE_DAYS
+    )
+    if created_at < datetime.now(timezone.utc) - timedelta(days=max_age):
+        return None
+    return dataset
 
-        if json_content:
-            feat_collec = orjson.loads(json_content.get("response_data", "{}"))
 
-    return feat_collec
+# None until the first census query tells whether the zoom partitioned census is there,
+# probed again once CENSUS_PARTITION_RECHECK_SECONDS have passed since it was found missing
+census_partitioned: Optional[bool] = None
+census_partition_checked_at = 0.0
+CENSUS_PARTITION_RECHECK_SECONDS = float(
+    os.getenv("CENSUS_PARTITION_RECHECK_SECONDS", "300")
+)
+# Census queries of each data type: on the zoom partitioned census, then on the plain table
+CENSUS_QUERIES = {
+    "Population Area Intelligence": (
+        SqlObject.census_features_w_bbox,
+        SqlObject.census_features_w_envelope,
+    ),
+}
 
 
 async def get_census_dataset_from_storage(
@@ -720,42 +927,41 @@ async def get_census_dataset_from_storage(
     # Determine which CSV file to use based on included types
     # data_type = req.included_types[0]  # Using first type for now
 
-    if data_type in ["Population Area Intelligence"]:
-        query = SqlObject.census_w_bounding_box
+    global census_partitioned, census_partition_checked_at
+    if data_type not in CENSUS_QUERIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No census data for {data_type}",
+        )
+    bbox_query, envelope_query = CENSUS_QUERIES[data_type]
+    if (
+        census_partitioned is False
+        and time.monotonic() - census_partition_checked_at
+        > CENSUS_PARTITION_RECHECK_SECONDS
+    ):
+        census_partitioned = None
+    query = bbox_query if census_partitioned is not False else envelope_query
     # elif data_type in ["Housing Area Intelligence"]:
     #     query = SqlObject.census_w_bounding_box
     # elif data_type in ["Income Area Intelligence"]:
     #     query = SqlObject.economic_w_bounding_box
 
-    city_data = await Database.fetch(
-        query, *request_location._bounding_box, request_location.zoom_level
-    )
-    city_df = pd.DataFrame([dict(record) for record in city_data], dtype=object)
-    # city_df = pd.DataFrame(city_data, dtype=object)
-
-    # Convert to GeoJSON format
-    features = []
-    for _, row in city_df.iterrows():
-        # Parse coordinates from Degree column
-        coordinates = [float(row["longitude"]), float(row["latitude"])]
-
-        # Create properties dict excluding certain columns
-        columns_to_drop = ["latitude", "longitude", "city"]
-        if "country" in row:
-            columns_to_drop.append("country")
-
-        row = row.dropna()
-        properties = row.drop(columns_to_drop).to_dict()
-
-        if len(row) == 0:
-            continue
-
-        feature = {
-            "type": "Feature",
-            "geometry": {"type": "Point", "coordinates": coordinates},
-            "properties": properties,
-        }
-        features.append(feature)
+    try:
+        city_data = await Database.fetch(
+            query, *request_location._bounding_box, request_location.zoom_level
+        )
+    except asyncpg.exceptions.UndefinedTableError:
+        # census_projected only exists once database_files/partition_census.py has run
+        census_partitioned = False
+        census_partition_checked_at = time.monotonic()
+        city_data = await Database.fetch(
+            envelope_query,
+            *request_location._bounding_box,
+            request_location.zoom_level,
+        )
+
+    # Geometry and properties (nulls and location columns already dropped) come from PostGIS
+    features = features_from_records(city_data, properties_column="properties")
 
     # Create GeoJSON structure similar to Google Maps API response
     geojson_data = {"type": "FeatureCollection", "features": features}
@@ -780,41 +986,26 @@ async def get_commercial_properties_dataset_from_storage(
     """
     data_type = request_location.included_types[0]
 
-    page_number = 0
-    if next_page_token:
-        page_number = int(next_page_token)
-
-    offset = page_number * DEFAULT_LIMIT
+    # Keyset pagination on id, the token is bound to the property type and bounding box
+    scope = cursor_scope(
+        "canada_commercial_properties", data_type, request_location._bounding_box
+    )
+    last_id = decode_cursor(next_page_token, scope) or 0
 
-    query = SqlObject.canada_commercial_w_bounding_box_and_property_type
+    query = SqlObject.canada_commercial_features_w_envelope_and_property_type
 
     city_data = await Database.fetch(
         query,
         data_type.replace("_", " "),
         *request_location._bounding_box,
-        DEFAULT_LIMIT,
-        offset,
+        last_id,
+        DEFAULT_LIMIT + 1,
     )
-    city_df = pd.DataFrame([dict(record) for record in city_data])
-
-    # Convert to GeoJSON format
-    features = []
-    for _, row in city_df.iterrows():
-        # Parse coordinates from Degree column
-        coordinates = [float(row["longitude"]), float(row["latitude"])]
-
-        # Create properties dict excluding certain columns
-        columns_to_drop = ["latitude", "longitude", "city"]
-        if "country" in row:
-            columns_to_drop.append("country")
-        properties = row.drop(columns_to_drop).to_dict()
-
-        feature = {
-            "type": "Feature",
-            "geometry": {"type": "Point", "coordinates": coordinates},
-            "properties": properties,
-        }
-        features.append(feature)
+    # One extra row tells whether another page exists
+    has_next_page = len(city_data) > DEFAULT_LIMIT
+    city_data = city_data[:DEFAULT_LIMIT]
+
+    features = features_from_records(city_data, exclude=("id",))
 
     # Create GeoJSON structure similar to Google Maps API response
     geojson_data = {"type": "FeatureCollection", "features": features}
@@ -823,10 +1014,9 @@ async def get_commercial_properties_dataset_from_storage(
     if not filename:
         filename = f"commercial_canada_{request_location.city_name.lower()}_{data_type}"
 
-    if len(features) < DEFAULT_LIMIT:
-        next_page_token = ""
-    else:
-        next_page_token = str(page_number + 1)
+    next_page_token = (
+        encode_cursor(scope, city_data[-1]["id"]) if has_next_page else ""
+    )
 
     return geojson_data, filename, next_page_token
 
@@ -847,37 +1037,20 @@ async def get_real_estate_dataset_from_storage(
     # filtered_categories = [item for item in realEstateData if item in req.included_types]
     # final_categories = [item for item in filtered_categories if item not in req.excludedTypes]
 
-    page_number = 0
-    if next_page_token:
-        page_number = int(next_page_token)
+    # Keyset pagination on id, the token is bound to the categories and bounding box
+    scope = cursor_scope("saudi_real_estate", data_type, request_location._bounding_box)
+    last_id = decode_cursor(next_page_token, scope) or 0
 
-    offset = page_number * DEFAULT_LIMIT
-    query = SqlObject.saudi_real_estate_w_bounding_box_and_category
+    query = SqlObject.saudi_real_estate_features_w_envelope_and_category
 
     city_data = await Database.fetch(
-        query, data_type, *request_location._bounding_box, DEFAULT_LIMIT, offset
+        query, data_type, *request_location._bounding_box, last_id, DEFAULT_LIMIT + 1
     )
+    # One extra row tells whether another page exists
+    has_next_page = len(city_data) > DEFAULT_LIMIT
+    city_data = city_data[:DEFAULT_LIMIT]
 
-    city_df = pd.DataFrame([dict(record) for record in city_data])
-
-    # Convert to GeoJSON format
-    features = []
-    for _, row in city_df.iterrows():
-        # Parse coordinates from Degree column
-        coordinates = [float(row["longitude"]), float(row["latitude"])]
-
-        # Create properties dict excluding certain columns
-        columns_to_drop = ["latitude", "longitude", "city"]
-        if "country" in row:
-            columns_to_drop.append("country")
-        properties = row.drop(columns_to_drop).to_dict()
-
-        feature = {
-            "type": "Feature",
-            "geometry": {"type": "Point", "coordinates": coordinates},
-            "properties": properties,
-        }
-        features.append(feature)
+    features = features_from_records(city_data, exclude=("id",))
 
     # Create GeoJSON structure similar to Google Maps API response
     geojson_data = {"type": "FeatureCollection", "features": features}
@@ -886,94 +1059,66 @@ async def get_real_estate_dataset_from_storage(
     if not filename:
         filename = f"saudi_real_estate_{request_location.city_name.lower()}_{data_type}"
 
-    if len(features) < DEFAULT_LIMIT:
-        next_page_token = ""
-    else:
-        next_page_token = str(page_number + 1)
+    next_page_token = (
+        encode_cursor(scope, city_data[-1]["id"]) if has_next_page else ""
+    )
 
     return geojson_data, filename, next_page_token
 
 
-async def fetch_db_categories_by_lat_lng(bounding_box: list[float]) -> Dict:
-    # call db with bounding box
-    pass
+async def stream_storage_dataset(
+    data_type: str, request_location: ReqFetchDataset, chunk_size: int = EXPORT_CHUNK_SIZE
+):
+    """
+    Streams every real estate or commercial feature inside the bounding box through a
+    server side cursor, in lists of at most `chunk_size` features, without paging.
+    """
+    if data_type == "real_estate" or (
+        data_type == "commercial" and request_location.country_name == "Saudi Arabia"
+    ):
+        query = SqlObject.saudi_real_estate_features_w_envelope_and_category
+        first_arg = request_location._included_types
+    elif data_type == "commercial":
+        query = SqlObject.canada_commercial_features_w_envelope_and_property_type
+        first_arg = request_location.included_types[0].replace("_", " ")
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Streaming is not available for {data_type} datasets",
+        )
 
+    # A NULL limit reads every row after id 0
+    async for records in Database.iterate(
+        query, first_arg, *request_location._bounding_box, 0, None, chunk_size=chunk_size
+    ):
+        yield features_from_records(records, exclude=("id",))
 
-def combine_income_and_population_data(population_data, income_data):
-    # Create a lookup dictionary from income data using Main_ID as key
-    income_lookup = {}
-    for feature in income_data['features']:
-        main_id = feature['properties']['Main_ID']
-        income_lookup[main_id] = feature['properties']['income']  # Only store the income value
-    
-    # Create a copy of population data to avoid modifying the original
-    combined_data = population_data.copy()
-    combined_data['features'] = []
-    combined_data['properties'].append("Income") 
-
-    # Loop through population features and add income data
-    for pop_feature in population_data['features']:
-        # Create a copy of the population feature
-        combined_feature = pop_feature.copy()
-        combined_feature['properties'] = pop_feature['properties'].copy()
-        
-        # Get the Main_ID
-        main_id = pop_feature['properties']['Main_ID']
-        
-        # Add income property if matching Main_ID exists
-        if main_id in income_lookup:
-            combined_feature['properties']['income'] = income_lookup[main_id]
-        else:
-            combined_feature['properties']['income'] = None
-        
-        combined_data['features'].append(combined_feature)
-    
-    return combined_data
 
+async def fetch_db_categories_by_lat_lng(bounding_box: list[float]) -> Dict:
+    # call db with bounding box
+    pass
 
 
 async def fetch_intelligence_by_viewport(req: ReqIntelligenceData) -> Dict:
     """
-    Fetches population data from local GeoJSON files based on viewport and zoom level.
+    Fetches population data for a viewport and zoom level from the preloaded census index.
     """
     #TODO first check if the user has purchased intelligence
 
-    file_path = f"Backend/population_json_files/v{req.zoom_level}/all_features.geojson"
-    population_data = await use_json(file_path, "r")
-
-
-    # Load only the required portion from the GeoJSON
-    # This avoids creating a full GeoDataFrame which can be slow
-    filtered_features = []
-    for feature in population_data.get("features", []):
-        # For polygon features, do a basic bounds check (faster than full intersection)
-        geom_type = feature.get("geometry", {}).get("type")
-        coords = feature.get("geometry", {}).get("coordinates", [])
-            
-        # Simple bounding box check (this is much faster than full geometric operations)
-        if geom_type == "Polygon":
-            # Extract the bounds of the polygon (min/max lng/lat)
-            flat_coords = [point for ring in coords for point in ring]
-            lngs = [p[0] for p in flat_coords]
-            lats = [p[1] for p in flat_coords]
-            
-            # Check if polygon bbox overlaps viewport
-            poly_min_lng = min(lngs)
-            poly_max_lng = max(lngs)
-            poly_min_lat = min(lats)
-            poly_max_lat = max(lats)
-            
-            # If polygon bounding box overlaps viewport, include it
-            if (poly_min_lng <= req.max_lng and poly_max_lng >= req.min_lng and
-                poly_min_lat <= req.max_lat and poly_max_lat >= req.min_lat):
-                filtered_features.append(feature)    
-
+    zoom_index, positions = await ViewportEngine.query(
+        req.zoom_level, req.min_lng, req.min_lat, req.max_lng, req.max_lat
+    )
+    # if income is also true add the income of each area, matched on Main_ID
+    filtered_features = zoom_index.select_features(positions, income=bool(req.income))
 
     # Extract properties from first feature if available
     properties = []
     if filtered_features and len(filtered_features) > 0:
         properties = list(filtered_features[0].get("properties", {}).keys())
-    
+    if req.income:
+        # the joined income is listed under its display name
+        properties = [name for name in properties if name != "income"] + ["Income"]
+
     # Return raw dictionary instead of Pydantic model to avoid validation errors
     intelligence_geojson = {
         "type": "FeatureCollection",
@@ -981,14 +1126,23 @@ async def fetch_intelligence_by_viewport(req: ReqIntelligenceData) -> Dict:
         "properties": properties,
         "records_count": len(filtered_features)
     }
-    # if income is also true load income
-    if req.income:
-        income_file_path = f"Backend/area_income_geojson/v{req.zoom_level}/all_features.geojson"
-        income_data = await use_json(income_file_path, "r")
-        intelligence_geojson = combine_income_and_population_data(intelligence_geojson, income_data)
 
     return intelligence_geojson
 
+
+async def fetch_population_and_income_by_viewport(
+    min_lng: float, min_lat: float, max_lng: float, max_lat: float, zoom_level: int
+) -> gpd.GeoDataFrame:
+    """
+    Returns the census polygons whose bounding box overlaps the viewport, with the
+    population columns and the joined `income` column, in a single spatial index query.
+    """
+    zoom_index, positions = await ViewportEngine.query(
+        zoom_level, min_lng, min_lat, max_lng, max_lat
+    )
+    return zoom_index.census_rows(positions)
+
+
 async def get_full_load_geojson(filenames: list[str]) -> str:
 
     formatted_filenames_list = []
@@ -0,0 +1,38 @@
+import orjson
+
+from bulk_ingestion import chunked, geojson_point_rows, iter_geojson_features
+
+
+def _features(count):
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [46.0 + i, 24.0 + i]},
+            "properties": {"name": f"place [{i}], \"quoted\""},
+        }
+        for i in range(count)
+    ]
+
+
+def test_iter_geojson_features_across_small_reads(tmp_path):
+    features = _features(25)
+    collection = tmp_path / "collection.geojson"
+    collection.write_bytes(
+        orjson.dumps({"type": "FeatureCollection", "features": features}, option=orjson.OPT_INDENT_2)
+    )
+    ndjson = tmp_path / "features.ndjson"
+    ndjson.write_bytes(b"\n".join(orjson.dumps(feature) for feature in features) + b"\n")
+
+    assert list(iter_geojson_features(str(collection), read_size=7)) == features
+    assert list(iter_geojson_features(str(ndjson), read_size=7)) == features
+
+
+def test_point_rows_are_chunked_and_skip_invalid_coordinates():
+    features = _features(5)
+    features[2]["geometry"]["coordinates"] = [46.0]
+
+    chunks = list(chunked(geojson_point_rows(features), 2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert chunks[0][0][0] == "46.0_24.0"
+    assert orjson.loads(chunks[1][1][1]) == features[4]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from backend_common.compute_pool import ComputePool, run_in_compute_pool
+from recoler_filter import compute_influence_scores, surrounding_metric_inputs
+
+
+def weighted_sum(values, weight=1.0):
+    return float(np.sum(values) * weight)
+
+
+def failing_task():
+    raise ValueError("boom")
+
+
+@pytest.mark.asyncio
+async def test_run_in_compute_pool_returns_result_and_records_metrics():
+    result = await run_in_compute_pool(weighted_sum, np.arange(5), weight=2.0)
+    assert result == 20.0
+
+    with pytest.raises(ValueError):
+        await run_in_compute_pool(failing_task)
+
+    metrics = ComputePool.get_metrics()
+    assert metrics["started"] is True
+    assert metrics["in_flight"] == 0 and metrics["queue_depth"] == 0
+    assert metrics["tasks"]["weighted_sum"]["count"] >= 1
+    assert metrics["tasks"]["weighted_sum"]["avg_seconds"] >= 0
+    assert metrics["tasks"]["failing_task"]["failed"] >= 1
+    ComputePool.shutdown()
+
+
+def test_influence_scores_only_fail_on_nearby_non_numeric_values():
+    def point(lng, lat, rating):
+        return {"geometry": {"coordinates": [lng, lat]}, "properties": {"rating": rating}}
+
+    based_on = {
+        "features": [
+            point(46.600, 24.700, 4),
+            point(46.601, 24.700, ""),
+            point(46.700, 24.800, "n/a"),
+        ]
+    }
+    inputs = surrounding_metric_inputs("rating", based_on)
+
+    scores = compute_influence_scores(
+        np.array([24.700, 24.0]), np.array([46.600, 46.0]), *inputs, 500.0
+    )
+    assert scores == [4.0, None]
+
+    with pytest.raises(ValueError):
+        compute_influence_scores(np.array([24.800]), np.array([46.700]), *inputs, 500.0)
@@ -0,0 +1,126 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from backend_common.database import Database, last_write_at
+
+
+class FakePool:
+    def __init__(self, name):
+        self.name = name
+        self.in_use = 0
+        self.closed = False
+        self.released = asyncio.Event()
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.in_use += 1
+        try:
+            yield self
+        finally:
+            self.in_use -= 1
+            if not self.in_use:
+                self.released.set()
+
+    async def close(self):
+        if self.in_use:
+            await self.released.wait()
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(0)
+        return self.name
+
+    def get_size(self):
+        return 4
+
+    def get_idle_size(self):
+        return 4 - self.in_use
+
+    def get_min_size(self):
+        return 1
+
+    def get_max_size(self):
+        return 10
+
+
+@pytest.fixture
+def database(monkeypatch):
+    old_pool = FakePool("old")
+    monkeypatch.setattr(Database, "pool", old_pool)
+    monkeypatch.setattr(Database, "replica_pools", [])
+    monkeypatch.setattr(Database, "last_refresh_time", float("inf"))
+    monkeypatch.setattr(Database, "refresh_interval", 3600)
+    monkeypatch.setattr(Database, "draining_pools", set())
+    monkeypatch.setattr(Database, "statement_stats", {})
+    monkeypatch.setattr(Database, "statement_names", {})
+    last_write_at.set(0.0)
+    return old_pool
+
+
+@pytest.mark.asyncio
+async def test_refresh_drains_old_pool_after_connections_are_released(database):
+    old_pool = database
+    new_pool = FakePool("new")
+
+    async def create_pool():
+        Database.pool = new_pool
+        Database.last_refresh_time = float("inf")
+
+    with patch.object(Database, "create_pool", AsyncMock(side_effect=create_pool)):
+        async with Database.connection() as conn:
+            # The stale pool is rotated while this connection is still in use
+            assert conn is old_pool
+            await Database.refresh_pool()
+            assert Database.pool is new_pool
+            await asyncio.sleep(0)
+            assert not old_pool.closed
+            async with Database.connection() as other:
+                assert other is new_pool
+        await asyncio.gather(*Database.draining_pools)
+        assert old_pool.closed and not new_pool.closed
+        assert Database.get_metrics()["draining_pools"] == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_report_pool_usage_and_statement_timings(database):
+    database.execute = AsyncMock(return_value="INSERT 0 1")
+
+    class Statements:
+        store_thing = "INSERT INTO things VALUES ($1)"
+
+    Database.register_statements(Statements)
+    await Database.execute(Statements.store_thing, 1)
+    await Database.execute("UPDATE   things\n SET a = 1")
+
+    metrics = Database.get_metrics()
+    assert metrics["primary"] == {"size": 4, "idle": 4, "in_use": 0, "min_size": 1, "max_size": 10}
+    assert metrics["acquire"]["count"] >= 2
+    assert metrics["statements"]["store_thing"]["count"] == 1
+    assert metrics["statements"]["UPDATE things SET a = 1"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_statement_logs_describe_large_arguments_unless_slow(database, monkeypatch, caplog):
+    database.execute = AsyncMock(return_value="INSERT 0 1")
+    payload = "x" * 5_000_000
+    caplog.set_level("INFO", logger="backend_common.database")
+
+    await Database.execute("INSERT INTO datasets VALUES ($1, $2)", "a", payload)
+    line = caplog.records[-1].getMessage()
+    assert "'a'" in line and "str[5000000 B, crc" in line and "xxxx" not in line
+
+    with Database.full_sql_logging():
+        await Database.execute("INSERT INTO datasets VALUES ($1, $2)", "a", payload)
+    line = caplog.records[-1].getMessage()
+    assert "VALUES ('a', 'xxx" in line and "(5000000 chars)" in line and len(line) < 1000
+
+    monkeypatch.setattr(Database, "slow_query_seconds", 0.0)
+    await Database.execute("UPDATE datasets SET a = $1 WHERE b = $10", 1, *range(2, 11))
+    assert caplog.records[-1].levelname == "WARNING"
+    assert "SET a = 1 WHERE b = 10" in caplog.records[-1].getMessage()
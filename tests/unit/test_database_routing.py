@@ -0,0 +1,102 @@
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+
+from backend_common.database import Database, is_read_only_query, last_write_at
+
+
+class FakeConnection:
+    def __init__(self, name, lag=0.0):
+        self.name = name
+        self.lag = lag
+
+    async def fetch(self, query, *args):
+        return [self.name]
+
+    async def fetchrow(self, query, *args):
+        return self.name
+
+    async def fetchval(self, query, *args):
+        return self.lag
+
+    async def execute(self, query, *args):
+        return self.name
+
+
+class FakePool:
+    def __init__(self, name, lag=0.0):
+        self.connection = FakeConnection(name, lag)
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    primary = FakePool("primary")
+    replicas = [FakePool("replica-0"), FakePool("replica-1", lag=60.0)]
+    monkeypatch.setattr(Database, "pool", primary)
+    monkeypatch.setattr(Database, "last_refresh_time", float("inf"))
+    monkeypatch.setattr(Database, "replica_pools", replicas)
+    monkeypatch.setattr(Database, "replica_lag", {})
+    monkeypatch.setattr(Database, "replica_lag_checked_at", {})
+    monkeypatch.setattr(Database, "replica_cursor", 0)
+    monkeypatch.setattr(Database, "replica_max_lag_seconds", 5.0)
+    last_write_at.set(0.0)
+    return primary, replicas
+
+
+def test_query_classification():
+    assert is_read_only_query("SELECT * FROM census WHERE zoom_level = $1")
+    assert is_read_only_query("  -- comment\n WITH x AS (SELECT 1) SELECT * FROM x")
+    assert is_read_only_query("SELECT updated_at, last_update FROM t")
+    assert not is_read_only_query("DELETE FROM datasets WHERE created_at < $1 RETURNING filename")
+    assert not is_read_only_query("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d")
+    assert not is_read_only_query("SELECT * FROM t FOR UPDATE SKIP LOCKED")
+    assert not is_read_only_query("SELECT pg_try_advisory_lock($1);")
+    assert not is_read_only_query("INSERT INTO t VALUES ($1)")
+
+
+@pytest.mark.asyncio
+async def test_reads_skip_lagging_replicas_and_follow_writes(pools, monkeypatch):
+    primary, replicas = pools
+
+    # replica-1 lags past the limit, every read lands on replica-0
+    assert await Database.fetch("SELECT 1") == ["replica-0"]
+    assert await Database.fetchrow("SELECT 1") == "replica-0"
+    assert await Database.fetch("DELETE FROM t RETURNING id") == ["primary"]
+    assert await Database.fetchrow("SELECT 1", read_only=False) == "primary"
+
+    # A write in this task sends its following reads to the primary
+    last_write_at.set(0.0)
+    await Database.execute("UPDATE t SET a = 1")
+    assert await Database.fetchrow("SELECT 1") == "primary"
+
+    # Every replica behind: fall back to the primary
+    last_write_at.set(0.0)
+    replicas[0].connection.lag = 60.0
+    monkeypatch.setattr(Database, "replica_lag_checked_at", {})
+    assert await Database.fetchrow("SELECT 1") == "primary"
+    assert Database.get_replica_metrics()["routed_reads"]["fallback"] >= 1
+
+    async with Database.use_primary():
+        assert await Database.fetchrow("SELECT 1", read_only=True) == "primary"
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not (os.getenv("DATABASE_URL") and os.getenv("REPLICA_DATABASE_URLS")),
+    reason="needs database_files/replica_harness running",
+)
+async def test_replica_harness_routes_reads():
+    await Database.create_pool()
+    try:
+        assert len(Database.replica_pools) == 1
+        in_recovery = "SELECT pg_is_in_recovery() AS in_recovery"
+        assert (await Database.fetchrow(in_recovery))["in_recovery"] is True
+        assert (await Database.fetchrow(in_recovery, read_only=False))["in_recovery"] is False
+        assert await Database.replica_lag_seconds(0) < Database.replica_max_lag_seconds
+    finally:
+        await Database.close_pool()
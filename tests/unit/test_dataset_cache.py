@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, patch
+
+import orjson
+import pytest
+
+import storage
+from dataset_cache import DatasetCache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    DatasetCache.clear()
+    monkeypatch.setattr(DatasetCache, "hits", 0)
+    monkeypatch.setattr(DatasetCache, "misses", 0)
+    monkeypatch.setattr(DatasetCache, "evictions", 0)
+    yield
+    DatasetCache.clear()
+
+
+def _dataset(name: str) -> dict:
+    return {"type": "FeatureCollection", "features": [{"name": name * 100}]}
+
+
+def test_lru_is_bounded_by_bytes_and_hands_out_copies(monkeypatch):
+    size = len(orjson.dumps(_dataset("a")))
+    monkeypatch.setattr(DatasetCache, "max_bytes", size * 2)
+    now = datetime.now(timezone.utc)
+
+    generation = DatasetCache.generation()
+    DatasetCache.put("a", now, _dataset("a"), generation)
+    DatasetCache.put("b", now, _dataset("b"), generation)
+    DatasetCache.get("a")[1]["features"].clear()
+    DatasetCache.put("c", now, _dataset("c"), generation)
+
+    assert DatasetCache.get("b") is None
+    assert DatasetCache.get("a") == (now, _dataset("a"))
+    assert DatasetCache.current_bytes == size * 2
+    assert DatasetCache.get_metrics()["evictions"] == 1
+
+    # Notification from another worker
+    DatasetCache._on_notification(None, 0, "dataset_invalidation", "a")
+    assert DatasetCache.get("a") is None
+
+
+def test_rows_read_before_an_invalidation_or_past_the_ttl_are_not_served(monkeypatch):
+    now = datetime.now(timezone.utc)
+
+    # Invalidated while the row was being read
+    generation = DatasetCache.generation()
+    DatasetCache.discard("a")
+    DatasetCache.put("a", now, _dataset("a"), generation)
+    assert DatasetCache.get("a") is None
+    DatasetCache.put("a", now, _dataset("a"), DatasetCache.generation())
+    assert DatasetCache.get("a") == (now, _dataset("a"))
+
+    # Forgotten invalidations still reject the reads older than them
+    monkeypatch.setattr(DatasetCache, "max_tracked_invalidations", 1)
+    generation = DatasetCache.generation()
+    DatasetCache.discard("b")
+    DatasetCache.discard("c")
+    DatasetCache.put("b", now, _dataset("b"), generation)
+    assert DatasetCache.get("b") is None
+
+    monkeypatch.setattr(DatasetCache, "ttl_seconds", -1)
+    DatasetCache.put("d", now, _dataset("d"), DatasetCache.generation())
+    assert DatasetCache.get("d") is None
+
+
+@pytest.mark.asyncio
+async def test_listener_failure_disables_the_cache_until_it_reconnects(monkeypatch):
+    monkeypatch.setattr(DatasetCache, "min_reconnect_delay", 0)
+    monkeypatch.setattr(DatasetCache, "reconnect_delay", 0)
+    listener = AsyncMock()
+    listener.add_termination_listener = lambda callback: None
+    connect = AsyncMock(side_effect=[OSError("refused"), listener])
+    now = datetime.now(timezone.utc)
+    with patch("dataset_cache.asyncpg.connect", new=connect):
+        await DatasetCache.start_listener()
+        assert DatasetCache.disconnected
+        DatasetCache.put("a", now, _dataset("a"), DatasetCache.generation())
+        assert DatasetCache.get("a") is None
+
+        await DatasetCache.reconnect_task
+        assert DatasetCache.listener is listener
+        assert not DatasetCache.disconnected
+        DatasetCache.put("a", now, _dataset("a"), DatasetCache.generation())
+        assert DatasetCache.get("a") == (now, _dataset("a"))
+
+    monkeypatch.setattr(DatasetCache, "listener", None)
+
+
+@pytest.mark.asyncio
+async def test_load_dataset_reads_postgres_once_and_store_invalidates():
+    created_at = datetime.now(timezone.utc)
+    row = {
+        "response_data": orjson.dumps(_dataset("x")).decode(),
+        "response_blob": None,
+        "created_at": created_at,
+    }
+    with patch.object(
+        storage.Database, "fetchrow", new=AsyncMock(return_value=row)
+    ) as fetchrow, patch.object(storage.Database, "execute", new=AsyncMock()):
+        assert await storage.load_dataset("x") == _dataset("x")
+        assert await storage.load_dataset("x") == _dataset("x")
+        assert fetchrow.await_count == 1
+
+        await DatasetCache.invalidate("x")
+        await storage.load_dataset("x")
+        assert fetchrow.await_count == 2
+
+
+    # Expired rows read as missing, nothing is deleted in the request path
+    generation = DatasetCache.generation()
+    DatasetCache.put("old", created_at - timedelta(days=91), _dataset("old"), generation)
+    DatasetCache.put("due", created_at - timedelta(days=85), _dataset("due"), generation)
+    with patch.object(storage.Database, "execute", new=AsyncMock()) as execute:
+        assert await storage.load_dataset("old") is None
+        assert await storage.load_dataset("due") == _dataset("due")
+        execute.assert_not_awaited()
+
+    # The sweeper already treats rows due for refresh as missing
+    token = storage.revalidating_datasets.set(True)
+    try:
+        assert await storage.load_dataset("due") is None
+    finally:
+        storage.revalidating_datasets.reset(token)
@@ -0,0 +1,64 @@
+import pytest
+
+from dataset_codec import (
+    CODEC_MSGPACK_ZSTD,
+    CODEC_ORJSON_ZSTD,
+    configured_codec,
+    decode_dataset,
+    encode_dataset,
+)
+
+DATASET = {
+    "type": "FeatureCollection",
+    "properties": ["name", "rating"],
+    "features": [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [46.67, 24.71]},
+            "properties": {"name": "Café ☕", "rating": 4.5, "photos": []},
+        }
+    ],
+}
+
+
+@pytest.mark.parametrize("codec", [CODEC_ORJSON_ZSTD, CODEC_MSGPACK_ZSTD])
+def test_blob_round_trip_starts_with_version_byte(codec):
+    response_data, response_blob = encode_dataset(DATASET, codec)
+
+    assert response_data is None
+    assert response_blob[0] == codec
+    assert decode_dataset({"response_data": None, "response_blob": response_blob}) == DATASET
+
+
+def test_plain_rows_stay_jsonb_by_default(monkeypatch):
+    monkeypatch.delenv("DATASET_CODEC", raising=False)
+    response_data, response_blob = encode_dataset(DATASET)
+
+    assert response_blob is None
+    assert decode_dataset({"response_data": response_data, "response_blob": None}) == DATASET
+
+    monkeypatch.setenv("DATASET_CODEC", "msgpack")
+    assert configured_codec() == CODEC_MSGPACK_ZSTD
+
+
+@pytest.mark.asyncio
+async def test_store_place_details_matches_store_dataset_parameters(monkeypatch):
+    import re
+
+    import storage
+
+    calls = []
+
+    async def execute(query, *args):
+        calls.append((query, args))
+        placeholders = {int(n) for n in re.findall(r"\$(\d+)", query)}
+        assert len(args) == max(placeholders, default=0)
+
+    monkeypatch.setenv("DATASET_CODEC", "orjson")
+    monkeypatch.setattr(storage.Database, "execute", execute)
+    await storage.store_place_details("place_1", DATASET)
+
+    (query, args), _ = calls  # the store, then the invalidation NOTIFY
+    assert query == storage.SqlObject.store_dataset
+    assert args[2] is None
+    assert decode_dataset({"response_data": args[2], "response_blob": args[3]}) == DATASET
@@ -0,0 +1,124 @@
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+import orjson
+import pytest
+
+import dataset_sweeper
+from dataset_sweeper import DatasetSweeper
+from storage import revalidating_datasets
+
+
+def _request(boolean_query: str) -> str:
+    return orjson.dumps(
+        {
+            "user_id": "u1",
+            "lat": 24.7,
+            "lng": 46.6,
+            "radius": 1000.0,
+            "boolean_query": boolean_query,
+            "city_name": "Riyadh",
+            "country_name": "Saudi Arabia",
+        }
+    ).decode()
+
+
+class FakeConnection:
+    def __init__(self, records, locked=True):
+        self.records = records
+        self.locked = locked
+        self.executed = []
+
+    async def fetchval(self, query, *args):
+        return self.locked
+
+    async def fetch(self, query, *args):
+        return self.records
+
+    async def execute(self, query, *args):
+        self.executed.append((query, args))
+
+
+def _connection(conn):
+    @asynccontextmanager
+    async def connection():
+        yield conn
+
+    return connection
+
+
+@pytest.mark.asyncio
+async def test_refresh_runs_each_stored_request_once_while_revalidating():
+    records = [
+        {"filename": "combined", "request_data": _request("cafe")},
+        {"filename": "part", "request_data": _request("cafe")},
+        {"filename": "other", "request_data": _request("bakery")},
+        {"filename": "broken", "request_data": "{}"},
+    ]
+    seen = []
+
+    async def fake_query_ggl(req, search_type):
+        seen.append((req.boolean_query, revalidating_datasets.get()))
+        return {"type": "FeatureCollection", "features": []}
+
+    conn = FakeConnection(records)
+    with patch.object(
+        dataset_sweeper.Database, "connection", new=_connection(conn)
+    ), patch.object(dataset_sweeper, "query_ggl", new=fake_query_ggl):
+        refreshed, failed = await DatasetSweeper.refresh_due()
+
+    assert (refreshed, failed) == (2, 0)
+    assert seen == [("cafe", True), ("bakery", True)]
+    assert revalidating_datasets.get() is False
+    # Every row examined is marked, including the one that couldn't be parsed
+    marked = [args for query, args in conn.executed if "refresh_attempted_at" in query]
+    assert marked[0][0] == ["combined", "part", "other", "broken"]
+
+
+@pytest.mark.asyncio
+async def test_lock_is_released_before_the_google_calls(monkeypatch):
+    monkeypatch.setattr(DatasetSweeper, "max_refreshes", 1)
+    records = [
+        {"filename": "cafe", "request_data": _request("cafe")},
+        {"filename": "bakery", "request_data": _request("bakery")},
+    ]
+    conn = FakeConnection(records)
+
+    async def fake_query_ggl(req, search_type):
+        assert "pg_advisory_unlock" in conn.executed[-1][0]
+        return {"type": "FeatureCollection", "features": []}
+
+    with patch.object(
+        dataset_sweeper.Database, "connection", new=_connection(conn)
+    ), patch.object(dataset_sweeper, "query_ggl", new=fake_query_ggl):
+        assert await DatasetSweeper.refresh_due() == (1, 0)
+
+    # Rows past max_refreshes stay due for the next sweep
+    marked = [args for query, args in conn.executed if "refresh_attempted_at" in query]
+    assert marked[0][0] == ["cafe"]
+
+
+@pytest.mark.asyncio
+async def test_sweep_is_skipped_without_the_lock():
+    conn = FakeConnection([], locked=False)
+    with patch.object(dataset_sweeper.Database, "connection", new=_connection(conn)):
+        assert await DatasetSweeper.sweep() == {"skipped": True}
+    assert conn.executed == []
+
+
+@pytest.mark.asyncio
+async def test_expired_rows_are_deleted_in_batches(monkeypatch):
+    monkeypatch.setattr(DatasetSweeper, "batch_size", 2)
+    batches = [
+        [{"filename": "a"}, {"filename": "b"}],
+        [{"filename": "c"}],
+    ]
+    with patch.object(
+        dataset_sweeper.Database, "fetch", new=AsyncMock(side_effect=batches)
+    ) as fetch, patch.object(
+        dataset_sweeper.DatasetCache, "invalidate", new=AsyncMock()
+    ) as invalidate:
+        assert await DatasetSweeper.delete_expired() == 3
+
+    assert fetch.await_count == 2
+    assert [call.args[0] for call in invalidate.await_args_list] == ["a", "b", "c"]
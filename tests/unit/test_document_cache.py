@@ -0,0 +1,121 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from backend_common import auth, document_cache
+from backend_common.auth import FieldPatchCoalescer, FirestoreDB
+from backend_common.document_cache import (
+    BoundedDocumentCache,
+    InvalidationChannel,
+    LocalInvalidationChannel,
+    PostgresInvalidationChannel,
+)
+
+
+def test_bounded_document_cache_evicts_by_bytes_and_expires():
+    now = [0.0]
+    cache = BoundedDocumentCache(max_bytes=60, ttl_seconds=10, clock=lambda: now[0])
+    size = cache.measure({"name": "a" * 10})
+
+    cache["u1"] = {"name": "a" * 10}
+    cache["u2"] = {"name": "b" * 10}
+    assert cache["u1"]["name"] == "a" * 10  # u2 is now the least recently used
+    cache["u3"] = {"name": "c" * 10}
+    assert "u2" not in cache and set(cache) == {"u1", "u3"}
+    assert cache.current_bytes == 2 * size and cache.evictions == 1
+
+    cache["big"] = {"name": "x" * 100}
+    assert "big" not in cache
+
+    now[0] = 10
+    assert cache.get("u1") is None and cache.expirations == 1
+    assert cache.get_metrics()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_profile_writes_invalidate_the_other_workers(monkeypatch):
+    stored = {"user_id": "u1", "settings": {"show_price_on_purchase": False}}
+    doc_ref = MagicMock(update=AsyncMock())
+    doc_ref.get = AsyncMock(side_effect=lambda: MagicMock(exists=True, to_dict=lambda: dict(stored)))
+    client = MagicMock()
+    client.collection.return_value.document.return_value = doc_ref
+
+    hub = []
+    workers = []
+    for _ in range(2):
+        worker = FirestoreDB(
+            ["all_user_profiles"], ["all_user_profiles"], LocalInvalidationChannel(hub)
+        )
+        monkeypatch.setattr(worker, "get_async_client", lambda: client)
+        monkeypatch.setattr(worker, "get_sync_client", MagicMock())
+        await worker.initialize_all()
+        workers.append(worker)
+    writer, reader = workers
+    assert isinstance(reader._cache["all_user_profiles"], BoundedDocumentCache)
+    assert not reader._collection_listeners
+
+    # Loaded on the first read only
+    await reader.get_document("all_user_profiles", "u1")
+    await reader.get_document("all_user_profiles", "u1")
+    assert doc_ref.get.await_count == 1
+
+    monkeypatch.setattr(auth, "firebase_db", writer)
+    for name in ("pending", "inflight", "timers", "locks"):
+        monkeypatch.setattr(FieldPatchCoalescer, name, {})
+    monkeypatch.setattr(FieldPatchCoalescer, "tasks", set())
+    await writer.get_document("all_user_profiles", "u1")
+    await auth.patch_user_profile("u1", {("settings", "show_price_on_purchase"): True})
+    stored["settings"] = {"show_price_on_purchase": True}
+    await FieldPatchCoalescer.flush_all()
+
+    # The reader dropped its copy and loads the new one, the writer kept its own
+    assert "u1" not in reader._cache["all_user_profiles"]
+    profile = await reader.get_document("all_user_profiles", "u1")
+    assert profile["settings"]["show_price_on_purchase"] is True
+    assert writer._cache["all_user_profiles"]["u1"]["settings"]["show_price_on_purchase"] is True
+    assert reader.get_cache_metrics()["all_user_profiles"]["invalidations"] == 1
+
+    for worker in workers:
+        await worker.close_invalidation_channel()
+    assert hub == []
+
+
+def test_invalidation_channels_must_publish():
+    class Silent(InvalidationChannel):
+        pass
+
+    with pytest.raises(TypeError):
+        Silent()
+
+
+@pytest.mark.asyncio
+async def test_postgres_channel_reconnects_with_backoff(monkeypatch):
+    listener = MagicMock(add_listener=AsyncMock(), close=AsyncMock())
+    connect = AsyncMock(side_effect=[OSError("restarting"), OSError("restarting"), listener])
+    monkeypatch.setattr(document_cache.asyncpg, "connect", connect)
+    monkeypatch.setattr(PostgresInvalidationChannel, "min_reconnect_delay", 0.01)
+
+    channel = PostgresInvalidationChannel()
+    worker = FirestoreDB(["all_user_profiles"], ["all_user_profiles"], channel)
+    cache = worker._cache["all_user_profiles"]
+    cache["u1"] = {"name": "a"}
+
+    await channel.start(worker._on_invalidation)
+    # Nothing is cached while invalidations may be missed
+    assert cache.suspended and "u1" not in cache
+    cache["u1"] = {"name": "a"}
+    assert "u1" not in cache
+
+    for _ in range(100):
+        if channel.connected:
+            break
+        await asyncio.sleep(0.01)
+    assert connect.await_count == 3 and channel.listener is listener
+    assert not cache.suspended
+    cache["u1"] = {"name": "a"}
+    assert "u1" in cache
+
+    channel._on_listener_closed(listener)
+    assert cache.suspended and not channel.connected
+    await channel.stop()
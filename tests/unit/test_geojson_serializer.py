@@ -0,0 +1,25 @@
+import orjson
+
+from geojson_serializer import _benchmark, features_from_records, features_json
+
+
+def test_records_with_geojson_text_and_streamed_chunks():
+    records = [
+        {"id": 1, "geometry": '{"type":"Point","coordinates":[1.0,2.0]}', "price": 5},
+        {"id": 2, "geometry": '{"type":"Point","coordinates":[3.0,4.0]}', "price": None},
+    ]
+    features = features_from_records(records, exclude=("id",))
+
+    assert features[1] == {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [3.0, 4.0]},
+        "properties": {"price": None},
+    }
+    streamed = b'{"type":"FeatureCollection","features":[' + features_json(features) + b"]}"
+    assert orjson.loads(streamed) == {"type": "FeatureCollection", "features": features}
+    assert features_from_records([]) == []
+
+
+def test_records_conversion_matches_the_iterrows_path():
+    # _benchmark asserts both paths give the same FeatureCollection
+    assert _benchmark(50)["rows"] == 50
@@ -0,0 +1,239 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from firebase_admin import firestore
+
+import storage
+from backend_common.auth import FirestoreDB
+from database_files.migrate_layer_matchings import index_writes, missing_layers, shard_writes
+
+DATASET_ID = "46.6753_24.7136_30000.0_cafe_OR_bakery_token="
+
+
+def shards(dataset_matching, user_matching):
+    """Dataset and user shard documents of monolithic matchings"""
+    dataset_shards = {
+        storage.matching_shard_id(d_id): {"dataset_id": d_id, **info}
+        for d_id, info in dataset_matching.items()
+    }
+    user_shards = {}
+    for lyr_id, owner_id in user_matching.items():
+        user_shards.setdefault(
+            storage.matching_shard_id(owner_id), {"user_id": owner_id, "prdcer_lyrs": []}
+        )["prdcer_lyrs"].append(lyr_id)
+    return dataset_shards, user_shards
+
+
+@pytest.fixture
+def matchings(monkeypatch):
+    dataset_shards, user_shards = shards(
+        {
+            DATASET_ID: {"records_count": 40, "prdcer_lyrs": ["l1", "l2"]},
+            "census_riyadh_population": {"records_count": 7, "prdcer_lyrs": ["l3"]},
+        },
+        {"l1": "u1", "l3": "u2"},
+    )
+    firebase_db = FirestoreDB(
+        [
+            storage.LEGACY_MATCHING_COLLECTION,
+            storage.DATASET_MATCHING_COLLECTION,
+            storage.USER_MATCHING_COLLECTION,
+            storage.LAYER_INDEX_COLLECTION,
+        ]
+    )
+    firebase_db._cache[storage.DATASET_MATCHING_COLLECTION] = dataset_shards
+    firebase_db._cache[storage.USER_MATCHING_COLLECTION] = user_shards
+    # Documents missing from the cache are missing from Firestore too
+    client = MagicMock()
+    client.collection.return_value.document.return_value.get = AsyncMock(
+        return_value=MagicMock(exists=False)
+    )
+    monkeypatch.setattr(firebase_db, "get_async_client", lambda: client)
+    monkeypatch.setattr(storage, "firebase_db", firebase_db)
+    tasks = MagicMock()
+    with patch.object(storage, "get_background_tasks", return_value=tasks):
+        yield firebase_db._cache, tasks
+
+
+@pytest.mark.asyncio
+async def test_missing_layers_are_indexed_one_document_each(matchings):
+    cache, tasks = matchings
+
+    dataset_shards = cache[storage.DATASET_MATCHING_COLLECTION]
+    assert await storage.fetch_dataset_id("l2") == (
+        DATASET_ID, dataset_shards[storage.matching_shard_id(DATASET_ID)]
+    )
+    assert await storage.load_layer_owner("l3") == "u2"
+    index = cache[storage.LAYER_INDEX_COLLECTION]
+    assert set(index) == {"l2", "l3"}
+    assert index["l2"]["layer_id"] == "l2" and index["l3"]["owner_id"] == "u2"
+    min_lat, max_lat, min_lng, max_lng = index["l2"]["bbox"]
+    assert min_lat < 24.7136 < max_lat and min_lng < 46.6753 < max_lng
+    assert index["l2"]["category"] == "cafe_OR_bakery"
+    # Each repair writes the document of its layer only
+    assert [write[:2] for write in committed_writes(tasks)] == [
+        (storage.LAYER_INDEX_COLLECTION, "l2"),
+        (storage.LAYER_INDEX_COLLECTION, "l3"),
+    ]
+
+    # Indexed layers don't scan the shards anymore
+    cache[storage.DATASET_MATCHING_COLLECTION] = {
+        storage.matching_shard_id(DATASET_ID): dataset_shards[storage.matching_shard_id(DATASET_ID)]
+    }
+    assert (await storage.fetch_dataset_id("l2"))[0] == DATASET_ID
+    assert tasks.add_task.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_layers_not_migrated_are_read_from_the_legacy_documents(matchings):
+    cache, tasks = matchings
+    cache[storage.LEGACY_MATCHING_COLLECTION] = {
+        storage.LEGACY_DATASET_DOCUMENT: {
+            "legacy_dataset": {"records_count": 2, "prdcer_lyrs": ["old"]}
+        },
+        storage.LEGACY_USER_DOCUMENT: {"old": "u9"},
+    }
+
+    assert await storage.fetch_dataset_id("old") == (
+        "legacy_dataset", {"records_count": 2, "prdcer_lyrs": ["old"]}
+    )
+    assert await storage.load_layer_owner("old") == "u9"
+    # Not indexed, the index entry would point to shards that don't exist yet
+    assert cache[storage.LAYER_INDEX_COLLECTION] == {}
+
+    cache[storage.LEGACY_MATCHING_COLLECTION] = {}
+    assert await storage.fetch_dataset_id("old") is None
+    assert await storage.load_layer_owner("old") is None
+
+
+@pytest.mark.asyncio
+async def test_layer_index_follows_matching_updates(matchings):
+    cache, tasks = matchings
+
+    await storage.update_dataset_layer_matching("l4", "census_riyadh_population", 7)
+    await storage.update_user_layer_matching("l4", "u3")
+    index = cache[storage.LAYER_INDEX_COLLECTION]
+    assert index["l4"] == {
+        "layer_id": "l4",
+        "dataset_id": "census_riyadh_population",
+        "bbox": None,
+        "category": None,
+        "owner_id": "u3",
+    }
+    assert (await storage.fetch_dataset_id("l4"))[0] == "census_riyadh_population"
+
+    await storage.delete_dataset_layer_matching("l4", "census_riyadh_population")
+    assert "l4" not in index
+    assert await storage.fetch_dataset_id("l4") is None
+
+
+def committed_writes(tasks):
+    writes = []
+    for call in tasks.add_task.call_args_list:
+        func, *args = call.args
+        if func is storage.commit_matching_writes:
+            writes += args[0]
+    return writes
+
+
+@pytest.mark.asyncio
+async def test_matching_updates_write_only_the_changed_layer(matchings):
+    cache, tasks = matchings
+
+    await storage.update_dataset_layer_matching("l4", "census_riyadh_population", 8)
+    await storage.update_dataset_layer_matching("l5", "census_riyadh_population", 9)
+    await storage.update_user_layer_matching("l4", "u2")
+
+    shard_id = storage.matching_shard_id("census_riyadh_population")
+    assert cache[storage.DATASET_MATCHING_COLLECTION][shard_id]["prdcer_lyrs"] == ["l3", "l4", "l5"]
+    writes = committed_writes(tasks)
+    dataset_writes = [w for w in writes if w[0] == storage.DATASET_MATCHING_COLLECTION]
+    # Each writer only adds its own layer, Firestore unions them into the stored shard
+    assert [w[2]["prdcer_lyrs"].values for w in dataset_writes] == [["l4"], ["l5"]]
+    assert all(isinstance(w[2]["prdcer_lyrs"], firestore.ArrayUnion) for w in dataset_writes)
+    assert dataset_writes[-1][2]["records_count"] == 9
+    user_write = next(w for w in writes if w[0] == storage.USER_MATCHING_COLLECTION)
+    assert user_write[1] == "u2" and user_write[2]["prdcer_lyrs"].values == ["l4"]
+    layer_writes = [w for w in writes if w[0] == storage.LAYER_INDEX_COLLECTION]
+    assert [w[1] for w in layer_writes] == ["l4", "l5", "l4"]
+    assert layer_writes[-1][2] == {"layer_id": "l4", "owner_id": "u2"}
+    assert await storage.load_layer_owner("l4") == "u2"
+
+    await storage.delete_dataset_layer_matching("l4", "census_riyadh_population")
+    await storage.delete_user_layer_matching("l4")
+    assert await storage.load_layer_owner("l4") is None
+    removals = committed_writes(tasks)[len(writes):]
+    assert [type(w[2].get("prdcer_lyrs")) for w in removals if w[2] is not None] == [
+        firestore.ArrayRemove,
+        firestore.ArrayRemove,
+    ]
+    assert [w[:3] for w in removals if w[2] is None] == [
+        (storage.LAYER_INDEX_COLLECTION, "l4", None),
+        (storage.LAYER_INDEX_COLLECTION, "l4", None),
+    ]
+    with pytest.raises(storage.HTTPException):
+        await storage.delete_user_layer_matching("l4")
+
+
+@pytest.mark.asyncio
+async def test_commit_matching_writes_batches(monkeypatch):
+    client = MagicMock()
+    batches = []
+
+    def new_batch():
+        batch = MagicMock(commit=AsyncMock())
+        batches.append(batch)
+        return batch
+
+    client.batch.side_effect = new_batch
+    firebase_db = MagicMock(get_async_client=lambda: client)
+    monkeypatch.setattr(storage, "firebase_db", firebase_db)
+
+    writes = [("c", f"d{i}", {"prdcer_lyrs": firestore.ArrayUnion([i])}) for i in range(1001)]
+    writes.append(("c", "gone", None))
+    await storage.commit_matching_writes(writes)
+    assert [batch.set.call_count for batch in batches] == [500, 500, 1]
+    assert batches[-1].delete.call_count == 1
+    assert all(batch.commit.await_count == 1 for batch in batches)
+    assert batches[0].set.call_args.kwargs == {"merge": True}
+
+
+def test_migration_shard_writes():
+    dataset_matching = {
+        "a/b_token=": {"records_count": 3, "prdcer_lyrs": ["l1", "l2"]},
+        "empty": {"records_count": 0, "prdcer_lyrs": []},
+    }
+    user_matching = {"l1": "u1", "l2": "u1"}
+
+    writes = shard_writes(dataset_matching, user_matching, sharded_datasets=["empty"])
+    first, second, user = writes
+    assert first[1] == "a%2Fb_token%3D" and first[2]["records_count"] == 3
+    assert first[2]["prdcer_lyrs"].values == ["l1", "l2"]
+    # An existing shard keeps its newer records_count and layers
+    assert second[2] == {"dataset_id": "empty"}
+    assert user == (
+        storage.USER_MATCHING_COLLECTION,
+        "u1",
+        {"user_id": "u1", "prdcer_lyrs": firestore.ArrayUnion(["l1", "l2"])},
+    )
+
+    dataset_shards, user_shards = shards(dataset_matching, user_matching)
+    by_key = lambda docs, key: {doc[key]: doc for doc in docs.values()}  # noqa: E731
+    assert missing_layers(
+        dataset_matching,
+        user_matching,
+        by_key(dataset_shards, "dataset_id"),
+        by_key(user_shards, "user_id"),
+    ) == []
+    assert missing_layers(dataset_matching, user_matching, {}, {}) == ["l1", "l2", "l1", "l2"]
+
+    index = {write[1]: write[2] for write in index_writes(dataset_matching, user_matching)}
+    assert index["l1"] == {
+        "layer_id": "l1",
+        "dataset_id": "a/b_token=",
+        "bbox": None,
+        "category": None,
+        "owner_id": "u1",
+    }
+    assert set(index) == {"l1", "l2"}
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+import page_cursor
+import storage
+from page_cursor import cursor_scope, decode_cursor, encode_cursor, require_signing_key
+
+
+@pytest.fixture(autouse=True)
+def signing_key(monkeypatch):
+    monkeypatch.setattr(page_cursor, "_signing_key", b"test-signing-key")
+
+
+def test_missing_signing_key_fails(monkeypatch):
+    monkeypatch.setattr(page_cursor, "_signing_key", b"")
+    with pytest.raises(RuntimeError):
+        require_signing_key()
+    with pytest.raises(RuntimeError):
+        encode_cursor(cursor_scope("saudi_real_estate"), 1)
+
+
+def test_cursor_round_trip_and_rejections():
+    scope = cursor_scope("saudi_real_estate", ["villa_for_sale"], [24.0, 25.0, 46.0, 47.0])
+    token = encode_cursor(scope, 1234)
+
+    assert decode_cursor(token, scope) == 1234
+    assert decode_cursor("", scope) is None
+
+    other_scope = cursor_scope("saudi_real_estate", ["villa_for_sale"], [0, 1, 0, 1])
+    payload, signature = token.split(".")
+    for bad_token, bad_scope in [
+        (token, other_scope),
+        (payload[:-2] + "xx." + signature, scope),
+        ("3", scope),
+    ]:
+        with pytest.raises(HTTPException) as exc_info:
+            decode_cursor(bad_token, bad_scope)
+        assert exc_info.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_real_estate_pages_follow_the_last_id():
+    location = SimpleNamespace(
+        _bounding_box=[24.0, 25.0, 46.0, 47.0],
+        _included_types=["villa_for_sale"],
+        city_name="Riyadh",
+    )
+    rows = [
+        {
+            "id": i,
+            "geometry": '{"type":"Point","coordinates":[46.5,24.5]}',
+            "url": f"https://example.com/{i}",
+            "price": i,
+            "category": "villa_for_sale",
+        }
+        for i in range(1, storage.DEFAULT_LIMIT + 6)
+    ]
+
+    async def fake_fetch(query, categories, *args):
+        *bbox, last_id, limit = args
+        return [row for row in rows if row["id"] > last_id][:limit]
+
+    with patch.object(storage.Database, "fetch", new=AsyncMock(side_effect=fake_fetch)):
+        first_page, _, token = await storage.get_real_estate_dataset_from_storage(
+            "", "", location, "", "villa_for_sale"
+        )
+        second_page, _, last_token = await storage.get_real_estate_dataset_from_storage(
+            "", "", location, token, "villa_for_sale"
+        )
+
+    assert len(first_page["features"]) == storage.DEFAULT_LIMIT
+    assert [f["properties"]["price"] for f in second_page["features"]] == [
+        row["id"] for row in rows[storage.DEFAULT_LIMIT :]
+    ]
+    assert last_token == ""
@@ -0,0 +1,45 @@
+import pytest
+
+from database_files.partition_census import (
+    covering_columns,
+    partitioned_table_ddl,
+    swap_ddl,
+)
+from sql_object import CENSUS_POPULATION_COLUMNS
+
+
+def _columns(*names, generated=()):
+    return [{"column_name": name, "is_generated": name in generated} for name in names]
+
+
+def test_covering_columns_and_partition_ddl():
+    columns = _columns(
+        "latitude", "longitude", "Main_ID", "city", "geom", *CENSUS_POPULATION_COLUMNS,
+        generated=("geom",),
+    )
+    # Only the projected columns by default
+    covered = covering_columns(columns)
+    assert covered == CENSUS_POPULATION_COLUMNS
+    assert covering_columns(columns, ["Main_ID"]) == ["zoom_level", "population", "Main_ID"]
+    with pytest.raises(ValueError):
+        covering_columns(columns, ["income"])
+    with pytest.raises(ValueError):
+        covering_columns(_columns("zoom_level", "population"))
+    with pytest.raises(ValueError):
+        many = [f"c{i}" for i in range(40)]
+        covering_columns(_columns("zoom_level", "population", *many), many)
+
+    ddl = partitioned_table_ddl([5, 12])
+    assert any("PARTITION BY LIST (zoom_level)" in statement for statement in ddl)
+    assert any("census_partitioned_z12" in s and "FOR VALUES IN (12)" in s for s in ddl)
+    assert ddl[-1].endswith("DEFAULT;")
+
+    view = swap_ddl([5, 12], covered)[-1]
+    assert view.endswith(
+        "SELECT latitude, longitude, "
+        + ", ".join(f'"{name}"' for name in CENSUS_POPULATION_COLUMNS)
+        + ' FROM "schema_marketplace".census;'
+    )
+    # Projected columns left out of the index by --include are still exposed
+    view = swap_ddl([5, 12], ["zoom_level", "population", "Main_ID"])[-1]
+    assert '"Main_ID"' in view and '"FemalePopulation"' in view
@@ -0,0 +1,122 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+
+from backend_common import auth
+from backend_common.auth import FieldPatchCoalescer, FirestoreDB
+
+
+@pytest.fixture
+def profiles(monkeypatch):
+    firebase_db = FirestoreDB(["all_user_profiles"])
+    firebase_db._cache["all_user_profiles"]["u1"] = {
+        "user_id": "u1",
+        "settings": {"show_price_on_purchase": False},
+        "prdcer": {"prdcer_dataset": {}, "prdcer_lyrs": {"l1": {"name": "a"}}, "prdcer_ctlgs": {}},
+    }
+    doc_ref = MagicMock(update=AsyncMock(), set=AsyncMock())
+    client = MagicMock()
+    client.collection.return_value.document.return_value = doc_ref
+    monkeypatch.setattr(firebase_db, "get_async_client", lambda: client)
+    monkeypatch.setattr(auth, "firebase_db", firebase_db)
+    for name in ("pending", "inflight", "timers", "locks", "attempts"):
+        monkeypatch.setattr(FieldPatchCoalescer, name, {})
+    monkeypatch.setattr(FieldPatchCoalescer, "tasks", set())
+    monkeypatch.setattr(FieldPatchCoalescer, "window_seconds", 0.05)
+    return firebase_db._cache["all_user_profiles"], doc_ref
+
+
+@pytest.mark.asyncio
+async def test_patches_are_coalesced_into_one_update(profiles):
+    cache, doc_ref = profiles
+
+    await auth.patch_user_profile("u1", {("prdcer", "prdcer_lyrs", "l2"): {"name": "b"}})
+    await auth.patch_user_profile("u1", {("prdcer", "prdcer_lyrs", "l1"): firestore.DELETE_FIELD})
+    await auth.patch_user_profile("u1", {"prdcer.prdcer_lyrs.l2.name": "c"})
+    await auth.update_user_profile_settings(
+        auth.UserProfileSettings(
+            user_id="u1", account_type="admin", admin_id=None, show_price_on_purchase=True
+        )
+    )
+    # Applied to the cached profile at once
+    assert cache["u1"]["prdcer"]["prdcer_lyrs"] == {"l2": {"name": "c"}}
+    assert cache["u1"]["settings"]["show_price_on_purchase"] is True
+    doc_ref.update.assert_not_awaited()
+
+    await asyncio.sleep(0.1)
+    doc_ref.update.assert_awaited_once()
+    (update,) = doc_ref.update.await_args.args
+    assert update == {
+        "prdcer.prdcer_lyrs.l2": {"name": "c"},
+        "prdcer.prdcer_lyrs.l1": firestore.DELETE_FIELD,
+        "user_id": "u1",
+        "account_type": "admin",
+        "admin_id": None,
+        "settings.show_price_on_purchase": True,
+    }
+
+    # A parent path replaces the queued children, the last write wins
+    await auth.patch_user_profile("u1", {("prdcer", "prdcer_ctlgs", "c1"): {"x": 1}})
+    await auth.patch_user_profile("u1", {("prdcer", "prdcer_ctlgs"): {}})
+    await FieldPatchCoalescer.flush_all()
+    assert doc_ref.update.await_args.args == ({"prdcer.prdcer_ctlgs": {}},)
+    assert not FieldPatchCoalescer.timers
+
+
+@pytest.mark.asyncio
+async def test_unwritten_patches_survive_snapshots_and_missing_documents(profiles):
+    cache, doc_ref = profiles
+
+    await auth.patch_user_profile("u1", {("prdcer", "prdcer_lyrs", "l.3"): {"name": "d"}})
+    snapshot = {"user_id": "u1", "prdcer": {"prdcer_lyrs": {"l1": {"name": "a"}}}}
+    FieldPatchCoalescer.overlay("all_user_profiles", "u1", snapshot)
+    assert snapshot["prdcer"]["prdcer_lyrs"]["l.3"] == {"name": "d"}
+
+    doc_ref.update.side_effect = NotFound("no document")
+    await FieldPatchCoalescer.flush_all()
+    document = doc_ref.set.await_args.args[0]
+    assert document == {"prdcer": {"prdcer_lyrs": {"l.3": {"name": "d"}}}}
+    assert [path.to_api_repr() for path in doc_ref.set.await_args.kwargs["merge"]] == [
+        "prdcer.prdcer_lyrs.`l.3`"
+    ]
+    assert FieldPatchCoalescer.pending == {} and FieldPatchCoalescer.inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_flushes_are_retried_under_newer_patches(profiles, monkeypatch):
+    cache, doc_ref = profiles
+    monkeypatch.setattr(FieldPatchCoalescer, "window_seconds", 0.01)
+    written = []
+
+    async def flaky_update(fields):
+        if not written:
+            written.append(None)
+            # Patched while the failing write is in flight
+            await auth.patch_user_profile("u1", {"settings.show_price_on_purchase": True})
+            raise RuntimeError("unavailable")
+        written.append(fields)
+
+    doc_ref.update.side_effect = flaky_update
+    await auth.patch_user_profile(
+        "u1", {"settings.show_price_on_purchase": False, "prdcer.prdcer_lyrs.l1.name": "b"}
+    )
+    for _ in range(50):
+        await asyncio.sleep(0.01)
+        if len(written) > 1:
+            break
+
+    assert written[1] == {
+        "settings.show_price_on_purchase": True,
+        "prdcer.prdcer_lyrs.l1.name": "b",
+    }
+    assert FieldPatchCoalescer.pending == {} and FieldPatchCoalescer.attempts == {}
+
+    # Past max_attempts the patches are dropped
+    monkeypatch.setattr(FieldPatchCoalescer, "max_attempts", 1)
+    doc_ref.update.side_effect = RuntimeError("unavailable")
+    await auth.patch_user_profile("u1", {"user_id": "u1"})
+    await FieldPatchCoalescer.flush_all()
+    assert FieldPatchCoalescer.pending == {} and not FieldPatchCoalescer.timers
@@ -0,0 +1,81 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from backend_common.auth import verify_admin_token
+from backend_common.database import Database
+from backend_common.query_diagnostics import (
+    SlowQueryExplainer,
+    normalize_statement,
+    statement_fingerprint,
+)
+
+PLAN = [{"Plan": {"Node Type": "Seq Scan", "Total Cost": 10.5}, "Execution Time": 2500.0}]
+
+
+def test_fingerprint_ignores_literals_and_layout():
+    assert normalize_statement(
+        "SELECT * FROM census -- bbox\n WHERE zoom_level = 5 AND city IN ('a', 'b') AND x = $1;"
+    ) == "SELECT * FROM census WHERE zoom_level = ? AND city IN (?) AND x = $1"
+    assert statement_fingerprint("SELECT 1 FROM t WHERE a = 'x'") == statement_fingerprint(
+        "SELECT 2\nFROM t\nWHERE a = 'it''s'"
+    )
+
+
+def test_captures_are_limited_to_sampled_read_only_statements(monkeypatch):
+    monkeypatch.setattr(SlowQueryExplainer, "threshold_seconds", 1.0)
+    monkeypatch.setattr(SlowQueryExplainer, "sample_rate", 1.0)
+    monkeypatch.setattr(SlowQueryExplainer, "max_per_minute", 2)
+    monkeypatch.setattr(SlowQueryExplainer, "capture_times", deque())
+    monkeypatch.setattr(SlowQueryExplainer, "last_capture", {})
+    monkeypatch.setattr(SlowQueryExplainer, "tasks", set())
+
+    assert not SlowQueryExplainer.should_capture("SELECT 1", "a", 0.5)
+    assert not SlowQueryExplainer.should_capture("DELETE FROM t", "b", 5.0)
+    assert SlowQueryExplainer.should_capture("SELECT 1", "a", 5.0)
+    # Same fingerprint within the interval
+    assert not SlowQueryExplainer.should_capture("SELECT 1", "a", 5.0)
+    assert SlowQueryExplainer.should_capture("SELECT 2", "c", 5.0)
+    # Per minute budget spent
+    assert not SlowQueryExplainer.should_capture("SELECT 3", "d", 5.0)
+
+
+@pytest.mark.asyncio
+async def test_capture_explains_in_rolled_back_transaction_and_stores_plan(monkeypatch):
+    transaction = MagicMock(start=AsyncMock(), rollback=AsyncMock())
+    conn = MagicMock(
+        transaction=MagicMock(return_value=transaction),
+        execute=AsyncMock(),
+        fetchval=AsyncMock(return_value=orjson.dumps(PLAN).decode()),
+    )
+
+    @asynccontextmanager
+    async def fake_connection(*args, **kwargs):
+        yield conn
+
+    monkeypatch.setattr(SlowQueryExplainer, "table_ready", True)
+    with patch.object(Database, "read_connection", fake_connection), patch.object(
+        Database, "connection", fake_connection
+    ):
+        plan = await SlowQueryExplainer.capture(
+            "f1", "census_bbox", "SELECT * FROM census WHERE zoom_level = $1", (5,), 2.5
+        )
+
+    assert plan == PLAN
+    explain_query, zoom = conn.fetchval.await_args.args
+    assert explain_query.startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT") and zoom == 5
+    transaction.rollback.assert_awaited_once()
+    stored = conn.execute.await_args.args
+    assert stored[1:3] == ("f1", "census_bbox") and stored[-1] == 2500.0
+
+
+def test_slow_query_report_requires_the_admin_claim():
+    assert verify_admin_token({"uid": "ops", "admin": True})["uid"] == "ops"
+    for token in [{"uid": "user"}, {"uid": "user", "admin": "yes"}]:
+        with pytest.raises(HTTPException) as exc_info:
+            verify_admin_token(token)
+        assert exc_info.value.status_code == 403
@@ -0,0 +1,202 @@
+import time
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from pydantic import ValidationError
+from shapely.geometry import box
+
+import sales_man_problem
+from all_types.request_dtypes import ReqClustersForSalesManData
+
+from sales_man_problem import (
+    build_grid_adjacency,
+    build_territories,
+    grow_balanced_territories,
+    haversine,
+    nearest_neighbor_tour,
+    or_opt,
+    project_to_local_km,
+    radius_neighbors_csr,
+    select_territory_seeds,
+    solve_route,
+    territories_from_arrays,
+    territory_balance_stats,
+    tour_length,
+    two_opt,
+)
+
+
+def random_points(rng, n):
+    return 24.6 + rng.random(n) * 0.3, 46.6 + rng.random(n) * 0.3
+
+
+def test_radius_neighbors_csr_matches_dense_matrix():
+    rng = np.random.default_rng(0)
+    origin_lat, origin_lon = random_points(rng, 400)
+    destination_lat, destination_lon = random_points(rng, 50)
+    distance_limit = 2.5
+
+    indptr, indices, distances = radius_neighbors_csr(
+        origin_lat, origin_lon, destination_lat, destination_lon, distance_limit
+    )
+    dense = haversine(origin_lat, origin_lon, destination_lat, destination_lon)
+
+    assert len(indptr) == len(origin_lat) + 1
+    for i in range(len(origin_lat)):
+        expected = set(np.flatnonzero(dense[i] < distance_limit))
+        if not expected:
+            expected = {int(np.argmin(dense[i]))}
+        row = slice(indptr[i], indptr[i + 1])
+        assert set(indices[row].tolist()) == expected
+        assert np.all(np.diff(distances[row]) >= 0)
+        assert np.allclose(distances[row], dense[i, indices[row]])
+
+
+def test_radius_neighbors_csr_keeps_pairs_of_a_tall_viewport():
+    # Most points near 40°N put the projection reference there, the pairs at 50°N are
+    # east-west neighbours just inside the limit
+    rng = np.random.default_rng(1)
+    distance_limit = 5.0
+    lon_step = np.degrees(0.99 * distance_limit / (6371.0 * np.cos(np.radians(50.0))))
+    origin_lat = np.concatenate([40.0 + rng.random(200) * 0.1, np.full(20, 50.0)])
+    origin_lon = np.concatenate([10.0 + rng.random(200) * 0.1, 10.0 + np.arange(20) * 0.5])
+    # Each origin at 50°N has a destination on the spot and one east of it
+    destination_lat = np.concatenate([40.0 + rng.random(20) * 0.1, np.full(40, 50.0)])
+    destination_lon = np.concatenate(
+        [10.0 + rng.random(20) * 0.1, origin_lon[200:], origin_lon[200:] + lon_step]
+    )
+
+    indptr, indices, distances = radius_neighbors_csr(
+        origin_lat, origin_lon, destination_lat, destination_lon, distance_limit
+    )
+    dense = haversine(origin_lat, origin_lon, destination_lat, destination_lon)
+    for i in range(len(origin_lat)):
+        expected = set(np.flatnonzero(dense[i] < distance_limit))
+        if not expected:
+            expected = {int(np.argmin(dense[i]))}
+        assert set(indices[indptr[i] : indptr[i + 1]].tolist()) == expected
+    assert all(indptr[i + 1] - indptr[i] == 2 for i in range(200, 220))
+
+
+def test_radius_neighbors_csr_empty_destinations():
+    indptr, indices, distances = radius_neighbors_csr(
+        np.array([24.7]), np.array([46.7]), np.array([]), np.array([]), 2.5
+    )
+    assert indptr.tolist() == [0, 0]
+    assert len(indices) == 0 and len(distances) == 0
+
+
+def square_grid(n, size=0.01):
+    return gpd.GeoSeries(
+        [
+            box(46.6 + i * size, 24.6 + j * size, 46.6 + (i + 1) * size, 24.6 + (j + 1) * size)
+            for i in range(n)
+            for j in range(n)
+        ]
+    )
+
+
+def test_build_grid_adjacency_queen_neighbors():
+    indptr, indices = build_grid_adjacency(square_grid(3))
+    degrees = np.diff(indptr)
+    # corners have 3 neighbors, edges 5 and the center cell 8
+    assert sorted(degrees.tolist()) == [3, 3, 3, 3, 5, 5, 5, 5, 8]
+    assert len(indices) == degrees.sum()
+
+
+def test_balanced_territories_are_contiguous_and_balanced():
+    rng = np.random.default_rng(1)
+    cells = square_grid(30)
+    workload = rng.gamma(2, 1000, len(cells))
+    centroids = cells.centroid
+    x, y = project_to_local_km(centroids.y.values, centroids.x.values)
+
+    adjacency = build_grid_adjacency(cells)
+    seeds = select_territory_seeds(x, y, workload, 6)
+    labels = grow_balanced_territories(adjacency, x, y, workload, seeds)
+    stats = territory_balance_stats(labels, workload, adjacency, 6)
+
+    assert labels.min() == 0 and labels.max() == 5
+    assert all(s["connected_parts"] == 1 for s in stats)
+    assert all(abs(s["deviation_from_target"]) < 0.1 for s in stats)
+    assert sum(s["cells"] for s in stats) == len(cells)
+
+
+def test_route_improvement_never_worsens_the_tour():
+    rng = np.random.default_rng(2)
+    lat, lon = random_points(rng, 120)
+    dist = haversine(lat, lon, lat, lon)
+
+    initial = nearest_neighbor_tour(dist)
+    deadline = time.monotonic() + 5
+    improved = or_opt(two_opt(initial, dist, deadline), dist, deadline)
+
+    assert sorted(improved.tolist()) == list(range(len(lat)))
+    assert tour_length(improved, dist) < tour_length(initial, dist)
+
+
+def test_solve_route_returns_permutation_and_distance():
+    rng = np.random.default_rng(3)
+    lat, lon = random_points(rng, 60)
+
+    order, total_distance = solve_route(lat, lon, time_budget=1.0)
+
+    assert sorted(order) == list(range(len(lat)))
+    dist = haversine(lat, lon, lat, lon)
+    assert np.isclose(total_distance, tour_length(np.array(order), dist))
+    assert solve_route(lat[:1], lon[:1]) == ([0], 0.0)
+
+
+def test_build_territories_takes_and_returns_plain_arrays():
+    rng = np.random.default_rng(4)
+    cells = [
+        box(46.6 + i * 0.01, 24.6 + j * 0.01, 46.61 + i * 0.01, 24.61 + j * 0.01)
+        for i in range(10)
+        for j in range(10)
+    ]
+    place_lat, place_lon = 24.6 + rng.random(40) * 0.1, 46.6 + rng.random(40) * 0.1
+
+    bounds, columns, stats = build_territories(
+        shapely.to_wkb(np.array(cells, dtype=object)),
+        rng.integers(100, 1000, len(cells)).astype(float),
+        rng.random(len(cells)) * 10000,
+        place_lat,
+        place_lon,
+        2.0,
+        3,
+    )
+    territories = territories_from_arrays(bounds, columns)
+
+    assert len(stats) == 3
+    assert set(territories["group"]) == {0, 1, 2}
+    assert (territories["number_of_potential_customers"] > 0).all()
+    assert territories.crs == "EPSG:4326"
+    assert np.allclose(shapely.bounds(territories.geometry.values), bounds)
+
+
+def test_nearest_neighbor_fallback_stops_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(sales_man_problem, "MAX_ROUTE_MATRIX_STOPS", 10)
+    rng = np.random.default_rng(5)
+    lat, lon = random_points(rng, 200)
+
+    for budget in (0.0, 5.0):
+        order, total_distance = solve_route(lat, lon, time_budget=budget)
+        assert sorted(order) == list(range(len(lat)))
+        dist = haversine(lat, lon, lat, lon)
+        assert np.isclose(total_distance, tour_length(np.array(order), dist))
+
+
+def test_route_time_budget_is_bounded():
+    fields = {
+        "user_id": "u1",
+        "boolean_query": "supermarket",
+        "city_name": "Riyadh",
+        "country_name": "Saudi Arabia",
+        "num_sales_man": 4,
+    }
+    assert ReqClustersForSalesManData(**fields).route_time_budget == 2.0
+    for budget in (0, -1, 600):
+        with pytest.raises(ValidationError):
+            ReqClustersForSalesManData(**fields, route_time_budget=budget)
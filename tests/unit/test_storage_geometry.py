@@ -0,0 +1,150 @@
+import re
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import storage
+from sql_object import CENSUS_POPULATION_COLUMNS, SqlObject
+
+
+def _location(**kwargs):
+    return SimpleNamespace(
+        _bounding_box=[24.0, 25.0, 46.0, 47.0],
+        _included_types=["apartment_for_rent"],
+        included_types=["retail"],
+        zoom_level=12,
+        city_name="Riyadh",
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_real_estate_features_come_from_postgis_geometry():
+    records = [
+        {
+            "id": 7,
+            "geometry": '{"type":"Point","coordinates":[46.5,24.5]}',
+            "url": "https://example.com/1",
+            "price": 1000,
+            "category": "apartment_for_rent",
+        }
+    ]
+    with patch.object(
+        storage.Database, "fetch", new_callable=AsyncMock, return_value=records
+    ) as mock_fetch:
+        geojson, filename, next_page_token = (
+            await storage.get_real_estate_dataset_from_storage(
+                "", "", _location(), "", "apartment_for_rent"
+            )
+        )
+
+    query, *args = mock_fetch.call_args.args
+    assert query == SqlObject.saudi_real_estate_features_w_envelope_and_category
+    # The bounding box keeps the request order, ST_MakeEnvelope picks its corners from it
+    assert args == [
+        ["apartment_for_rent"], 24.0, 25.0, 46.0, 47.0, 0, storage.DEFAULT_LIMIT + 1
+    ]
+    assert "ST_MakeEnvelope($4, $2, $5, $3, 4326)" in query
+    assert geojson["features"] == [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [46.5, 24.5]},
+            "properties": {
+                "url": "https://example.com/1",
+                "price": 1000,
+                "category": "apartment_for_rent",
+            },
+        }
+    ]
+    assert next_page_token == ""
+
+
+@pytest.mark.asyncio
+async def test_census_properties_are_projected_in_sql(monkeypatch):
+    records = [
+        {
+            "geometry": '{"type":"Point","coordinates":[46.5,24.5]}',
+            "properties": '{"population":120,"zoom_level":12}',
+        }
+    ]
+    monkeypatch.setattr(storage, "census_partitioned", None)
+    with patch.object(
+        storage.Database, "fetch", new_callable=AsyncMock, return_value=records
+    ) as mock_fetch:
+        geojson, _, _ = await storage.get_census_dataset_from_storage(
+            "", "", _location(), "", "Population Area Intelligence"
+        )
+
+    query, *args = mock_fetch.call_args.args
+    assert query == SqlObject.census_features_w_bbox
+    assert args == [24.0, 25.0, 46.0, 47.0, 12]
+    assert geojson["features"][0]["properties"] == {"population": 120, "zoom_level": 12}
+
+    # Before the census is partitioned: fall back to the envelope query and keep using it
+    with patch.object(
+        storage.Database,
+        "fetch",
+        new_callable=AsyncMock,
+        side_effect=[storage.asyncpg.exceptions.UndefinedTableError(), records, records],
+    ) as mock_fetch:
+        for _ in range(2):
+            await storage.get_census_dataset_from_storage(
+                "", "", _location(), "", "Population Area Intelligence"
+            )
+
+    queries = [call.args[0] for call in mock_fetch.call_args_list]
+    assert queries == [
+        SqlObject.census_features_w_bbox,
+        SqlObject.census_features_w_envelope,
+        SqlObject.census_features_w_envelope,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_census_data_types_without_a_query_are_rejected():
+    with patch.object(storage.Database, "fetch", new_callable=AsyncMock) as mock_fetch:
+        with pytest.raises(storage.HTTPException) as error:
+            await storage.get_census_dataset_from_storage(
+                "", "", _location(), "", "Weather Area Intelligence"
+            )
+    assert error.value.status_code == 400
+    mock_fetch.assert_not_called()
+
+
+def test_census_queries_project_the_same_properties():
+    def projected_keys(query):
+        return re.findall(r"'(\w+)', c\.", query)
+
+    assert (
+        projected_keys(SqlObject.census_features_w_bbox)
+        == projected_keys(SqlObject.census_features_w_envelope)
+        == CENSUS_POPULATION_COLUMNS
+    )
+    assert "to_jsonb" not in SqlObject.census_features_w_bbox
+
+
+@pytest.mark.asyncio
+async def test_missing_partitioned_census_is_probed_again(monkeypatch):
+    records = [{"geometry": '{"type":"Point","coordinates":[46.5,24.5]}', "properties": "{}"}]
+    monkeypatch.setattr(storage, "census_partitioned", None)
+    with patch.object(
+        storage.Database,
+        "fetch",
+        new_callable=AsyncMock,
+        side_effect=[storage.asyncpg.exceptions.UndefinedTableError(), records, records],
+    ) as mock_fetch:
+        for _ in range(2):
+            await storage.get_census_dataset_from_storage(
+                "", "", _location(), "", "Population Area Intelligence"
+            )
+            # The recheck delay has passed
+            monkeypatch.setattr(storage, "census_partition_checked_at", -1e9)
+
+    queries = [call.args[0] for call in mock_fetch.call_args_list]
+    assert queries == [
+        SqlObject.census_features_w_bbox,
+        SqlObject.census_features_w_envelope,
+        SqlObject.census_features_w_bbox,
+    ]
+    assert storage.census_partitioned is None
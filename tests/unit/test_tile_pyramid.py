@@ -0,0 +1,55 @@
+import json
+import sqlite3
+
+from tile_pyramid import build_pyramid
+
+
+def write_census(tmp_path, populations):
+    features = []
+    for i, population in enumerate(populations):
+        lng, lat = 46.6 + (i % 10) * 0.01, 24.6 + (i // 10) * 0.01
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [[lng, lat], [lng + 0.01, lat], [lng + 0.01, lat + 0.01], [lng, lat + 0.01], [lng, lat]]
+                    ],
+                },
+                "properties": {"Main_ID": f"id{i}", "Population_Count": population},
+            }
+        )
+    population_path = tmp_path / "population.geojson"
+    population_path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    income_path = tmp_path / "income.geojson"
+    income_path.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [{"properties": {"Main_ID": "id0", "income": 5000}}],
+            }
+        )
+    )
+    return str(population_path), str(income_path)
+
+
+def test_pyramid_rebuilds_only_changed_tiles(tmp_path):
+    output = str(tmp_path / "census.mbtiles")
+    population, income = write_census(tmp_path, [100] * 100)
+
+    first = build_pyramid(population, income, output, 8, 14, raw_from_zoom=13)
+    assert all(stats["built"] == stats["tiles"] > 0 for stats in first)
+
+    second = build_pyramid(population, income, output, 8, 14, raw_from_zoom=13)
+    assert all(stats["built"] == 0 and stats["unchanged"] == stats["tiles"] for stats in second)
+
+    population, income = write_census(tmp_path, [100] * 99 + [250])
+    third = build_pyramid(population, income, output, 8, 14, raw_from_zoom=13)
+    # one cell changed: a single tile per zoom (more only where the cell straddles tiles)
+    assert all(1 <= stats["built"] <= 4 for stats in third)
+
+    with sqlite3.connect(output) as connection:
+        assert dict(connection.execute("SELECT name, value FROM metadata"))["format"] == "pbf"
+        tiles = connection.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+    assert tiles == sum(stats["tiles"] for stats in third)
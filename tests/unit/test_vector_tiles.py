@@ -0,0 +1,197 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+import shapely
+from fastapi import HTTPException
+from shapely.geometry import Point, box
+
+import vector_tiles
+from vector_tiles import encode_tile, normalize_attributes, tile_bounds
+
+
+def read_varint(data, pos):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def read_message(data):
+    """Minimal protobuf reader: {field number: [values]} for varint and bytes fields."""
+    fields, pos = {}, 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos : pos + 8], pos + 8
+        else:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def read_packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def test_tile_bounds_of_world_tile():
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(0, 0, 0)
+    assert (min_lng, max_lng) == (-180.0, 180.0)
+    assert np.isclose(max_lat, 85.0511287798) and np.isclose(min_lat, -85.0511287798)
+
+
+def test_encode_tile_writes_layer_features_and_attributes():
+    z, x, y = 12, 2579, 1752
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    center = ((min_lng + max_lng) / 2, (min_lat + max_lat) / 2)
+    geometries = np.array(
+        [
+            box(center[0] - 0.01, center[1] - 0.01, center[0] + 0.01, center[1] + 0.01),
+            Point(center),
+        ],
+        dtype=object,
+    )
+    tile = encode_tile(
+        "population",
+        geometries,
+        [{"Population_Count": 120, "Main_ID": "a"}, {"Main_ID": "b", "income": None}],
+        z,
+        x,
+        y,
+    )
+
+    layer = read_message(read_message(tile)[3][0])
+    assert layer[1][0] == b"population"
+    assert layer[5][0] == 4096
+    assert [key.decode() for key in layer[3]] == ["Population_Count", "Main_ID"]
+
+    polygon, point = (read_message(feature) for feature in layer[2])
+    assert polygon[3][0] == 3 and point[3][0] == 1
+    polygon_commands = read_packed(polygon[4][0])
+    # MoveTo(1), LineTo(3), ClosePath for the square
+    assert polygon_commands[0] == (1 | 1 << 3)
+    assert polygon_commands[3] == (2 | 3 << 3)
+    assert polygon_commands[-1] == (7 | 1 << 3)
+    # None attributes are not written
+    assert len(read_packed(point[2][0])) == 2
+
+
+def test_encode_tile_clips_geometries_to_the_tile():
+    z, x, y = 14, 10318, 7009
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    far_away = shapely.box(min_lng + 1, min_lat + 1, max_lng + 1, max_lat + 1)
+    tile = encode_tile("layer", np.array([far_away], dtype=object), [{}], z, x, y)
+    layer = read_message(read_message(tile)[3][0])
+    assert 2 not in layer
+
+
+def test_normalize_attributes_bounds_the_tile_variants():
+    assert normalize_attributes("layer", None) is None
+    assert normalize_attributes("layer", ["b", "a", "b", ""]) == ["a", "b"]
+    # Intelligence layers only carry census columns
+    assert normalize_attributes("population", ["Main_ID", "name"]) == ["Main_ID"]
+
+    with pytest.raises(HTTPException):
+        normalize_attributes("layer", [f"field_{i}" for i in range(17)])
+    with pytest.raises(HTTPException):
+        normalize_attributes("layer", ["x" * 65])
+
+
+@pytest.mark.asyncio
+async def test_invalidate_layer_tiles_drops_tiles_built_before(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_tiles, "TILE_CACHE_DIR", str(tmp_path))
+    built_at = time.time() - 1
+    path = vector_tiles._tile_path("layer-1", 3, 1, 1, None)
+    os.makedirs(os.path.dirname(path))
+    open(path, "wb").close()
+    vector_tiles._dataset_layers["layer-1"] = object()
+    assert vector_tiles._is_fresh_dataset_version("layer-1", built_at)
+
+    await vector_tiles.invalidate_layer_tiles("layer-1")
+
+    assert not os.path.exists(path)
+    assert "layer-1" not in vector_tiles._dataset_layers
+    assert not vector_tiles._is_fresh_dataset_version("layer-1", built_at)
+    assert vector_tiles._is_fresh_dataset_version("layer-1", time.time() + 1)
+
+
+def test_prune_tile_cache_deletes_oldest_tiles_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_tiles, "TILE_CACHE_DIR", str(tmp_path))
+    paths = []
+    for i in range(4):
+        path = tmp_path / "layer" / f"{i}.mvt"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * 100)
+        (tmp_path / "layer" / f"{i}.mvt.version").write_text("1")
+        os.utime(path, (1000 + i, 1000 + i))
+        paths.append(path)
+
+    assert vector_tiles.prune_tile_cache(max_bytes=1000) == 0
+    assert vector_tiles.prune_tile_cache(max_bytes=250) == 2
+    assert [path.exists() for path in paths] == [False, False, True, True]
+    assert not (tmp_path / "layer" / "0.mvt.version").exists()
+
+
+@pytest.mark.asyncio
+async def test_producer_layer_tiles_are_only_served_to_their_owner(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_tiles, "TILE_CACHE_DIR", str(tmp_path))
+
+    async def load_layer_owner(layer_id):
+        return "owner"
+
+    monkeypatch.setattr(vector_tiles, "load_layer_owner", load_layer_owner)
+    with pytest.raises(HTTPException) as error:
+        await vector_tiles.get_vector_tile("layer-1", 3, 1, 1, "someone-else")
+    assert error.value.status_code == 403
+
+    path = vector_tiles._tile_path("layer-1", 3, 1, 1, None)
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(b"tile")
+    with open(path + ".version", "w") as f:
+        f.write(str(time.time()))
+    assert await vector_tiles.get_vector_tile("layer-1", 3, 1, 1, "owner") == b"tile"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_tile_requests_index_a_layer_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_tiles, "TILE_CACHE_DIR", str(tmp_path))
+    loads = []
+
+    async def fetch_dataset_id(layer_id):
+        return "dataset-1", {}
+
+    async def load_dataset(dataset_id, fetch_full_plan_datasets=False):
+        loads.append(dataset_id)
+        await asyncio.sleep(0.01)
+        return {
+            "features": [
+                {"geometry": {"type": "Point", "coordinates": [46.6, 24.7]}, "properties": {}}
+            ]
+        }
+
+    monkeypatch.setattr(vector_tiles, "fetch_dataset_id", fetch_dataset_id)
+    monkeypatch.setattr(vector_tiles, "load_dataset", load_dataset)
+    vector_tiles._dataset_layers.pop("layer-2", None)
+
+    layers = await asyncio.gather(
+        *(vector_tiles._get_dataset_layer("layer-2") for _ in range(10))
+    )
+    assert all(layer is layers[0] for layer in layers)
+    assert loads == ["dataset-1"]
+    assert len(layers[0].geometries) == 1
+    assert "layer-2" not in vector_tiles._dataset_layer_locks
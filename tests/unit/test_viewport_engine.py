@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+
+import numpy as np
+import pytest
+
+import viewport_engine
+from census_sidecar import build_sidecar
+from viewport_engine import INCOME_PATH, POPULATION_PATH, ViewportEngine
+
+
+def square(lng, lat, size=0.01):
+    return {
+        "type": "Polygon",
+        "coordinates": [
+            [[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]
+        ],
+    }
+
+
+def write_zoom(zoom_level, cells, incomes):
+    population_path = POPULATION_PATH.format(zoom_level=zoom_level)
+    income_path = INCOME_PATH.format(zoom_level=zoom_level)
+    os.makedirs(os.path.dirname(population_path), exist_ok=True)
+    os.makedirs(os.path.dirname(income_path), exist_ok=True)
+    with open(population_path, "w") as f:
+        json.dump(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "geometry": square(lng, lat),
+                        "properties": {"Main_ID": main_id, "Population_Count": 100},
+                    }
+                    for main_id, lng, lat in cells
+                ],
+            },
+            f,
+        )
+    with open(income_path, "w") as f:
+        json.dump(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "geometry": None, "properties": {"Main_ID": k, "income": v}}
+                    for k, v in incomes.items()
+                ],
+            },
+            f,
+        )
+
+
+@pytest.fixture
+def census_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ViewportEngine.zooms.clear()
+    yield tmp_path
+    ViewportEngine.zooms.clear()
+
+
+@pytest.mark.asyncio
+async def test_viewport_query_returns_overlapping_cells_in_file_order(census_dir):
+    write_zoom(14, [("c", 46.70, 24.70), ("a", 46.60, 24.60), ("b", 46.72, 24.70)], {"a": 10.0, "c": 30.0})
+
+    assert ViewportEngine.available_zoom_levels() == [14]
+    zoom_index, positions = await ViewportEngine.query(14, 46.69, 24.69, 46.75, 24.75)
+    assert [zoom_index.features[i]["properties"]["Main_ID"] for i in positions] == ["c", "b"]
+
+    census = zoom_index.census_rows(positions)
+    assert census["income"].tolist()[0] == 30.0
+    assert census["income"].isna().tolist() == [False, True]
+
+
+@pytest.mark.asyncio
+async def test_viewport_engine_reloads_changed_files(census_dir):
+    write_zoom(14, [("a", 46.60, 24.60)], {})
+    _, positions = await ViewportEngine.query(14, 46.0, 24.0, 47.0, 25.0)
+    assert len(positions) == 1
+
+    write_zoom(14, [("a", 46.60, 24.60), ("b", 46.70, 24.70)], {})
+    population_path = POPULATION_PATH.format(zoom_level=14)
+    stat = os.stat(population_path)
+    os.utime(population_path, (stat.st_atime, stat.st_mtime + 10))
+    _, positions = await ViewportEngine.query(14, 46.0, 24.0, 47.0, 25.0)
+    assert len(positions) == 2
+
+
+@pytest.mark.asyncio
+async def test_sidecar_serves_the_same_features(census_dir):
+    write_zoom(14, [("a", 46.60, 24.60), ("b", 46.70, 24.70)], {"b": 12.5})
+    zoom_index, positions = await ViewportEngine.query(14, 46.0, 24.0, 47.0, 25.0)
+    from_geojson = zoom_index.select_features(positions, income=True)
+
+    build_sidecar(14)
+    zoom_index, positions = await ViewportEngine.query(14, 46.0, 24.0, 47.0, 25.0)
+    assert zoom_index.sidecar is not None
+    assert isinstance(zoom_index.sidecar.bounds, np.memmap)
+    assert zoom_index.select_features(positions, income=True) == from_geojson
+    assert zoom_index.census_rows(positions)["income"].isna().tolist() == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_load_a_zoom_level_once(census_dir, monkeypatch):
+    write_zoom(14, [("a", 46.60, 24.60)], {})
+    reads = []
+    use_json = viewport_engine.use_json
+
+    async def counting_use_json(path, mode):
+        reads.append(path)
+        await asyncio.sleep(0.01)
+        return await use_json(path, mode)
+
+    monkeypatch.setattr(viewport_engine, "use_json", counting_use_json)
+    indexes = await asyncio.gather(*(ViewportEngine.get_zoom(14) for _ in range(5)))
+    assert all(index is indexes[0] for index in indexes)
+    # Population then income, once
+    assert len(reads) == 2
+
+
+@pytest.mark.asyncio
+async def test_preload_maps_only_zoom_levels_with_a_sidecar(census_dir):
+    write_zoom(13, [("a", 46.60, 24.60)], {})
+    write_zoom(14, [("a", 46.60, 24.60)], {})
+    build_sidecar(14)
+
+    await ViewportEngine.preload()
+    assert sorted(ViewportEngine.zooms) == [14]
+
+    await ViewportEngine.query(13, 46.0, 24.0, 47.0, 25.0)
+    assert sorted(ViewportEngine.zooms) == [13, 14]
+
+
+@pytest.mark.asyncio
+async def test_non_numeric_income_is_nan_in_both_backends(census_dir):
+    write_zoom(14, [("a", 46.60, 24.60), ("b", 46.70, 24.70)], {"a": "n/a", "b": "12.5"})
+    zoom_index, positions = await ViewportEngine.query(14, 46.0, 24.0, 47.0, 25.0)
+    from_geojson = zoom_index.census_rows(positions)["income"]
+
+    build_sidecar(14)
+    zoom_index, positions = await ViewportEngine.query(14, 46.0, 24.0, 47.0, 25.0)
+    assert zoom_index.sidecar is not None
+    from_sidecar = zoom_index.census_rows(positions)["income"]
+    assert from_sidecar.isna().tolist() == from_geojson.isna().tolist() == [True, False]
+    assert from_sidecar.tolist()[1] == from_geojson.tolist()[1] == 12.5
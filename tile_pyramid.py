@@ -0,0 +1,360 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from census_sidecar import INCOME_PATH, POPULATION_PATH
+from vector_tiles import EARTH_HALF_CIRCUMFERENCE, encode_tile, lnglat_to_mercator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = "Backend/tiles/census.mbtiles"
+# Aggregated zooms draw a grid of GRID_CELLS_PER_TILE x GRID_CELLS_PER_TILE cells per tile
+GRID_CELLS_PER_TILE = 64
+LAYER_NAME = "intelligence"
+
+
+@dataclass
+class CensusCells:
+    """
+    Raw census polygons flattened into arrays.
+    """
+
+    main_ids: np.ndarray
+    geometries: np.ndarray
+    population: np.ndarray
+    income: np.ndarray
+    centroids: np.ndarray  # web mercator meters
+    bounds: np.ndarray  # min_lng, min_lat, max_lng, max_lat
+
+
+def load_census_cells(population_path: str, income_path: Optional[str]) -> CensusCells:
+    """
+    Reads the raw population polygons and joins the income on Main_ID.
+    """
+    with open(population_path, "r") as f:
+        features = [
+            feature
+            for feature in json.load(f).get("features", [])
+            if feature.get("geometry", {}).get("type") == "Polygon"
+        ]
+    income_lookup = {}
+    if income_path and os.path.exists(income_path):
+        with open(income_path, "r") as f:
+            for feature in json.load(f).get("features", []):
+                income_lookup[feature["properties"]["Main_ID"]] = feature["properties"][
+                    "income"
+                ]
+
+    main_ids = np.array([str(f["properties"].get("Main_ID")) for f in features])
+    geometries = np.array([shape(f["geometry"]) for f in features], dtype=object)
+    population = np.array(
+        [f["properties"].get("Population_Count") or 0 for f in features], dtype=float
+    )
+    income = np.array(
+        [
+            np.nan
+            if income_lookup.get(f["properties"].get("Main_ID")) is None
+            else income_lookup[f["properties"].get("Main_ID")]
+            for f in features
+        ],
+        dtype=float,
+    )
+    lnglat_centroids = shapely.get_coordinates(shapely.centroid(geometries)).reshape(-1, 2)
+    return CensusCells(
+        main_ids=main_ids,
+        geometries=geometries,
+        population=population,
+        income=income,
+        centroids=lnglat_to_mercator(lnglat_centroids),
+        bounds=shapely.bounds(geometries).reshape(-1, 4),
+    )
+
+
+def _mercator_to_lnglat(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    lng = x / EARTH_HALF_CIRCUMFERENCE * 180.0
+    lat = np.degrees(2 * np.arctan(np.exp(y / EARTH_HALF_CIRCUMFERENCE * np.pi)) - np.pi / 2)
+    return lng, lat
+
+
+def _tile_size(z: int) -> float:
+    return 2 * EARTH_HALF_CIRCUMFERENCE / 2**z
+
+
+def aggregate_to_zoom(cells: CensusCells, z: int) -> dict:
+    """
+    Sums the population of the raw cells into a regular mercator grid of the zoom and averages
+    the income weighted by population. Returns arrays: keys, geometries, properties and the
+    tile (x, y) of every aggregated cell.
+    """
+    cell_size = _tile_size(z) / GRID_CELLS_PER_TILE
+    gx = np.floor((cells.centroids[:, 0] + EARTH_HALF_CIRCUMFERENCE) / cell_size).astype(np.int64)
+    gy = np.floor((EARTH_HALF_CIRCUMFERENCE - cells.centroids[:, 1]) / cell_size).astype(np.int64)
+    keys, inverse = np.unique(np.column_stack([gx, gy]), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    population = np.bincount(inverse, weights=cells.population, minlength=len(keys))
+    has_income = ~np.isnan(cells.income)
+    income_weight = np.where(has_income, np.maximum(cells.population, 1e-9), 0.0)
+    weighted_income = np.bincount(
+        inverse, weights=np.where(has_income, cells.income, 0.0) * income_weight, minlength=len(keys)
+    )
+    income_weights = np.bincount(inverse, weights=income_weight, minlength=len(keys))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        income = np.where(income_weights > 0, weighted_income / income_weights, np.nan)
+    counts = np.bincount(inverse, minlength=len(keys))
+
+    min_x = keys[:, 0] * cell_size - EARTH_HALF_CIRCUMFERENCE
+    max_y = EARTH_HALF_CIRCUMFERENCE - keys[:, 1] * cell_size
+    min_lng, max_lat = _mercator_to_lnglat(min_x, max_y)
+    max_lng, min_lat = _mercator_to_lnglat(min_x + cell_size, max_y - cell_size)
+
+    return {
+        "keys": [f"{z}/{kx}/{ky}" for kx, ky in keys],
+        "geometries": shapely.box(min_lng, min_lat, max_lng, max_lat),
+        "properties": [
+            {
+                "Population_Count": float(population[i]),
+                "income": None if np.isnan(income[i]) else float(income[i]),
+                "cells": int(counts[i]),
+            }
+            for i in range(len(keys))
+        ],
+        "tiles": keys // GRID_CELLS_PER_TILE,
+    }
+
+
+def raw_cells_for_zoom(cells: CensusCells, z: int) -> dict:
+    """
+    The raw polygons, listed once for every tile their bounds overlap.
+    """
+    size = _tile_size(z)
+    min_merc = lnglat_to_mercator(cells.bounds[:, [0, 1]])
+    max_merc = lnglat_to_mercator(cells.bounds[:, [2, 3]])
+    x0 = np.floor((min_merc[:, 0] + EARTH_HALF_CIRCUMFERENCE) / size).astype(np.int64)
+    x1 = np.floor((max_merc[:, 0] + EARTH_HALF_CIRCUMFERENCE) / size).astype(np.int64)
+    y0 = np.floor((EARTH_HALF_CIRCUMFERENCE - max_merc[:, 1]) / size).astype(np.int64)
+    y1 = np.floor((EARTH_HALF_CIRCUMFERENCE - min_merc[:, 1]) / size).astype(np.int64)
+
+    rows, tiles = [], []
+    for i in range(len(cells.main_ids)):
+        for tx in range(x0[i], x1[i] + 1):
+            for ty in range(y0[i], y1[i] + 1):
+                rows.append(i)
+                tiles.append((tx, ty))
+    rows = np.asarray(rows, dtype=np.int64)
+    return {
+        "keys": cells.main_ids[rows].tolist(),
+        "geometries": cells.geometries[rows],
+        "properties": [
+            {
+                "Main_ID": str(cells.main_ids[i]),
+                "Population_Count": float(cells.population[i]),
+                "income": None if np.isnan(cells.income[i]) else float(cells.income[i]),
+            }
+            for i in rows
+        ],
+        "tiles": np.asarray(tiles, dtype=np.int64).reshape(-1, 2),
+    }
+
+
+def _content_hash(keys: List[str], geometries: np.ndarray, properties: List[dict]) -> str:
+    digest = hashlib.sha256()
+    for key, geometry, props in zip(keys, geometries, properties):
+        digest.update(key.encode())
+        digest.update(shapely.to_wkb(geometry))
+        digest.update(json.dumps(props, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def open_mbtiles(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS tiles (
+            zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+            PRIMARY KEY (zoom_level, tile_column, tile_row)
+        );
+        CREATE TABLE IF NOT EXISTS tile_hashes (
+            zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, content_hash TEXT,
+            PRIMARY KEY (zoom_level, tile_column, tile_row)
+        );
+        """
+    )
+    return connection
+
+
+def build_zoom(connection: sqlite3.Connection, cells: CensusCells, z: int, raw_from_zoom: int) -> dict:
+    """
+    Writes the tiles of one zoom level. A tile is only encoded when the hash of its input
+    features differs from the one stored by the previous build; tiles that lost all their
+    features are removed.
+    """
+    source = raw_cells_for_zoom(cells, z) if z >= raw_from_zoom else aggregate_to_zoom(cells, z)
+    tiles = source["tiles"]
+    order = np.lexsort((tiles[:, 1], tiles[:, 0]))
+    tiles = tiles[order]
+    boundaries = np.flatnonzero(np.any(np.diff(tiles, axis=0) != 0, axis=1)) + 1
+    groups = np.split(order, boundaries) if len(order) else []
+
+    stored = {
+        (x, row): content_hash
+        for x, row, content_hash in connection.execute(
+            "SELECT tile_column, tile_row, content_hash FROM tile_hashes WHERE zoom_level = ?", (z,)
+        )
+    }
+    stats = {"zoom": z, "tiles": len(groups), "built": 0, "unchanged": 0, "removed": 0}
+    seen = set()
+    for group in groups:
+        x, y = (int(v) for v in source["tiles"][group[0]])
+        tms_row = 2**z - 1 - y
+        seen.add((x, tms_row))
+        keys = [source["keys"][i] for i in group]
+        geometries = source["geometries"][group]
+        properties = [source["properties"][i] for i in group]
+        content_hash = _content_hash(keys, geometries, properties)
+        if stored.get((x, tms_row)) == content_hash:
+            stats["unchanged"] += 1
+            continue
+
+        tile = gzip.compress(encode_tile(LAYER_NAME, geometries, properties, z, x, y))
+        connection.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, tms_row, tile)
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO tile_hashes VALUES (?, ?, ?, ?)", (z, x, tms_row, content_hash)
+        )
+        stats["built"] += 1
+
+    for x, tms_row in set(stored) - seen:
+        connection.execute(
+            "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (z, x, tms_row)
+        )
+        connection.execute(
+            "DELETE FROM tile_hashes WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (z, x, tms_row)
+        )
+        stats["removed"] += 1
+    connection.commit()
+    return stats
+
+
+def build_pyramid(
+    population_path: str,
+    income_path: Optional[str],
+    output: str,
+    min_zoom: int,
+    max_zoom: int,
+    raw_from_zoom: int,
+) -> List[dict]:
+    """
+    Builds (or incrementally updates) the census tile pyramid from min_zoom to max_zoom.
+    Zooms from raw_from_zoom up draw the source polygons, lower zooms draw aggregated grids.
+    Returns the per zoom build statistics.
+    """
+    started = time.perf_counter()
+    cells = load_census_cells(population_path, income_path)
+    logger.info(f"Loaded {len(cells.main_ids)} census cells in {time.perf_counter() - started:.2f}s")
+
+    connection = open_mbtiles(output)
+    all_stats = []
+    try:
+        for z in range(min_zoom, max_zoom + 1):
+            zoom_started = time.perf_counter()
+            stats = build_zoom(connection, cells, z, raw_from_zoom)
+            stats["seconds"] = round(time.perf_counter() - zoom_started, 3)
+            stats["bytes"] = connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles WHERE zoom_level = ?", (z,)
+            ).fetchone()[0]
+            logger.info(
+                f"zoom {z}: {stats['tiles']} tiles, {stats['built']} built, {stats['unchanged']} unchanged, "
+                f"{stats['removed']} removed, {stats['bytes'] / 1024:.1f} KiB in {stats['seconds']}s"
+            )
+            all_stats.append(stats)
+
+        lng = cells.bounds[:, [0, 2]] if len(cells.bounds) else np.zeros((1, 2))
+        lat = cells.bounds[:, [1, 3]] if len(cells.bounds) else np.zeros((1, 2))
+        metadata = {
+            "name": "census",
+            "format": "pbf",
+            "type": "overlay",
+            "minzoom": str(min_zoom),
+            "maxzoom": str(max_zoom),
+            "bounds": f"{lng.min()},{lat.min()},{lng.max()},{lat.max()}",
+            "json": json.dumps(
+                {
+                    "vector_layers": [
+                        {
+                            "id": LAYER_NAME,
+                            "fields": {
+                                "Main_ID": "String",
+                                "Population_Count": "Number",
+                                "income": "Number",
+                                "cells": "Number",
+                            },
+                        }
+                    ]
+                }
+            ),
+        }
+        connection.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", metadata.items())
+        connection.commit()
+    finally:
+        connection.close()
+    return all_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build an MBTiles census pyramid from population and income GeoJSON"
+    )
+    parser.add_argument("--source-zoom", type=int, default=14, help="zoom level of the v{zoom} input files")
+    parser.add_argument("--population", help="population GeoJSON, defaults to the source zoom file")
+    parser.add_argument("--income", help="income GeoJSON, defaults to the source zoom file")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--min-zoom", type=int, default=6)
+    parser.add_argument("--max-zoom", type=int, default=14)
+    parser.add_argument(
+        "--raw-from-zoom", type=int, default=None, help="first zoom drawing the source polygons, defaults to the source zoom"
+    )
+    parser.add_argument(
+        "--benchmark", action="store_true", help="print build time and output size per zoom as JSON"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    stats = build_pyramid(
+        args.population or POPULATION_PATH.format(zoom_level=args.source_zoom),
+        args.income or INCOME_PATH.format(zoom_level=args.source_zoom),
+        args.output,
+        args.min_zoom,
+        args.max_zoom,
+        args.raw_from_zoom if args.raw_from_zoom is not None else args.source_zoom,
+    )
+    if args.benchmark:
+        print(
+            json.dumps(
+                {
+                    "total_seconds": round(time.perf_counter() - started, 3),
+                    "output_bytes": os.path.getsize(args.output),
+                    "zooms": stats,
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
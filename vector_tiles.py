@@ -0,0 +1,572 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+from fastapi import HTTPException, status
+from shapely.geometry import shape
+
+from backend_common.compute_pool import run_in_compute_pool
+from storage import fetch_dataset_id, load_dataset, load_layer_owner
+from viewport_engine import ViewportEngine
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_DIR = "Backend/tile_cache"
+TILE_EXTENT = 4096
+# Tiles are clipped with a margin so strokes do not show seams at tile edges
+TILE_BUFFER = 64
+# Dataset layers can be refreshed, their cached tiles are rebuilt after this many seconds
+DATASET_TILE_TTL = 24 * 3600
+MAX_INDEXED_LAYERS = 16
+INTELLIGENCE_LAYERS = {
+    "population": ["Population_Count", "Main_ID"],
+    "income": ["income", "Main_ID"],
+    "intelligence": ["Population_Count", "income", "Main_ID"],
+}
+INTELLIGENCE_ATTRIBUTES = {name for names in INTELLIGENCE_LAYERS.values() for name in names}
+# Every attribute list is its own set of cached tiles, so they are bounded
+MAX_TILE_ATTRIBUTES = 16
+MAX_ATTRIBUTE_LENGTH = 64
+# The local tile store is pruned, oldest tiles first, past this size
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(2 * 1024**3)))
+TILE_CACHE_PRUNE_EVERY = 1000
+# Touched when a dataset layer changes, its tiles built before are stale
+INVALIDATION_MARKER = ".invalidated"
+EARTH_HALF_CIRCUMFERENCE = 20037508.342789244
+
+# ---------------------------------------------------------------------------
+# Tile math (spherical web mercator)
+# ---------------------------------------------------------------------------
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    Returns (min_lng, min_lat, max_lng, max_lat) of an XYZ tile.
+    """
+    n = 2**z
+
+    def lat(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def lnglat_to_mercator(coords: np.ndarray) -> np.ndarray:
+    lng = coords[:, 0]
+    lat = np.clip(coords[:, 1], -85.0511287798, 85.0511287798)
+    x = lng * EARTH_HALF_CIRCUMFERENCE / 180.0
+    y = np.log(np.tan((90.0 + lat) * np.pi / 360.0)) * EARTH_HALF_CIRCUMFERENCE / np.pi
+    return np.column_stack([x, y])
+
+
+def to_tile_pixels(
+    geometries: np.ndarray, z: int, x: int, y: int, extent: int = TILE_EXTENT
+) -> np.ndarray:
+    """
+    Transforms lng/lat geometries to the integer pixel grid of the tile (y pointing down),
+    clipped to the tile plus its buffer and simplified to one pixel.
+    """
+    tile_size = 2 * EARTH_HALF_CIRCUMFERENCE / 2**z
+    origin_x = -EARTH_HALF_CIRCUMFERENCE + x * tile_size
+    origin_y = EARTH_HALF_CIRCUMFERENCE - y * tile_size
+    scale = extent / tile_size
+
+    def transform(coords):
+        merc = lnglat_to_mercator(coords)
+        return np.column_stack(
+            [(merc[:, 0] - origin_x) * scale, (origin_y - merc[:, 1]) * scale]
+        )
+
+    pixels = shapely.transform(geometries, transform)
+    pixels = shapely.clip_by_rect(
+        pixels, -TILE_BUFFER, -TILE_BUFFER, extent + TILE_BUFFER, extent + TILE_BUFFER
+    )
+    # Per zoom simplification: anything under a pixel is invisible at this zoom
+    pixels = shapely.simplify(pixels, 1.0, preserve_topology=True)
+    return shapely.set_precision(pixels, 1.0)
+
+
+# ---------------------------------------------------------------------------
+# Mapbox Vector Tile (protobuf) encoding
+# ---------------------------------------------------------------------------
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _length_delimited(number: int, payload: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number: int, values: List[int]) -> bytes:
+    return _length_delimited(number, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, (int, np.integer)):
+        return _field(6, 0) + _varint(_zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _field(3, 1) + np.float64(value).tobytes()
+    return _length_delimited(1, str(value).encode("utf-8"))
+
+
+def _command(command_id: int, count: int) -> int:
+    return (command_id & 0x7) | (count << 3)
+
+
+class _GeometryWriter:
+    """
+    Writes the command stream of one feature; the cursor carries over between parts.
+    """
+
+    def __init__(self):
+        self.commands: List[int] = []
+        self.cursor = (0, 0)
+
+    def _moves(self, points: List[Tuple[int, int]]) -> List[int]:
+        params = []
+        for px, py in points:
+            params += [_zigzag(px - self.cursor[0]), _zigzag(py - self.cursor[1])]
+            self.cursor = (px, py)
+        return params
+
+    def points(self, points: List[Tuple[int, int]]):
+        self.commands += [_command(1, len(points))] + self._moves(points)
+
+    def line(self, points: List[Tuple[int, int]]):
+        if len(points) < 2:
+            return
+        self.commands += [_command(1, 1)] + self._moves(points[:1])
+        self.commands += [_command(2, len(points) - 1)] + self._moves(points[1:])
+
+    def ring(self, points: List[Tuple[int, int]]) -> bool:
+        if len(points) < 3:
+            return False
+        self.line(points)
+        self.commands.append(_command(7, 1))
+        return True
+
+
+def _dedupe(coords) -> List[Tuple[int, int]]:
+    points = []
+    for px, py in coords:
+        point = (int(px), int(py))
+        if not points or points[-1] != point:
+            points.append(point)
+    return points
+
+
+def _encode_geometry(geometry) -> Tuple[int, List[int]]:
+    """
+    Returns the MVT geometry type and command stream of a geometry in tile pixels.
+    Polygon exteriors are written with positive area and holes with negative area in the
+    y down tile grid, as the specification requires.
+    """
+    writer = _GeometryWriter()
+    geom_type = shapely.get_type_id(geometry)
+    parts = list(getattr(geometry, "geoms", [geometry]))
+
+    if geom_type in (0, 4):  # Point, MultiPoint
+        points = [_dedupe(part.coords)[0] for part in parts if not part.is_empty]
+        if not points:
+            return 0, []
+        writer.points(points)
+        return 1, writer.commands
+    if geom_type in (1, 5):  # LineString, MultiLineString
+        for part in parts:
+            writer.line(_dedupe(part.coords))
+        return 2, writer.commands
+    if geom_type in (3, 6):  # Polygon, MultiPolygon
+        for part in parts:
+            part = shapely.orient_polygons(part, exterior_cw=False)
+            # Holes of a polygon that collapsed below a pixel are dropped with it
+            if not writer.ring(_dedupe(part.exterior.coords)[:-1]):
+                continue
+            for interior in part.interiors:
+                writer.ring(_dedupe(interior.coords)[:-1])
+        return 3, writer.commands
+    return 0, []
+
+
+def encode_layer(
+    name: str,
+    geometries: np.ndarray,
+    properties: List[Dict[str, Any]],
+    extent: int = TILE_EXTENT,
+) -> bytes:
+    """
+    Encodes one MVT layer from geometries already in tile pixels and their properties.
+    Keys and values are interned once per layer.
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, Any], int] = {}
+    encoded_features = []
+    for feature_id, (geometry, props) in enumerate(zip(geometries, properties), 1):
+        if geometry is None or shapely.is_empty(geometry):
+            continue
+        geom_type, commands = _encode_geometry(geometry)
+        if not commands:
+            continue
+        tags = []
+        for key, value in props.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            if not isinstance(value, (str, bool, int, float, np.generic)):
+                value = json.dumps(value)
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        feature = _field(1, 0) + _varint(feature_id)
+        if tags:
+            feature += _packed(2, tags)
+        feature += _field(3, 0) + _varint(geom_type) + _packed(4, commands)
+        encoded_features.append(_length_delimited(2, feature))
+
+    layer = _field(15, 0) + _varint(2) + _length_delimited(1, name.encode("utf-8"))
+    layer += b"".join(encoded_features)
+    layer += b"".join(_length_delimited(3, key.encode("utf-8")) for key in keys)
+    layer += b"".join(
+        _length_delimited(4, _encode_value(value)) for _, value in values
+    )
+    layer += _field(5, 0) + _varint(extent)
+    return _length_delimited(3, layer)
+
+
+def encode_tile(
+    name: str,
+    geometries: np.ndarray,
+    properties: List[Dict[str, Any]],
+    z: int,
+    x: int,
+    y: int,
+) -> bytes:
+    """
+    Builds a single layer vector tile from lng/lat geometries.
+    """
+    if len(geometries) == 0:
+        return b""
+    return encode_layer(name, to_tile_pixels(geometries, z, x, y), properties)
+
+
+# ---------------------------------------------------------------------------
+# Layer sources and the local tile store
+# ---------------------------------------------------------------------------
+
+
+class _DatasetLayer:
+    def __init__(self, dataset: dict, loaded_at: float):
+        features = dataset.get("features", []) if dataset else []
+        self.geometries = np.array(
+            [shape(feature["geometry"]) for feature in features], dtype=object
+        )
+        self.properties = [feature.get("properties", {}) for feature in features]
+        self.tree = shapely.STRtree(self.geometries)
+        # Taken before the dataset was read, compared with the invalidation time
+        self.loaded_at = loaded_at
+
+
+# Recently used dataset layers with their spatial index, bounded to MAX_INDEXED_LAYERS
+_dataset_layers: "OrderedDict[str, _DatasetLayer]" = OrderedDict()
+# Concurrent tile requests of a layer being indexed wait for that single load
+_dataset_layer_locks: Dict[str, asyncio.Lock] = {}
+_tiles_written = 0
+
+
+def _layer_dir(layer: str) -> str:
+    safe_layer = "".join(c if c.isalnum() or c in "-_" else "_" for c in layer)
+    return os.path.join(TILE_CACHE_DIR, safe_layer)
+
+
+def _invalidated_at(layer: str) -> float:
+    try:
+        return os.path.getmtime(os.path.join(_layer_dir(layer), INVALIDATION_MARKER))
+    except OSError:
+        return 0.0
+
+
+def _is_fresh_dataset_version(layer: str, loaded_at: float) -> bool:
+    return (
+        time.time() - loaded_at < DATASET_TILE_TTL and loaded_at > _invalidated_at(layer)
+    )
+
+
+def _remove_layer_tiles(layer_id: str):
+    layer_dir = _layer_dir(layer_id)
+    shutil.rmtree(layer_dir, ignore_errors=True)
+    os.makedirs(layer_dir, exist_ok=True)
+    with open(os.path.join(layer_dir, INVALIDATION_MARKER), "w") as f:
+        f.write(str(time.time()))
+
+
+async def invalidate_layer_tiles(layer_id: str):
+    """
+    Drops the cached tiles and spatial index of a dataset layer after it was saved again
+    or deleted. The marker left in its tile directory tells the other workers sharing
+    the tile store to drop their copy of the layer too.
+    """
+    _dataset_layers.pop(layer_id, None)
+    await asyncio.get_running_loop().run_in_executor(None, _remove_layer_tiles, layer_id)
+
+
+def prune_tile_cache(max_bytes: int = TILE_CACHE_MAX_BYTES) -> int:
+    """
+    Deletes the least recently written tiles until the store is back under 90% of
+    `max_bytes`. Returns the number of tiles deleted.
+    """
+    tiles = []
+    total = 0
+    for root, _, files in os.walk(TILE_CACHE_DIR):
+        for name in files:
+            if not name.endswith(".mvt"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            tiles.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    deleted = 0
+    for _, size, path in sorted(tiles):
+        if total <= max_bytes * 0.9:
+            break
+        for stale in (path, path + ".version"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+        total -= size
+        deleted += 1
+    logger.info(f"Pruned {deleted} tiles from {TILE_CACHE_DIR}")
+    return deleted
+
+
+def _indexed_dataset_layer(layer_id: str) -> Optional[_DatasetLayer]:
+    layer = _dataset_layers.get(layer_id)
+    if layer is not None and _is_fresh_dataset_version(layer_id, layer.loaded_at):
+        _dataset_layers.move_to_end(layer_id)
+        return layer
+    return None
+
+
+async def _get_dataset_layer(layer_id: str) -> _DatasetLayer:
+    layer = _indexed_dataset_layer(layer_id)
+    if layer is not None:
+        return layer
+
+    lock = _dataset_layer_locks.setdefault(layer_id, asyncio.Lock())
+    try:
+        async with lock:
+            # Indexed by the request holding the lock meanwhile
+            layer = _indexed_dataset_layer(layer_id)
+            if layer is not None:
+                return layer
+            return await _load_dataset_layer(layer_id)
+    finally:
+        if not lock.locked() and _dataset_layer_locks.get(layer_id) is lock:
+            del _dataset_layer_locks[layer_id]
+
+
+async def _load_dataset_layer(layer_id: str) -> _DatasetLayer:
+    loaded_at = time.time()
+    match = await fetch_dataset_id(layer_id)
+    if not match:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found for this layer",
+        )
+    dataset_id, _ = match
+    dataset = await load_dataset(dataset_id, fetch_full_plan_datasets=True)
+    # Parsing the geometries and building the STRtree would block the event loop
+    layer = await asyncio.get_running_loop().run_in_executor(
+        None, _DatasetLayer, dataset, loaded_at
+    )
+    _dataset_layers[layer_id] = layer
+    _dataset_layers.move_to_end(layer_id)
+    while len(_dataset_layers) > MAX_INDEXED_LAYERS:
+        _dataset_layers.popitem(last=False)
+    return layer
+
+
+def census_zoom_for_tile(z: int) -> int:
+    """
+    Census grid to draw at a tile zoom: the finest available grid not finer than the tile.
+    """
+    zoom_levels = ViewportEngine.available_zoom_levels() or sorted(ViewportEngine.zooms)
+    if not zoom_levels:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No census data available"
+        )
+    coarser = [level for level in zoom_levels if level <= z]
+    return coarser[-1] if coarser else zoom_levels[0]
+
+
+def normalize_attributes(
+    layer: str, attributes: Optional[List[str]]
+) -> Optional[List[str]]:
+    """
+    Sorted distinct attribute names, limited to the census columns on intelligence
+    layers. Lists longer than MAX_TILE_ATTRIBUTES or with overlong names are rejected.
+    """
+    if attributes is None:
+        return None
+    attributes = sorted({name for name in attributes if name})
+    if len(attributes) > MAX_TILE_ATTRIBUTES or any(
+        len(name) > MAX_ATTRIBUTE_LENGTH for name in attributes
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_TILE_ATTRIBUTES} fields of up to {MAX_ATTRIBUTE_LENGTH} characters",
+        )
+    if layer in INTELLIGENCE_LAYERS:
+        attributes = [name for name in attributes if name in INTELLIGENCE_ATTRIBUTES]
+    return attributes
+
+
+def _select_attributes(props: dict, attributes: Optional[List[str]]) -> dict:
+    if attributes is None:
+        return props
+    return {name: props[name] for name in attributes if name in props}
+
+
+async def _build_tile(
+    layer: str, z: int, x: int, y: int, attributes: Optional[List[str]]
+) -> Tuple[bytes, str]:
+    """
+    Returns the tile bytes and the version of the source data it was built from.
+    """
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+
+    if layer in INTELLIGENCE_LAYERS:
+        census_zoom = census_zoom_for_tile(z)
+        zoom_index, positions = await ViewportEngine.query(
+            census_zoom, min_lng, min_lat, max_lng, max_lat
+        )
+        rows = zoom_index.census_rows(positions)
+        columns = [
+            name
+            for name in (attributes or INTELLIGENCE_LAYERS[layer])
+            if name in rows.columns and name != "geometry"
+        ]
+        properties = rows[columns].to_dict("records")
+        version = f"{census_zoom}:{zoom_index.mtimes}"
+        tile = await run_in_compute_pool(
+            encode_tile, layer, rows.geometry.values, properties, z, x, y
+        )
+        return tile, version
+
+    dataset_layer = await _get_dataset_layer(layer)
+    hits = np.sort(
+        dataset_layer.tree.query(shapely.box(min_lng, min_lat, max_lng, max_lat))
+    )
+    properties = [
+        _select_attributes(dataset_layer.properties[i], attributes) for i in hits
+    ]
+    version = str(dataset_layer.loaded_at)
+    tile = await run_in_compute_pool(
+        encode_tile, layer, dataset_layer.geometries[hits], properties, z, x, y
+    )
+    return tile, version
+
+
+def _tile_path(layer: str, z: int, x: int, y: int, attributes: Optional[List[str]]) -> str:
+    variant = (
+        hashlib.sha1(",".join(attributes).encode()).hexdigest()[:10]
+        if attributes is not None
+        else "all"
+    )
+    return os.path.join(_layer_dir(layer), variant, str(z), str(x), f"{y}.mvt")
+
+
+async def get_vector_tile(
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    user_id: str,
+    attributes: Optional[List[str]] = None,
+) -> bytes:
+    """
+    Returns the Mapbox Vector Tile of a layer, from the local tile store when it is still valid.
+    `layer` is one of the intelligence layers (population, income, intelligence) or a
+    producer layer id, which only its owner `user_id` may read. `attributes` limits the
+    properties written to the tile.
+    """
+    global _tiles_written
+    if z < 0 or not (0 <= x < 2**z and 0 <= y < 2**z):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Tile out of range"
+        )
+    if layer not in INTELLIGENCE_LAYERS and await load_layer_owner(layer) != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to read this layer",
+        )
+
+    attributes = normalize_attributes(layer, attributes)
+    path = _tile_path(layer, z, x, y, attributes)
+    version_path = path + ".version"
+
+    if os.path.exists(path) and os.path.exists(version_path):
+        if layer in INTELLIGENCE_LAYERS:
+            # Census tiles stay valid until the census files of their zoom change
+            census_zoom = census_zoom_for_tile(z)
+            census_index = await ViewportEngine.get_zoom(census_zoom)
+            with open(version_path, "r") as f:
+                fresh = f.read() == f"{census_zoom}:{census_index.mtimes}"
+        else:
+            with open(version_path, "r") as f:
+                version = f.read()
+            try:
+                fresh = _is_fresh_dataset_version(layer, float(version))
+            except ValueError:
+                fresh = False
+        if fresh:
+            with open(path, "rb") as f:
+                return f.read()
+
+    tile, version = await _build_tile(layer, z, x, y, attributes)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so concurrent readers never see a partial tile
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tile)
+    os.replace(tmp_path, path)
+    with open(version_path, "w") as f:
+        f.write(version)
+
+    _tiles_written += 1
+    if _tiles_written % TILE_CACHE_PRUNE_EVERY == 0:
+        await asyncio.get_running_loop().run_in_executor(None, prune_tile_cache)
+    return tile
@@ -0,0 +1,280 @@
+import asyncio
+import glob
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from fastapi import HTTPException, status
+
+from backend_common.logging_wrapper import apply_decorator_to_module
+from census_sidecar import (
+    INCOME_PATH,
+    POPULATION_PATH,
+    CensusSidecar,
+    load_sidecar,
+    sidecar_mtime,
+)
+from use_json import use_json
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ZoomIndex:
+    """
+    One zoom level of the census grid, backed either by the parsed GeoJSON (`features` and
+    `income_lookup`) or by the memory-mapped columnar sidecar.
+    """
+
+    tree: shapely.STRtree
+    mtimes: tuple
+    features: Optional[List[dict]] = None
+    income_lookup: Dict[str, float] = field(default_factory=dict)
+    sidecar: Optional[CensusSidecar] = None
+    census_frame: Optional[gpd.GeoDataFrame] = None
+
+    def select_features(self, positions: np.ndarray, income: bool = False) -> List[dict]:
+        """
+        GeoJSON features at the given positions, with the `income` property added if asked.
+        Features are copied when income is added so the shared index is never modified.
+        """
+        if self.sidecar is not None:
+            features = self.sidecar.features(positions)
+            if income:
+                for feature, value in zip(features, self.sidecar.income[positions]):
+                    feature["properties"]["income"] = (
+                        None if np.isnan(value) else float(value)
+                    )
+            return features
+
+        features = [self.features[i] for i in positions]
+        if income:
+            features = [
+                {
+                    **feature,
+                    "properties": {
+                        **feature["properties"],
+                        "income": self.income_lookup.get(
+                            feature["properties"]["Main_ID"]
+                        ),
+                    },
+                }
+                for feature in features
+            ]
+        return features
+
+    def census_rows(self, positions: np.ndarray) -> gpd.GeoDataFrame:
+        """
+        Population polygons at the given positions as a GeoDataFrame with the `income` column
+        joined on Main_ID, in the order of `positions`.
+        """
+        if self.sidecar is not None:
+            features = self.sidecar.features(positions)
+            census = (
+                gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+                if features
+                else gpd.GeoDataFrame(
+                    {"Main_ID": []}, geometry=gpd.GeoSeries([], crs="EPSG:4326")
+                )
+            )
+            census["income"] = np.asarray(self.sidecar.income[positions], dtype=float)
+            return census
+
+        # The parsed GeoJSON is converted once and kept with the zoom level
+        if self.census_frame is None:
+            census = (
+                gpd.GeoDataFrame.from_features(self.features, crs="EPSG:4326")
+                if self.features
+                else gpd.GeoDataFrame(
+                    {"Main_ID": []}, geometry=gpd.GeoSeries([], crs="EPSG:4326")
+                )
+            )
+            census["income"] = pd.to_numeric(
+                census["Main_ID"].map(self.income_lookup), errors="coerce"
+            ).astype(float)
+            self.census_frame = census
+        return self.census_frame.iloc[positions].reset_index(drop=True)
+
+
+class ViewportEngine:
+    """
+    Process wide index of the census grids, one entry per zoom level.
+    Every zoom level is read once (at startup or on first use) and its polygon bounds are packed
+    into an STRtree, so a viewport query costs O(log n + k) instead of a scan of the whole file.
+    A zoom level is reloaded when its population or income file changes on disk.
+    Concurrent requests for a zoom level being loaded wait for that single load.
+    """
+
+    zooms: Dict[int, ZoomIndex] = {}
+    _locks: Dict[int, asyncio.Lock] = {}
+
+    @classmethod
+    def available_zoom_levels(cls) -> List[int]:
+        """
+        Zoom levels that have a population grid on disk.
+        """
+        zoom_levels = []
+        for path in glob.glob(POPULATION_PATH.replace("v{zoom_level}", "v*")):
+            match = re.search(r"v(\d+)", os.path.basename(os.path.dirname(path)))
+            if match:
+                zoom_levels.append(int(match.group(1)))
+        return sorted(zoom_levels)
+
+    @classmethod
+    async def preload(cls, zoom_levels: Optional[List[int]] = None):
+        """
+        Loads the given zoom levels. By default only the zoom levels with a fresh sidecar
+        are mapped, the ones that would be parsed from GeoJSON are loaded on first use.
+        """
+        if zoom_levels is None:
+            zoom_levels = [
+                zoom_level
+                for zoom_level in cls.available_zoom_levels()
+                if load_sidecar(zoom_level) is not None
+            ]
+        for zoom_level in zoom_levels:
+            await cls.get_zoom(zoom_level)
+        logger.info(f"Viewport engine preloaded zoom levels {sorted(cls.zooms)}")
+
+    @classmethod
+    async def reload(cls, zoom_level: Optional[int] = None):
+        """
+        Drops one zoom level (or all of them) and loads it again from disk.
+        """
+        zoom_levels = [zoom_level] if zoom_level is not None else list(cls.zooms)
+        for level in zoom_levels:
+            cls.zooms.pop(level, None)
+            await cls.get_zoom(level)
+
+    @classmethod
+    async def get_zoom(cls, zoom_level: int) -> ZoomIndex:
+        """
+        Returns the index of a zoom level, loading it if missing or if its files changed.
+        """
+        mtimes = cls._mtimes(zoom_level)
+        index = cls.zooms.get(zoom_level)
+        if index is not None and index.mtimes == mtimes:
+            return index
+
+        lock = cls._locks.setdefault(zoom_level, asyncio.Lock())
+        async with lock:
+            # Loaded by the request holding the lock meanwhile
+            mtimes = cls._mtimes(zoom_level)
+            index = cls.zooms.get(zoom_level)
+            if index is not None and index.mtimes == mtimes:
+                return index
+            return await cls._load_zoom(zoom_level, mtimes)
+
+    # Kept in the class: apply_decorator_to_module logs every module function call with
+    # the repr of its arguments, far too costly on these paths
+    @staticmethod
+    def _file_mtime(path: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    @classmethod
+    def _mtimes(cls, zoom_level: int) -> tuple:
+        return (
+            cls._file_mtime(POPULATION_PATH.format(zoom_level=zoom_level)),
+            cls._file_mtime(INCOME_PATH.format(zoom_level=zoom_level)),
+            sidecar_mtime(zoom_level),
+        )
+
+    @staticmethod
+    def _feature_bounds(features: List[dict]) -> np.ndarray:
+        """
+        (n, 4) array of min_lng, min_lat, max_lng, max_lat over all rings of each polygon.
+        """
+        bounds = np.empty((len(features), 4), dtype=float)
+        for i, feature in enumerate(features):
+            points = np.asarray(
+                [point for ring in feature["geometry"]["coordinates"] for point in ring],
+                dtype=float,
+            )
+            bounds[i, :2] = points[:, :2].min(axis=0)
+            bounds[i, 2:] = points[:, :2].max(axis=0)
+        return bounds
+
+    @classmethod
+    async def _load_zoom(cls, zoom_level: int, mtimes: tuple) -> ZoomIndex:
+        # A fresh sidecar is memory mapped, nothing is parsed
+        sidecar = load_sidecar(zoom_level)
+        if sidecar is not None:
+            bounds = sidecar.bounds
+            index = ZoomIndex(tree=cls._bounds_tree(bounds), mtimes=mtimes, sidecar=sidecar)
+            cls.zooms[zoom_level] = index
+            logger.info(
+                f"Viewport engine mapped zoom level {zoom_level} sidecar: {sidecar.rows} polygons"
+            )
+            return index
+
+        population_data = await use_json(
+            POPULATION_PATH.format(zoom_level=zoom_level), "r"
+        )
+        if population_data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No census data for zoom level {zoom_level}",
+            )
+        # Only polygons take part in viewport queries
+        features = [
+            feature
+            for feature in population_data.get("features", [])
+            if feature.get("geometry", {}).get("type") == "Polygon"
+        ]
+
+        income_data = await use_json(INCOME_PATH.format(zoom_level=zoom_level), "r")
+        income_lookup = {}
+        for feature in (income_data or {}).get("features", []):
+            income_lookup[feature["properties"]["Main_ID"]] = feature["properties"][
+                "income"
+            ]
+
+        index = ZoomIndex(
+            tree=cls._bounds_tree(cls._feature_bounds(features)),
+            mtimes=mtimes,
+            features=features,
+            income_lookup=income_lookup,
+        )
+        cls.zooms[zoom_level] = index
+        logger.info(
+            f"Viewport engine loaded zoom level {zoom_level}: {len(features)} polygons, {len(income_lookup)} income records"
+        )
+        return index
+
+    @staticmethod
+    def _bounds_tree(bounds: np.ndarray) -> shapely.STRtree:
+        return shapely.STRtree(
+            shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+        )
+
+    @classmethod
+    async def query(
+        cls,
+        zoom_level: int,
+        min_lng: float,
+        min_lat: float,
+        max_lng: float,
+        max_lat: float,
+    ) -> Tuple[ZoomIndex, np.ndarray]:
+        """
+        Returns the index of the zoom level and the positions, in file order, of its polygons
+        whose bounding box overlaps the viewport.
+        """
+        index = await cls.get_zoom(zoom_level)
+        # Without a predicate the tree only compares bounding boxes, touching edges included
+        positions = np.sort(
+            index.tree.query(shapely.box(min_lng, min_lat, max_lng, max_lat))
+        )
+        return index, positions
+
+
+apply_decorator_to_module(logger)(__name__)